@@ -12,10 +12,18 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # stdlib
-from uuid import uuid4
+import os
+
+# gevent, if selected as the HTTP transport, needs to patch the standard library before anything else imports it,
+# see zato.apitest.transport.
+if os.environ.get('APITEST_TRANSPORT') == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+from uuid import uuid4 # noqa
 
 # setuptools
-from pkg_resources import get_distribution
+from pkg_resources import get_distribution # noqa
 
 version = get_distribution('zato-apitest').version
 
@@ -24,3 +32,8 @@ NO_VALUE = 'no-value-{}'.format(uuid4().hex)
 
 class AUTH:
     BASIC_AUTH = 'basic-auth'
+
+class PathNotFound(ValueError):
+    """ Raised if an XPath expression points to nothing in a response - steps retried within a deadline retry it
+    the way they do failed assertions, the response may yet have the path.
+    """
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import sys
+
+# Zato
+from zato.apitest.load import DEFAULT_OPEN_CONCURRENCY, get_replay, OpenLoad
+
+# ################################################################################################################################
+
+# Search stops once the gap between the highest passing and the lowest failing rate is smaller than this, relatively.
+DEFAULT_PRECISION = 0.05
+
+# ################################################################################################################################
+
+class SLO(object):
+    """ A service level objective - latency at a percentile and error rate, both must be strictly lower than the limits.
+    Since latencies of open-model runs include start lag, a rate the generator or server cannot keep up with breaks it too.
+    """
+    def __init__(self, latency, percentile=99, error_rate=None):
+        self.latency = latency
+        self.percentile = percentile
+        self.error_rate = error_rate
+
+    def __str__(self):
+        out = 'p{:g} < {:g} ms'.format(self.percentile, self.latency)
+        if self.error_rate is not None:
+            out += ', error rate < {:g}%'.format(self.error_rate)
+        return out
+
+    def check(self, result):
+        """ Returns a list of reasons why a load run's result does not meet the objective, an empty one if it does.
+        """
+        violations = []
+
+        latency = result.histogram.percentile(self.percentile) * 1000
+        if latency >= self.latency:
+            violations.append('p{:g} {:.2f} ms'.format(self.percentile, latency))
+
+        if self.error_rate is not None and result.error_rate * 100 >= self.error_rate:
+            violations.append('error rate {:.2f}%'.format(result.error_rate * 100))
+
+        return violations
+
+# ################################################################################################################################
+
+class CapacitySearch(object):
+    """ Finds the highest arrival rate at which an SLO still holds. The rate is doubled, starting from start_rate,
+    until the SLO breaks or max_rate is reached, and then the range between the last passing and the first failing rate
+    is binary-searched. Each step is a separate open-model load run lasting step_duration seconds.
+    """
+    def __init__(self, run_step, slo, start_rate, max_rate=None, precision=DEFAULT_PRECISION, stream=None):
+        self.run_step = run_step
+        self.slo = slo
+        self.start_rate = start_rate
+        self.max_rate = max_rate
+        self.precision = precision
+        self.stream = stream or sys.stdout
+        self.steps = []
+
+    def check(self, rate):
+        result = self.run_step(rate)
+        violations = self.slo.check(result)
+        self.steps.append((rate, result, violations))
+
+        self.stream.write('{:>10.2f}/s  {:>10.2f}/s  {:>10.2f}  {:>10.2f}  {:>7.2f}%  {}\n'.format(
+            rate, result.throughput, result.histogram.percentile(50) * 1000,
+            result.histogram.percentile(self.slo.percentile) * 1000, result.error_rate * 100,
+            'FAIL: ' + ', '.join(violations) if violations else 'OK'))
+        self.stream.flush()
+
+        return not violations
+
+    def run(self):
+        """ Returns the highest sustainable rate found, or None if the SLO does not hold even at start_rate.
+        """
+        self.stream.write('SLO: {}\n'.format(self.slo))
+        self.stream.write('{:>12}  {:>12}  {:>10}  {:>10}  {:>8}  {}\n'.format(
+            'Rate', 'Throughput', 'p50 ms', 'p{:g} ms'.format(self.slo.percentile), 'Errors', 'Verdict'))
+
+        passed, failed = None, None
+        rate = self.start_rate
+
+        # Step up
+        while True:
+            if self.max_rate and rate >= self.max_rate:
+                rate = self.max_rate
+
+            if self.check(rate):
+                passed = rate
+                if self.max_rate and rate >= self.max_rate:
+                    break
+                rate *= 2
+            else:
+                failed = rate
+                break
+
+        # Binary search between the last passing and the first failing rate
+        if passed is not None and failed is not None:
+            while (failed - passed) / passed > self.precision:
+                rate = (passed + failed) / 2
+                if self.check(rate):
+                    passed = rate
+                else:
+                    failed = rate
+
+        if passed is None:
+            self.stream.write('SLO does not hold even at {}/s\n'.format(self.start_rate))
+        elif failed is None:
+            self.stream.write('SLO holds up to the maximum rate of {}/s\n'.format(passed))
+        else:
+            self.stream.write('Highest sustainable rate: {:.2f}/s (SLO breaks at {:.2f}/s)\n'.format(passed, failed))
+
+        return passed
+
+# ################################################################################################################################
+
+def handle(path, name, slo, start_rate, max_rate=None, step_duration=10.0, concurrency=None, precision=DEFAULT_PRECISION,
+        args=None, is_mix=False):
+    """ Searches for the highest rate a scenario, or a workload mix, can be run at without breaking an SLO.
+    """
+    replay = get_replay(path, name, args, is_mix)
+    concurrency = concurrency or DEFAULT_OPEN_CONCURRENCY
+
+    def run_step(rate):
+        return OpenLoad(replay, rate, concurrency, step_duration).run()
+
+    sys.stdout.write('Scenario: {}\n'.format(replay.location))
+    return CapacitySearch(run_step, slo, start_rate, max_rate, precision).run()
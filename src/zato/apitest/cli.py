@@ -12,13 +12,14 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # stdlib
-import os, sys, tempfile, uuid
+import os, socket, sys, tempfile, uuid
 
 # Click
 import click
 
 # Zato
-from zato.apitest import init as _init, run as _run
+from zato.apitest import capacity as _capacity, distributed as _distributed, init as _init, load as _load, run as _run, \
+    transport as _transport
 
 @click.group()
 def main():
@@ -40,6 +41,24 @@ def cli_init(ctx, path, prompt_run=True):
     if prompt_run:
         click.echo('Run `apitest run {}` for a live demo.'.format(path))
 
+def validate_shard(ctx, param, value):
+    if value is None:
+        return value
+
+    try:
+        return _run.parse_shard(value)
+    except ValueError as e:
+        raise click.BadParameter(e.args[0])
+
+def validate_address(ctx, param, value):
+    if value is None:
+        return value
+
+    try:
+        return _distributed.parse_address(value)
+    except ValueError as e:
+        raise click.BadParameter(e.args[0])
+
 @click.command()
 @click.argument('path', type=click.Path(exists=False, file_okay=False, resolve_path=True))
 @click.pass_context
@@ -48,9 +67,119 @@ def init(ctx, path):
 
 @click.command(context_settings=dict(allow_extra_args=True, ignore_unknown_options=True))
 @click.argument('path', type=click.Path(exists=True, file_okay=False, resolve_path=True))
+@click.option('--workers', default=1, type=click.IntRange(1),
+    help='Number of processes to run features in, their durations are kept in features/timings.sqlite to schedule them with')
+@click.option('--shard', default=None, callback=validate_shard, help='Run only a subset of scenarios, e.g. 3/8')
+@click.option('--result-file', default=None, type=click.Path(dir_okay=False, resolve_path=True),
+    help='Where to write a JSON file with results of the run')
+@click.pass_context
+def run(ctx, path, workers, shard, result_file):
+    if shard and not result_file:
+        result_file = os.path.join(path, 'apitest-result-{}-of-{}.json'.format(*shard))
+
+    try:
+        _transport.select_transport(_transport.get_transport(path))
+    except ValueError as e:
+        click.echo('Error: {}'.format(e.args[0]))
+        sys.exit(1)
+
+    failed = _run.handle(path, ctx.args, workers, shard, result_file)
+    sys.exit(1 if failed else 0)
+
+@click.command(name='merge-results')
+@click.argument('result_files', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False, resolve_path=True))
+@click.option('--output', default=None, type=click.Path(dir_okay=False, resolve_path=True),
+    help='Where to write the merged JSON file')
 @click.pass_context
-def run(ctx, path):
-    _run.handle(path, ctx.args)
+def merge_results(ctx, result_files, output):
+    failed = _run.handle_merge_results(result_files, output)
+    sys.exit(1 if failed else 0)
+
+@click.command(context_settings=dict(allow_extra_args=True, ignore_unknown_options=True))
+@click.argument('path', type=click.Path(exists=True, file_okay=False, resolve_path=True))
+@click.option('--scenario', default=None, help='Scenario to replay, either its name or path/to/file.feature:name')
+@click.option('--mix', 'is_mix', is_flag=True, default=False, help='Replay the workload mix from [load] in config.ini')
+@click.option('--concurrency', default=None, type=click.IntRange(1),
+    help='Number of concurrent workers, in the open model - how many iterations may be in flight at once')
+@click.option('--rate', default=None, type=float,
+    help='Iterations per second - a limit in the closed model and the arrival rate in the open one')
+@click.option('--open', 'is_open', is_flag=True, default=False,
+    help='Start iterations at a constant rate regardless of how long previous ones take')
+@click.option('--duration', default=None, type=float, help='How long to run for, in seconds')
+@click.option('--iterations', default=None, type=click.IntRange(1), help='How many iterations to run')
+@click.option('--listen', default=None, callback=validate_address,
+    help='Coordinate workers connecting to host:port instead of generating load locally')
+@click.option('--workers', default=1, type=click.IntRange(1), help='Number of workers to wait for with --listen')
+@click.pass_context
+def load(ctx, path, scenario, is_mix, concurrency, rate, is_open, duration, iterations, listen, workers):
+    if duration is None and iterations is None:
+        duration = 10.0
+
+    try:
+        _transport.select_transport(_transport.get_transport(path))
+
+        if listen:
+            _distributed.handle(
+                path, listen, workers, scenario, concurrency, rate, duration, iterations, ctx.args, is_open, is_mix)
+        else:
+            _load.handle(path, scenario, concurrency, rate, duration, iterations, ctx.args, is_open, is_mix)
+    except ValueError as e:
+        click.echo('Error: {}'.format(e.args[0]))
+        sys.exit(1)
+
+@click.command(context_settings=dict(allow_extra_args=True, ignore_unknown_options=True))
+@click.argument('path', type=click.Path(exists=True, file_okay=False, resolve_path=True))
+@click.option('--scenario', default=None, help='Scenario to replay, either its name or path/to/file.feature:name')
+@click.option('--mix', 'is_mix', is_flag=True, default=False, help='Replay the workload mix from [load] in config.ini')
+@click.option('--latency', default=250.0, type=float, help='SLO latency, in milliseconds')
+@click.option('--percentile', default=99.0, type=float, help='Percentile the SLO latency applies to')
+@click.option('--error-rate', default=0.1, type=float, help='SLO error rate, in percent')
+@click.option('--start-rate', default=1.0, type=float, help='Iterations per second to start the search from')
+@click.option('--max-rate', default=None, type=float, help='Iterations per second not to go beyond')
+@click.option('--step-duration', default=10.0, type=float, help='How long to run each step of the search for, in seconds')
+@click.option('--concurrency', default=None, type=click.IntRange(1), help='How many iterations may be in flight at once')
+@click.option('--precision', default=_capacity.DEFAULT_PRECISION, type=float,
+    help='Stop once the highest passing and the lowest failing rate are this close, relatively')
+@click.pass_context
+def capacity(ctx, path, scenario, is_mix, latency, percentile, error_rate, start_rate, max_rate, step_duration, concurrency,
+        precision):
+    if start_rate <= 0 or precision <= 0:
+        click.echo('Error: --start-rate and --precision must be greater than zero')
+        sys.exit(1)
+
+    slo = _capacity.SLO(latency, percentile, error_rate)
+
+    try:
+        _transport.select_transport(_transport.get_transport(path))
+        rate = _capacity.handle(
+            path, scenario, slo, start_rate, max_rate, step_duration, concurrency, precision, ctx.args, is_mix)
+    except ValueError as e:
+        click.echo('Error: {}'.format(e.args[0]))
+        sys.exit(1)
+
+    sys.exit(0 if rate else 1)
+
+@click.command()
+@click.option('--connect', required=True, callback=validate_address, help='host:port of the coordinator to run load for')
+@click.option('--timeout', default=_distributed.CONNECT_TIMEOUT, type=float,
+    help='How long to keep trying to connect to the coordinator, in seconds')
+@click.option('--transport', default=_transport.TRANSPORT.BLOCKING, type=click.Choice(_transport.TRANSPORTS),
+    help='HTTP transport to generate load with')
+@click.pass_context
+def worker(ctx, connect, timeout, transport):
+    try:
+        _transport.select_transport(transport)
+    except ValueError as e:
+        click.echo('Error: {}'.format(e.args[0]))
+        sys.exit(1)
+
+    try:
+        completed = _distributed.Worker(connect, timeout=timeout).run()
+    except socket.error as e:
+        click.echo('Error: could not connect to {}:{} - {}'.format(connect[0], connect[1], e))
+        sys.exit(1)
+
+    sys.exit(0 if completed else 1)
 
 @click.command()
 @click.argument('path', default=tempfile.gettempdir(), type=click.Path(exists=True, file_okay=False, resolve_path=True))
@@ -65,6 +194,10 @@ def demo(ctx, path):
 main.add_command(init)
 main.add_command(run)
 main.add_command(demo)
+main.add_command(merge_results)
+main.add_command(load)
+main.add_command(capacity)
+main.add_command(worker)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import json, os, socket, sys, tarfile
+from base64 import b64decode, b64encode
+from io import BytesIO
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Thread
+from time import sleep, time
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.apitest.load import get_load, get_replay, LoadResult, validate_rate
+
+# ################################################################################################################################
+
+# How often workers send snapshots of their results to the coordinator, in seconds.
+PROGRESS_INTERVAL = 1.0
+
+# How long the coordinator waits for all workers to connect and workers wait for the coordinator to become reachable.
+CONNECT_TIMEOUT = 60.0
+
+class MESSAGE:
+    JOB = 'job'
+    READY = 'ready'
+    START = 'start'
+    PROGRESS = 'progress'
+    RESULT = 'result'
+    ERROR = 'error'
+
+# ################################################################################################################################
+
+def parse_address(value):
+    """ Turns host:port into a (host, port) tuple.
+    """
+    host, _, port = value.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError('Address `{}` should be in the form of host:port'.format(value))
+
+    return host, int(port)
+
+def send(conn, message_type, **data):
+    """ Messages are lines of JSON, one per message.
+    """
+    data['type'] = message_type
+    conn.write((json.dumps(data) + '\n').encode('utf-8'))
+    conn.flush()
+
+def receive(conn):
+    """ Returns the next message or None if the peer closed the connection.
+    """
+    line = conn.readline()
+    return json.loads(line.decode('utf-8')) if line else None
+
+def pack_features(path):
+    """ Returns a path's features directory as a base64-encoded gzipped tarball.
+    """
+    buff = BytesIO()
+    tar = tarfile.open(fileobj=buff, mode='w:gz')
+    try:
+        tar.add(os.path.join(path, 'features'), 'features', filter=lambda info: None if info.name.endswith('.pyc') else info)
+    finally:
+        tar.close()
+
+    return b64encode(buff.getvalue()).decode('ascii')
+
+def unpack_features(data, path):
+    """ Extracts features packed by pack_features into path, refusing anything that would end up outside of it.
+    """
+    tar = tarfile.open(fileobj=BytesIO(b64decode(data)), mode='r:gz')
+    try:
+        for member in tar.getmembers():
+            if os.path.isabs(member.name) or '..' in member.name.split('/') or not (member.isfile() or member.isdir()):
+                raise ValueError('Invalid member `{}` in features archive'.format(member.name))
+        tar.extractall(path)
+    finally:
+        tar.close()
+
+def get_shares(total, workers):
+    """ Splits a number of iterations or concurrent workers as evenly as possible.
+    """
+    share, remainder = divmod(total, workers)
+    return [share + (1 if idx < remainder else 0) for idx in range(workers)]
+
+# ################################################################################################################################
+
+def get_job_replay(path, job):
+    return get_replay(path, job['name'], job['args'], job['is_mix'])
+
+class Worker(object):
+    """ Connects to a coordinator, receives a scenario along with the features directory and its share of the load,
+    runs it and streams snapshots of its results back. Runs one job and returns, since behave's step definitions
+    are global to a process.
+    """
+    def __init__(self, address, get_replay=get_job_replay, timeout=CONNECT_TIMEOUT):
+        self.address = address
+        self.get_replay = get_replay
+        self.timeout = timeout
+
+    def connect(self):
+        deadline = time() + self.timeout
+        while True:
+            try:
+                return socket.create_connection(self.address)
+            except socket.error:
+                if time() >= deadline:
+                    raise
+                sleep(0.1)
+
+    def run_job(self, conn, job, path):
+        unpack_features(job['features'], path)
+
+        try:
+            replay = self.get_replay(path, job)
+            load, _ = get_load(replay, job['concurrency'], job['rate'], job['duration'], job['iterations'], job['is_open'])
+        except Exception as e:
+            send(conn, MESSAGE.ERROR, message='{}'.format(e))
+            return False
+
+        send(conn, MESSAGE.READY)
+
+        message = receive(conn)
+        if not message or message['type'] != MESSAGE.START:
+            return False
+
+        result = LoadResult(replay.location)
+        thread = Thread(target=load.run, args=(result,))
+        thread.daemon = True
+        thread.start()
+
+        while thread.is_alive():
+            thread.join(PROGRESS_INTERVAL)
+            if thread.is_alive():
+                send(conn, MESSAGE.PROGRESS, result=result.to_dict())
+
+        send(conn, MESSAGE.RESULT, result=result.to_dict())
+        return True
+
+    def run(self):
+        """ Returns True if the job was run to completion.
+        """
+        sock = self.connect()
+        conn = sock.makefile('rwb')
+        path = mkdtemp(prefix='apitest-worker-')
+
+        try:
+            job = receive(conn)
+            if not job or job['type'] != MESSAGE.JOB:
+                return False
+
+            return self.run_job(conn, job, path)
+
+        finally:
+            rmtree(path, True)
+            conn.close()
+            sock.close()
+
+# ################################################################################################################################
+
+class Coordinator(object):
+    """ Waits for a number of workers to connect, hands each of them a share of the load, starts them all at once
+    and merges their results. Rate, iterations and, if given, concurrency are split evenly among workers, hence concurrency
+    may not be lower than the number of workers - each of them needs at least one concurrent iteration to run.
+    """
+    def __init__(self, address, workers, job, stream=None, timeout=CONNECT_TIMEOUT):
+        if job['concurrency'] and job['concurrency'] < workers:
+            raise ValueError('Concurrency ({}) may not be lower than the number of workers ({})'.format(
+                job['concurrency'], workers))
+
+        self.workers = workers
+        self.job = job
+        self.stream = stream or sys.stdout
+        self.timeout = timeout
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(address)
+        self.server.listen(workers)
+        self.address = self.server.getsockname()[:2]
+
+    def accept(self, peers):
+        deadline = time() + self.timeout
+
+        while len(peers) < self.workers:
+            self.server.settimeout(max(0.0, deadline - time()))
+            try:
+                sock, address = self.server.accept()
+            except socket.timeout:
+                raise ValueError('Only {} of {} workers connected within {}s'.format(len(peers), self.workers, self.timeout))
+
+            sock.settimeout(None)
+            peers.append(Bunch(sock=sock, conn=sock.makefile('rwb'), address='{}:{}'.format(*address[:2]),
+                snapshot=None, result=None, error=None))
+
+            self.stream.write('Worker {} connected ({}/{})\n'.format(peers[-1].address, len(peers), self.workers))
+            self.stream.flush()
+
+    def get_jobs(self):
+        job = self.job
+        workers = self.workers
+
+        iterations = get_shares(job['iterations'], workers) if job['iterations'] else [None] * workers
+        concurrency = get_shares(job['concurrency'], workers) if job['concurrency'] else [None] * workers
+
+        for idx in range(workers):
+            worker_job = dict(job)
+            worker_job['rate'] = job['rate'] / workers if job['rate'] else None
+            worker_job['iterations'] = iterations[idx]
+            worker_job['concurrency'] = concurrency[idx]
+            yield worker_job
+
+    def collect(self, peer):
+        """ Reads snapshots and the final result of a single worker.
+        """
+        while True:
+            try:
+                message = receive(peer.conn)
+            except (socket.error, ValueError) as e:
+                peer.error = '{}'.format(e)
+                break
+
+            if not message:
+                peer.error = 'Connection closed before the run completed'
+                break
+
+            if message['type'] == MESSAGE.PROGRESS:
+                peer.snapshot = LoadResult.from_dict(message['result'])
+
+            elif message['type'] == MESSAGE.RESULT:
+                peer.result = LoadResult.from_dict(message['result'])
+                break
+
+            elif message['type'] == MESSAGE.ERROR:
+                peer.error = message['message']
+                break
+
+    def report_progress(self, peers, start):
+        current = LoadResult()
+        for peer in peers:
+            snapshot = peer.result or peer.snapshot
+            if snapshot:
+                current.merge(snapshot)
+
+        self.stream.write('[{:>7.1f}s] iterations: {}, errors: {}, p99: {:.2f} ms\n'.format(
+            time() - start, current.iterations, current.error_count, current.histogram.percentile(99) * 1000))
+        self.stream.flush()
+
+    def run(self):
+        """ Returns a result merged from results of all workers that completed their share of the run.
+        """
+        peers = []
+
+        try:
+            self.accept(peers)
+            features = pack_features(self.job['path'])
+
+            for peer, job in zip(peers, self.get_jobs()):
+                del job['path']
+                send(peer.conn, MESSAGE.JOB, features=features, **job)
+
+            for peer in peers:
+                message = receive(peer.conn)
+                if not message or message['type'] != MESSAGE.READY:
+                    raise ValueError('Worker {} could not set up the run: {}'.format(
+                        peer.address, message['message'] if message else 'connection closed'))
+
+            for peer in peers:
+                send(peer.conn, MESSAGE.START)
+
+            start = time()
+            threads = [Thread(target=self.collect, args=(peer,)) for peer in peers]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+
+            while True:
+                alive = [thread for thread in threads if thread.is_alive()]
+                if not alive:
+                    break
+                alive[0].join(PROGRESS_INTERVAL)
+                self.report_progress(peers, start)
+
+            result = LoadResult()
+            for peer in peers:
+                if peer.result:
+                    result.name = peer.result.name
+                    result.merge(peer.result)
+                else:
+                    self.stream.write('Worker {} failed: {}\n'.format(peer.address, peer.error))
+
+            return result
+
+        finally:
+            for peer in peers:
+                peer.conn.close()
+                peer.sock.close()
+            self.server.close()
+
+# ################################################################################################################################
+
+def handle(path, address, workers, name, concurrency=None, rate=None, duration=None, iterations=None, args=None,
+        is_open=False, is_mix=False):
+    """ Coordinates a load run among workers started with `apitest worker --connect host:port`, prints a report
+    and returns the merged result.
+    """
+    validate_rate(rate, is_open)
+
+    if bool(name) == bool(is_mix):
+        raise ValueError('Exactly one of scenario or workload mix is required')
+
+    job = {
+        'path': path,
+        'name': name,
+        'is_mix': is_mix,
+        'is_open': is_open,
+        'concurrency': concurrency,
+        'rate': rate,
+        'duration': duration,
+        'iterations': iterations,
+        'args': args or [],
+    }
+
+    coordinator = Coordinator(address, workers, job)
+    sys.stdout.write('Waiting for {} workers on {}:{}\n'.format(workers, *coordinator.address))
+
+    result = coordinator.run()
+    sys.stdout.write('\n')
+    result.report()
+
+    return result
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import marshal, mmap, os
+from collections import OrderedDict
+from copy import deepcopy
+from threading import RLock
+
+# Bunch
+from bunch import Bunch
+
+# lxml
+from lxml import etree
+
+# Zato
+from zato.apitest import jsonbackend
+
+# ################################################################################################################################
+
+# How many bytes of files and their parsed forms are kept at most, least recently used ones are dropped first.
+MAX_SIZE = 64 * 1024 * 1024
+
+# Files of at least that many bytes are memory-mapped instead of read into memory and count towards MAX_MAPS rather than
+# MAX_SIZE. Mapping is off unless set, e.g. to 1024 * 1024 through cache.mmap_min_size in environment.py.
+MMAP_MIN_SIZE = None
+
+# How many memory-mapped files are kept at most, least recently used ones are dropped first. Mappings dropped are not closed,
+# callers may still use them, but they are unmapped, and their descriptors closed, once nothing refers to them.
+MAX_MAPS = 16
+
+# ################################################################################################################################
+
+def _parse_xml(data):
+    root = etree.fromstring(data)
+
+    # Parsed XML is copied by lxml itself, its size is assumed to be that of the file.
+    return root, len(data)
+
+def _parse_json(data):
+    blob = marshal.dumps(jsonbackend.loads(data))
+
+    # JSON is kept serialized with marshal, which loads the very types json does considerably faster than json itself,
+    # or deepcopy, do.
+    return blob, len(blob)
+
+parsers = {
+    'XML': (_parse_xml, deepcopy),
+    'JSON': (_parse_json, marshal.loads),
+}
+
+# ################################################################################################################################
+
+class _Identity(object):
+    """ Stands in for an object which cannot be hashed, e.g. a memory-mapped file, in keys of caches, and keeps it alive
+    for as long as the key is, so that its id is not reused.
+    """
+    def __init__(self, value):
+        self.value = value
+
+    def __hash__(self):
+        return id(self.value)
+
+    def __eq__(self, other):
+        return isinstance(other, _Identity) and other.value is self.value
+
+    def __ne__(self, other):
+        return not self == other
+
+def get_key(data):
+    """ Returns what data, either bytes or a memory-mapped file returned by FixtureCache.get, is keyed by in caches.
+    """
+    return _Identity(data) if isinstance(data, mmap.mmap) else data
+
+def get_bytes(data):
+    """ Returns data as bytes, memory-mapped files are read in full.
+    """
+    return data[:] if isinstance(data, mmap.mmap) else data
+
+def get_view(data):
+    """ Returns data as something requests can send as a body, memory-mapped files as read-only views of their own,
+    so that nothing is copied and the position of the mapping does not matter.
+    """
+    return buffer(data) if isinstance(data, mmap.mmap) else data
+
+# ################################################################################################################################
+
+class FixtureCache(object):
+    """ Request and response files, by path, kept in memory for the whole run, each read again if its modification time
+    or size changes. Data parsed, e.g. contents of such files, is kept too, by the data itself, and copies of it are handed
+    out to each caller anew, so that they can be modified freely. Least recently used files and parsed data are dropped
+    first once there are more than max_size bytes of them. Optionally, files of at least mmap_min_size bytes are memory-mapped,
+    no more than max_maps of them at a time.
+    """
+    def __init__(self, max_size=MAX_SIZE, mmap_min_size=MMAP_MIN_SIZE, max_maps=MAX_MAPS):
+        self.max_size = max_size
+        self.mmap_min_size = mmap_min_size
+        self.max_maps = max_maps
+        self.entries = OrderedDict() # Least recently used ones first, by path for files and by format and data for parsed ones
+        self.size = 0
+        self.maps = 0
+        self.lock = RLock()
+
+    def _load(self, path, stamp):
+        with open(path, 'rb') as f:
+            if self.mmap_min_size and stamp[1] >= self.mmap_min_size:
+                return Bunch(value=mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), size=0, is_mapped=True, stamp=stamp)
+
+            data = f.read()
+            return Bunch(value=data, size=len(data), is_mapped=False, stamp=stamp)
+
+    def _pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.size -= entry.size
+            self.maps -= entry.get('is_mapped', False)
+
+        return entry
+
+    def _add(self, key, entry):
+        self.entries[key] = entry
+        self.size += entry.size
+        self.maps += entry.get('is_mapped', False)
+
+        while self.size > self.max_size and self.entries:
+            self._pop(next(iter(self.entries)))
+
+        while self.maps > self.max_maps:
+            self._pop(next(mapped for mapped, item in self.entries.items() if item.get('is_mapped')))
+
+    def get(self, path):
+        """ Returns contents of a file - bytes or, if the file is memory-mapped, the read-only mapping itself rather than
+        a copy of it, see get_bytes, get_key and get_view.
+        """
+        stat = os.stat(path)
+        stamp = (stat.st_mtime, stat.st_size)
+
+        with self.lock:
+            entry = self._pop(path)
+
+            if not entry or entry.stamp != stamp:
+                entry = self._load(path, stamp)
+
+            self._add(path, entry)
+
+        return entry.value
+
+    def parse(self, data, format):
+        """ Returns a copy of data parsed according to format, either 'XML' or 'JSON'. The same data is parsed once only.
+        """
+        parse, copy = parsers[format]
+        key = (format, get_key(data))
+
+        with self.lock:
+            entry = self._pop(key)
+
+            if not entry:
+                value, size = parse(get_bytes(data))
+                entry = Bunch(value=value, size=len(data) + size)
+
+            out = copy(entry.value)
+            self._add(key, entry)
+
+        return out
+
+    def clear(self):
+        with self.lock:
+            while self.entries:
+                self._pop(next(iter(self.entries)))
+
+# ################################################################################################################################
+
+# A run-wide cache used by util.get_file, util.get_parsed_data and request steps, e.g. its limits can be changed in environment.py
+cache = FixtureCache()
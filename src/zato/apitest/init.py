@@ -28,11 +28,11 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import os
 
 # Zato
-from zato.apitest.util import new_context
+from zato.apitest.util import get_user_config, new_context
 
 def before_feature(context, feature):
     environment_dir = os.path.dirname(os.path.realpath(__file__))
-    context.zato = new_context(None, environment_dir)
+    context.zato = new_context(None, environment_dir, get_user_config(environment_dir))
 '''
 
 STEPS = '''# -*- coding: utf-8 -*-
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import json, os
+from timeit import default_timer
+
+# ujson is optional, it is used to parse JSON if installed, unless APITEST_JSON_BACKEND is set to json
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# ################################################################################################################################
+
+# Name of the backend JSON is parsed with, either json or ujson
+BACKEND = os.environ.get('APITEST_JSON_BACKEND') or ('ujson' if ujson else 'json')
+
+# Options of json.dumps requests are serialized with, by serialization policy set in the [json] stanza of config.ini.
+# Only the compact one uses the C encoder, json does not sort keys or indent in C, and pretty is meant for debugging,
+# e.g. to read requests captured.
+SERIALIZATION = {
+    'compact': {'separators': (',', ':')},
+    'sorted': {'separators': (',', ':'), 'sort_keys': True},
+    'pretty': {'separators': (',', ': '), 'sort_keys': True, 'indent': 2},
+}
+
+DEFAULT_SERIALIZATION = 'compact'
+
+# ################################################################################################################################
+
+def _ujson_loads(data):
+    try:
+        return ujson.loads(data, precise_float=True)
+    except (ValueError, OverflowError):
+        # Integers too big for ujson, NaN and Infinity are parsed with json, which also reports errors in more detail
+        return json.loads(data)
+
+if BACKEND == 'ujson':
+    if not ujson:
+        raise ValueError('APITEST_JSON_BACKEND is ujson but ujson is not installed')
+    loads = _ujson_loads
+elif BACKEND == 'json':
+    loads = json.loads
+else:
+    raise ValueError('Invalid APITEST_JSON_BACKEND `{}`, should be json or ujson'.format(BACKEND))
+
+def load(fp):
+    return loads(fp.read())
+
+def dumps(obj, **options):
+    """ Serializes obj with json regardless of the backend - ujson 1.x rounds floats to 15 significant digits,
+    while json.dumps uses its C encoder with compact serialization, see SERIALIZATION.
+    """
+    return json.dumps(obj, **options)
+
+def get_serialization(config):
+    """ Returns options of dumps requests are serialized with, according to a [json] stanza of config.ini, e.g.
+
+    [json]
+    serialization=pretty
+    """
+    serialization = (config or {}).get('serialization', DEFAULT_SERIALIZATION)
+
+    try:
+        return SERIALIZATION[serialization]
+    except KeyError:
+        raise ValueError('Invalid serialization `{}` in [json] in config.ini, should be one of {}'.format(
+            serialization, ', '.join(sorted(SERIALIZATION))))
+
+# ################################################################################################################################
+
+def new_payload(size):
+    """ Returns a document of about size bytes serialized, made of records such as those of typical API responses.
+    """
+    record = {'id': 123456, 'name': 'Customer 123456', 'email': 'customer@example.com', 'is_active': True,
+        'balance': 1234.56, 'tags': ['a', 'b', 'c'], 'address': {'street': 'Street 1', 'city': 'City', 'zip': '12-345'}}
+
+    return {'items': [dict(record, id=idx) for idx in range(max(size // len(json.dumps(record)), 1))]}
+
+def benchmark(sizes=(1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024), number=None):
+    """ Returns, for payloads of each of sizes, how many bytes and milliseconds it takes to serialize them with each
+    serialization policy and the previous default of indent=2, and to parse them with json and with the backend.
+    """
+    results = []
+
+    for size in sizes:
+        payload = new_payload(size)
+        repeat = number or max(int(10 * 1024 * 1024 // size), 1)
+
+        def timed(func, *args, **kwargs):
+            start = default_timer()
+            for _ in range(repeat):
+                out = func(*args, **kwargs)
+            return out, (default_timer() - start) / repeat * 1000
+
+        row = {'size': size}
+
+        for name, options in [('indent=2', {'indent': 2})] + sorted(SERIALIZATION.items()):
+            data, row[name] = timed(dumps, payload, **options)
+            row[name + ' bytes'] = len(data)
+
+        data = dumps(payload, **SERIALIZATION[DEFAULT_SERIALIZATION])
+        row['json.loads'] = timed(json.loads, data)[1]
+        row['{}.loads'.format(BACKEND)] = timed(loads, data)[1]
+
+        results.append(row)
+
+    return results
+
+if __name__ == '__main__':
+    for row in benchmark():
+        print('{} bytes'.format(row.pop('size')))
+        for key, value in sorted(row.items()):
+            print('  {:<20} {}'.format(key, value if key.endswith('bytes') else '{:.3f} ms'.format(value)))
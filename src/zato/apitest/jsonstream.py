@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from decimal import Decimal
+
+# jsonpointer
+from jsonpointer import JsonPointer
+
+# ijson, with its C backend if yajl2 is available
+from ijson.common import ObjectBuilder
+try:
+    from ijson.backends import yajl2_c as ijson
+except ImportError:
+    from ijson.backends import python as ijson
+
+# Zato
+from zato.apitest import jsonbackend
+
+# ################################################################################################################################
+
+SCALARS = ('null', 'boolean', 'number', 'string')
+
+# ################################################################################################################################
+
+def extract(fp, pointers):
+    """ Returns values at JSON Pointers in a document read from a file object, keyed by pointers. Pointers not found
+    in the document are left out. Events from the parser are used to build the values pointed to only, all other parts
+    of the document are skipped over, and the document is not read any further once all the values are found.
+    """
+    pointers = dict((tuple(JsonPointer(pointer).parts), pointer) for pointer in pointers)
+
+    found = {}
+
+    path = []       # Location of the current value, made of object keys and array indexes
+    arrays = []     # Index of the next item of each array open, None for objects
+    builders = []   # Values being built, along with their pointers and depths in the document
+
+    for event, value in ijson.basic_parse(fp):
+
+        # The same types json.loads would return
+        if isinstance(value, Decimal):
+            value = float(value)
+
+        for _, builder, _ in builders:
+            builder.event(event, value)
+
+        if event == 'map_key':
+            path[-1] = value
+            continue
+
+        if event in ('end_map', 'end_array'):
+            arrays.pop()
+            path.pop()
+
+            for item in [item for item in builders if item[2] == len(path)]:
+                builders.remove(item)
+                found[item[0]] = item[1].value
+
+        # A new value starts - a scalar or a container
+        else:
+            if arrays and arrays[-1] is not None:
+                path[-1] = '{}'.format(arrays[-1])
+                arrays[-1] += 1
+
+            pointer = pointers.get(tuple(path))
+            if pointer is not None and pointer not in found:
+                builder = ObjectBuilder()
+                builder.event(event, value)
+
+                if event in SCALARS:
+                    found[pointer] = builder.value
+                else:
+                    builders.append((pointer, builder, len(path)))
+
+            if event not in SCALARS:
+                arrays.append(0 if event == 'start_array' else None)
+                path.append(None)
+
+        if len(found) == len(pointers):
+            break
+
+    return found
+
+# ################################################################################################################################
+
+def iter_records(lines):
+    """ Yields records of an NDJSON document, i.e. JSON values, one per line, given as an iterable of lines,
+    e.g. a file object, so that only one of them at a time is kept in memory. Each record is accompanied
+    by its line number, blank lines are skipped over.
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+
+        try:
+            record = jsonbackend.loads(line.decode('utf-8'))
+        except ValueError as e:
+            raise ValueError('Invalid JSON in line {} of NDJSON response: {}'.format(number, e))
+
+        yield number, record
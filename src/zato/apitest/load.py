@@ -0,0 +1,629 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os, sys
+from collections import OrderedDict
+from fractions import gcd
+from itertools import count
+from threading import Event, Lock, Thread
+from time import sleep, time
+
+# six
+from six.moves.queue import Queue
+
+# Behave
+from behave.configuration import Configuration
+from behave.parser import parse_file
+from behave.runner import Runner
+from behave.step_registry import registry
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.apitest import phases, sessions, util
+from zato.apitest.run import get_behave_options, get_feature_key, get_feature_paths
+from zato.apitest.stats import Histogram
+from zato.apitest.transport import get_current_transport
+
+# ################################################################################################################################
+
+# How many distinct error messages to keep per load run, anything above it is counted under a common label.
+MAX_ERROR_MESSAGES = 20
+OTHER_ERRORS = '(other errors)'
+
+# In the open model, iterations which start this many seconds after their intended time are reported as late.
+LATE_THRESHOLD = 0.01
+
+# How many iterations may be in flight at once in the open model if not given on input.
+DEFAULT_OPEN_CONCURRENCY = 50
+
+# ################################################################################################################################
+
+# Step definitions can be loaded only once per process, behave's registry would complain about ambiguous steps otherwise.
+_steps_loaded = set()
+
+def load_steps(conf):
+    """ Loads environment hooks and step definitions the way behave does, unless they have been already loaded.
+    """
+    runner = Runner(conf)
+    with runner.path_manager:
+        runner.setup_paths()
+        if runner.base_dir not in _steps_loaded:
+            runner.load_hooks()
+            runner.load_step_definitions()
+            _steps_loaded.add(runner.base_dir)
+
+# ################################################################################################################################
+
+class ScenarioReplay(object):
+    """ Runs steps of a scenario outside of behave's runner, over and over again, each time with a fresh context.
+    Scenarios are looked up either by name or by a tag. If there is more than one, e.g. rows of a scenario outline
+    or all scenarios with a tag, each iteration runs the next one.
+    Latency of an iteration is the time spent in its When steps, i.e. invoking the URL.
+    """
+    def __init__(self, path, name=None, behave_options=None, tag=None):
+        self.path = path
+        self.name = name
+        self.tag = tag.lstrip('@') if tag else None
+        self.features_dir = os.path.join(path, 'features')
+        self.behave_options = behave_options if behave_options is not None else get_behave_options(path)
+        self.user_config = util.get_user_config(self.features_dir)
+        self.scenarios = []
+        self.location = None
+
+    def _find_scenarios_by_tag(self, conf):
+        scenarios = []
+        for feature_path in get_feature_paths(conf, self.features_dir):
+            feature = parse_file(os.path.abspath(feature_path), language=conf.lang)
+            if feature:
+                scenarios.extend(scenario for scenario in feature.walk_scenarios() if self.tag in scenario.effective_tags)
+
+        if not scenarios:
+            raise ValueError('No scenarios tagged `@{}` in `{}`'.format(self.tag, self.features_dir))
+
+        self.location = '@{}'.format(self.tag)
+
+        return scenarios
+
+    def _find_scenarios(self, conf):
+        """ Returns all scenarios, or rows of an outline, of a given name, either from a single feature file
+        if name is in the form of path/to/file.feature:scenario-name, or from any feature otherwise.
+        """
+        if self.tag:
+            return self._find_scenarios_by_tag(conf)
+
+        feature_path, _, name = self.name.rpartition('.feature:')
+        if feature_path:
+            feature_paths = [os.path.join(self.features_dir, feature_path + '.feature')]
+        else:
+            feature_paths = get_feature_paths(conf, self.features_dir)
+
+        found = {}
+        for feature_path in feature_paths:
+            feature = parse_file(os.path.abspath(feature_path), language=conf.lang)
+            if feature:
+                scenarios = [scenario for scenario in feature.walk_scenarios() if scenario.name == name]
+                if scenarios:
+                    found[get_feature_key(self.features_dir, feature_path)] = scenarios
+
+        if not found:
+            raise ValueError('Scenario `{}` not found in `{}`'.format(self.name, self.features_dir))
+
+        if len(found) > 1:
+            raise ValueError('Scenario `{}` found in more than one feature: `{}`, use feature.feature:name to pick one'.format(
+                self.name, ', '.join(sorted(found))))
+
+        feature, scenarios = found.popitem()
+        self.location = '{}:{}'.format(feature, name)
+
+        return scenarios
+
+    def _resolve_steps(self, scenario):
+        """ Matches steps against step definitions once, up front, so that iterations only call functions.
+        """
+        steps = []
+        for step in scenario.all_steps:
+            match = registry.find_match(step)
+            if not match:
+                raise ValueError('Undefined step `{} {}` in `{}`'.format(step.keyword, step.name, scenario.location))
+
+            args = [arg.value for arg in match.arguments if arg.name is None]
+            kwargs = dict((arg.name, arg.value) for arg in match.arguments if arg.name is not None)
+
+            steps.append(Bunch(step=step, func=match.func, args=args, kwargs=kwargs, is_when=step.step_type == 'when'))
+
+        return steps
+
+    def setup(self):
+        conf = Configuration(self.behave_options)
+        conf.paths = [self.features_dir]
+
+        load_steps(conf)
+        self.scenarios = [(scenario, self._resolve_steps(scenario)) for scenario in self._find_scenarios(conf)]
+
+        return self
+
+    def run_once(self, iteration=0):
+        """ Runs all steps of the scenario and returns a tuple of latency and an exception, if any was raised.
+        """
+        scenario, steps = self.scenarios[iteration % len(self.scenarios)]
+
+        ctx = Bunch()
+        ctx.zato = util.new_context(None, self.features_dir, self.user_config)
+        ctx.feature = scenario.feature
+        ctx.scenario = scenario
+
+        latency = 0.0
+
+        for step in steps:
+            ctx.table = step.step.table
+            ctx.text = step.step.text
+
+            start = time()
+            try:
+                step.func(ctx, *step.args, **step.kwargs)
+            except Exception as e:
+                return latency + (time() - start if step.is_when else 0.0), e
+            else:
+                if step.is_when:
+                    latency += time() - start
+
+        return latency, None
+
+    def get_entry(self, iteration):
+        """ Returns the label an iteration's metrics are additionally reported under and the time to wait after it.
+        A single scenario has neither.
+        """
+        return None, 0.0
+
+# ################################################################################################################################
+
+def get_interleaving(weights):
+    """ Returns a sequence of indexes of weights in which each index appears as many times as its weight,
+    reduced by the weights' greatest common divisor, spread out as evenly as possible (smooth weighted round-robin).
+    """
+    divisor = reduce(gcd, weights)
+    weights = [weight // divisor for weight in weights]
+
+    current = [0] * len(weights)
+    sequence = []
+
+    for _ in range(sum(weights)):
+        for idx, weight in enumerate(weights):
+            current[idx] += weight
+        idx = current.index(max(current))
+        current[idx] -= sum(weights)
+        sequence.append(idx)
+
+    return sequence
+
+class WorkloadMix(object):
+    """ Interleaves several scenario replays according to their weights, e.g. 70% lookups, 25% updates and 5% batch calls.
+    Each entry may have a think time - how long a worker waits after running it, in the closed model only.
+    """
+    def __init__(self, entries):
+        self.entries = entries
+        self.sequence = get_interleaving([entry.weight for entry in entries])
+        self.location = ', '.join('{} ({})'.format(entry.name, entry.weight) for entry in entries)
+
+        # For each position in the sequence - how many times its entry appears in the sequence before it,
+        # so that each entry cycles through its own scenarios independently of how often other entries run.
+        self.per_cycle = [self.sequence.count(idx) for idx in range(len(entries))]
+        self.offsets = [self.sequence[:pos].count(idx) for pos, idx in enumerate(self.sequence)]
+
+    def _get_entry(self, iteration):
+        return self.entries[self.sequence[iteration % len(self.sequence)]]
+
+    def run_once(self, iteration=0):
+        cycle, pos = divmod(iteration, len(self.sequence))
+        idx = self.sequence[pos]
+
+        return self.entries[idx].replay.run_once(cycle * self.per_cycle[idx] + self.offsets[pos])
+
+    def get_entry(self, iteration):
+        entry = self._get_entry(iteration)
+        return entry.name, entry.think_time
+
+def get_workload_mix(path, behave_options=None):
+    """ Builds a workload mix out of the [load] stanza in features/config.ini, e.g.
+
+    [load]
+    [[lookups]]
+    tag=lookup
+    weight=70
+    think_time=0.1
+
+    Each entry points to scenarios either by a tag or by a scenario name.
+    """
+    config = util.get_config(os.path.join(path, 'features')).get('load')
+    if not config:
+        raise ValueError('No [load] stanza in features/config.ini')
+
+    entries = []
+    for name, entry_config in config.items():
+        if not isinstance(entry_config, dict):
+            raise ValueError('Entry `{}` in [load] should be a [[{}]] subsection'.format(name, name))
+
+        tag = entry_config.get('tag')
+        scenario = entry_config.get('scenario')
+        if bool(tag) == bool(scenario):
+            raise ValueError('Entry `{}` in [load] needs exactly one of tag or scenario'.format(name))
+
+        try:
+            weight = int(entry_config.get('weight', 1))
+            think_time = float(entry_config.get('think_time', 0))
+        except ValueError as e:
+            raise ValueError('Invalid weight or think_time in [load] entry `{}`: {}'.format(name, e.args[0]))
+
+        if weight < 1:
+            raise ValueError('Weight of [load] entry `{}` must be a positive integer'.format(name))
+
+        replay = ScenarioReplay(path, scenario, behave_options, tag).setup()
+        entries.append(Bunch(name=name, replay=replay, weight=weight, think_time=think_time))
+
+    return WorkloadMix(entries)
+
+# ################################################################################################################################
+
+def get_error_message(e):
+    message = '{}'.format(e).strip().splitlines()
+    message = message[0][:200] if message else ''
+    return '{}: {}'.format(e.__class__.__name__, message) if message else e.__class__.__name__
+
+class LoadResult(object):
+    """ Outcome of a load run - a histogram of latencies, number of iterations and errors. In the open model,
+    latencies are measured from the time an iteration was meant to start at and the delay in starting it, if any,
+    is kept separately, as is the service time alone.
+    """
+    def __init__(self, name=''):
+        self.name = name
+        self.histogram = Histogram()
+        self.service = Histogram()
+        self.lag = Histogram()
+        self.iterations = 0
+        self.late = 0
+        self.error_count = 0
+        self.errors = {}
+        self.elapsed = 0.0
+        self.children = OrderedDict()
+        self.lock = Lock()
+
+    def record(self, latency, error=None, lag=None, label=None):
+        """ Records the outcome of an iteration, also under a label, e.g. a workload mix's entry, if one is given.
+        """
+        if label is not None:
+            with self.lock:
+                if label not in self.children:
+                    self.children[label] = LoadResult(label)
+            self.children[label].record(latency, error, lag)
+
+        if lag is not None:
+            self.service.record(latency)
+            self.lag.record(lag)
+            latency += lag
+
+        self.histogram.record(latency)
+
+        with self.lock:
+            self.iterations += 1
+            if lag is not None and lag > LATE_THRESHOLD:
+                self.late += 1
+            if error is not None:
+                self.error_count += 1
+                self._add_errors({get_error_message(error): 1})
+
+    def _add_errors(self, errors):
+        for message, occurrences in errors.items():
+            if message not in self.errors and len(self.errors) >= MAX_ERROR_MESSAGES:
+                message = OTHER_ERRORS
+            self.errors[message] = self.errors.get(message, 0) + occurrences
+
+    def merge(self, other):
+        """ Adds everything recorded in another result, e.g. one from a different worker, to this one.
+        Runs are assumed to have happened side by side, hence elapsed time is the longest of the two.
+        """
+        self.histogram.merge(other.histogram)
+        self.service.merge(other.service)
+        self.lag.merge(other.lag)
+
+        with self.lock:
+            self.iterations += other.iterations
+            self.late += other.late
+            self.error_count += other.error_count
+            self.elapsed = max(self.elapsed, other.elapsed)
+            self._add_errors(other.errors)
+
+            for label, child in other.children.items():
+                if label not in self.children:
+                    self.children[label] = LoadResult(label)
+                self.children[label].merge(child)
+
+        return self
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'name': self.name,
+                'histogram': self.histogram.to_dict(),
+                'service': self.service.to_dict(),
+                'lag': self.lag.to_dict(),
+                'iterations': self.iterations,
+                'late': self.late,
+                'error_count': self.error_count,
+                'errors': dict(self.errors),
+                'elapsed': self.elapsed,
+                'children': [child.to_dict() for child in self.children.values()],
+            }
+
+    @staticmethod
+    def from_dict(data):
+        result = LoadResult(data['name'])
+        result.histogram = Histogram.from_dict(data['histogram'])
+        result.service = Histogram.from_dict(data['service'])
+        result.lag = Histogram.from_dict(data['lag'])
+        result.iterations = data['iterations']
+        result.late = data['late']
+        result.error_count = data['error_count']
+        result.errors = data['errors']
+        result.elapsed = data['elapsed']
+
+        for child in data['children']:
+            result.children[child['name']] = LoadResult.from_dict(child)
+
+        return result
+
+    @property
+    def error_rate(self):
+        return self.error_count / self.iterations if self.iterations else 0.0
+
+    @property
+    def throughput(self):
+        return self.iterations / self.elapsed if self.elapsed else 0.0
+
+    def report(self, stream=None):
+        stream = stream or sys.stdout
+
+        stream.write('Scenario: {}\n'.format(self.name))
+        stream.write('Iterations: {}, errors: {} ({:.2f}%), elapsed: {:.3f}s, throughput: {:.2f}/s\n'.format(
+            self.iterations, self.error_count, self.error_rate * 100, self.elapsed, self.throughput))
+        stream.write('Latency (ms): {}\n'.format(self.histogram.summary()))
+
+        if self.lag.count:
+            stream.write('Service time (ms): {}\n'.format(self.service.summary()))
+            stream.write('Start lag (ms): {}\n'.format(self.lag.summary()))
+
+            if self.late:
+                stream.write(
+                    'Warning: {} of {} iterations started more than {:.0f} ms late, max. {:.2f} ms - the load generator '
+                    'could not keep up with the rate, consider increasing concurrency\n'.format(
+                        self.late, self.iterations, LATE_THRESHOLD * 1000, self.lag.max / 1000.0))
+
+        if self.errors:
+            stream.write('Errors:\n')
+            for message, occurrences in sorted(self.errors.items(), key=lambda item: item[1], reverse=True):
+                stream.write('  {} x {}\n'.format(occurrences, message))
+
+        for child in self.children.values():
+            child.elapsed = self.elapsed
+            stream.write('\n')
+            child.report(stream)
+
+# ################################################################################################################################
+
+class ClosedLoad(object):
+    """ A closed load model - each of the concurrent workers runs the next iteration once the previous one completes.
+    With rate given, iterations are additionally throttled so that, overall, they do not start more often than that.
+    Stops after duration seconds or a number of iterations, whichever comes first.
+    """
+    def __init__(self, replay, concurrency=1, rate=None, duration=None, iterations=None):
+        self.replay = replay
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.iterations = iterations
+
+        self.lock = Lock()
+        self.stop = Event()
+        self.started = 0
+        self.start = None
+        self.deadline = None
+
+    def next_iteration(self):
+        """ Returns the next iteration's number and the time it should start at, or None if there are no more iterations.
+        """
+        with self.lock:
+            if self.stop.is_set() or (self.iterations is not None and self.started >= self.iterations):
+                return None
+
+            iteration = self.started
+            self.started += 1
+
+        start_at = self.start + iteration / self.rate if self.rate else time()
+        if self.deadline is not None and start_at >= self.deadline:
+            return None
+
+        return iteration, start_at
+
+    def worker(self, result):
+        while True:
+            next_iteration = self.next_iteration()
+            if next_iteration is None:
+                break
+
+            iteration, start_at = next_iteration
+            delay = start_at - time()
+            if delay > 0:
+                sleep(delay)
+
+            latency, error = self.replay.run_once(iteration)
+            label, think_time = self.replay.get_entry(iteration)
+            result.record(latency, error, label=label)
+
+            if think_time:
+                sleep(think_time)
+
+    def run(self, result=None):
+        result = result or LoadResult(self.replay.location)
+
+        self.start = time()
+        self.deadline = self.start + self.duration if self.duration else None
+
+        threads = [Thread(target=self.worker, args=(result,)) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.1)
+        except KeyboardInterrupt:
+            self.stop.set()
+
+        result.elapsed = time() - self.start
+        return result
+
+# ################################################################################################################################
+
+class OpenLoad(object):
+    """ An open load model - iterations are started at a constant rate, independently of how long previous ones take,
+    by up to a given number of concurrent workers. To avoid coordinated omission, latencies are measured from the time
+    an iteration was meant to start at, so time spent waiting for a free worker is included in them.
+    Stops after duration seconds or a number of iterations, whichever comes first.
+    """
+    def __init__(self, replay, rate, concurrency=DEFAULT_OPEN_CONCURRENCY, duration=None, iterations=None):
+        self.replay = replay
+        self.rate = rate
+        self.concurrency = concurrency
+        self.duration = duration
+        self.iterations = iterations
+
+        self.queue = Queue()
+        self.stop = Event()
+
+    def worker(self, result):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            iteration, start_at = item
+            if self.stop.is_set():
+                continue
+
+            lag = max(0.0, time() - start_at)
+            latency, error = self.replay.run_once(iteration)
+            result.record(latency, error, lag, self.replay.get_entry(iteration)[0])
+
+    def schedule(self, start):
+        """ Hands out iterations to workers at their intended start times.
+        """
+        deadline = start + self.duration if self.duration else None
+
+        for iteration in count():
+            if self.iterations is not None and iteration >= self.iterations:
+                break
+
+            start_at = start + iteration / self.rate
+            if deadline is not None and start_at >= deadline:
+                break
+
+            delay = start_at - time()
+            if delay > 0:
+                sleep(delay)
+
+            self.queue.put((iteration, start_at))
+
+    def run(self, result=None):
+        result = result or LoadResult(self.replay.location)
+
+        threads = [Thread(target=self.worker, args=(result,)) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        start = time()
+
+        try:
+            self.schedule(start)
+
+            for thread in threads:
+                self.queue.put(None)
+
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.1)
+
+        except KeyboardInterrupt:
+            self.stop.set()
+            for thread in threads:
+                self.queue.put(None)
+
+        result.elapsed = time() - start
+        return result
+
+# ################################################################################################################################
+
+def get_replay(path, name=None, args=None, is_mix=False):
+    """ Returns a replay of either a single scenario or the workload mix from config.ini.
+    """
+    if bool(name) == bool(is_mix):
+        raise ValueError('Exactly one of scenario or workload mix is required')
+
+    behave_options = get_behave_options(path, args)
+    return get_workload_mix(path, behave_options) if is_mix else ScenarioReplay(path, name, behave_options).setup()
+
+def validate_rate(rate, is_open):
+    """ Raises ValueError unless rate, if given, is positive - an open model would otherwise never stop queueing
+    iterations - and unless it is given in the open model.
+    """
+    if rate is not None and rate <= 0:
+        raise ValueError('Rate must be greater than 0, not `{}`'.format(rate))
+
+    if is_open and not rate:
+        raise ValueError('Rate is required in the open model')
+
+def get_load(replay, concurrency=None, rate=None, duration=None, iterations=None, is_open=False):
+    """ Returns a load model to run a replay in, along with its human-readable description.
+    """
+    validate_rate(rate, is_open)
+
+    if is_open:
+        concurrency = concurrency or DEFAULT_OPEN_CONCURRENCY
+        mode = 'open, rate {}/s, up to {} concurrent'.format(rate, concurrency)
+        return OpenLoad(replay, rate, concurrency, duration, iterations), mode
+
+    concurrency = concurrency or 1
+    mode = 'closed, concurrency {}'.format(concurrency)
+    if rate:
+        mode += ', rate limit {}/s'.format(rate)
+
+    return ClosedLoad(replay, concurrency, rate, duration, iterations), mode
+
+def handle(path, name, concurrency=None, rate=None, duration=None, iterations=None, args=None, is_open=False, is_mix=False):
+    """ Replays a scenario, or a workload mix from config.ini, under load and prints a report. Returns the result of the run.
+    """
+    validate_rate(rate, is_open)
+
+    replay = get_replay(path, name, args, is_mix)
+    load, mode = get_load(replay, concurrency, rate, duration, iterations, is_open)
+
+    sys.stdout.write('Mode: {}, transport {}\n'.format(mode, get_current_transport()))
+    result = load.run()
+    result.report()
+    sys.stdout.write(sessions.get_connections_summary(sessions.registry.get_stats()) + '\n')
+    phases.report(phases.stats.to_dict())
+
+    return result
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import socket, sys, threading
+from time import time
+
+# Bunch
+from bunch import Bunch
+
+# Request
+from requests.adapters import HTTPAdapter
+from requests.compat import urlparse
+from requests.packages.urllib3 import connection, connectionpool, poolmanager
+
+# six
+from six.moves import http_client
+
+# ################################################################################################################################
+
+# Phases of a request, in the order they happen in.
+PHASES = ('dns', 'connect', 'tls', 'send', 'ttfb', 'body')
+
+# How many endpoints to list in reports.
+REPORT_ENDPOINTS = 10
+
+# ################################################################################################################################
+
+_current = threading.local()
+
+class RequestTiming(object):
+    """ Timestamps and byte counts of a single request. Connection-level phases, i.e. DNS, TCP connect and TLS,
+    are zero if a kept-alive connection was reused.
+    """
+    def __init__(self):
+        self.start = time()
+        self.dns = 0.0
+        self.connect = 0.0
+        self.tls = 0.0
+        self.send_start = None
+        self.sent = None
+        self.headers = None
+        self.end = None
+        self.new_connection = False
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def get_phases(self):
+        """ Returns durations of all phases, in seconds. Those which could not be measured, e.g. because a request
+        went through an adapter not using sockets at all, are counted towards the total only.
+        """
+        out = Bunch((phase, 0.0) for phase in PHASES)
+        out.dns, out.connect, out.tls = self.dns, self.connect, self.tls
+        out.total = self.end - self.start
+
+        if self.sent is not None and self.headers is not None:
+            out.send = self.sent - self.send_start
+            out.ttfb = self.headers - self.sent
+            out.body = self.end - self.headers
+
+        return out
+
+def get_current():
+    """ Returns the timing of the request the current thread is sending, if any.
+    """
+    return getattr(_current, 'timing', None) or RequestTiming()
+
+# ################################################################################################################################
+
+def _connect(conn):
+    """ Opens a TCP connection for an HTTP or HTTPS connection, timing DNS lookup and TCP handshake separately.
+    """
+    timing = get_current()
+    timing.new_connection = True
+    start = time()
+
+    try:
+        addresses = socket.getaddrinfo(conn.host, conn.port, 0, socket.SOCK_STREAM)
+        resolved = time()
+        timing.dns = resolved - start
+
+        error = None
+        for _, _, _, _, address in addresses:
+            try:
+                sock = socket.create_connection(address[:2], conn.timeout, conn.source_address)
+                break
+            except socket.error as e:
+                error = e
+        else:
+            raise error
+
+    except socket.timeout:
+        raise connection.ConnectTimeoutError(
+            conn, 'Connection to {} timed out. (connect timeout={})'.format(conn.host, conn.timeout))
+
+    timing.connect = time() - resolved
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, conn.tcp_nodelay)
+
+    return sock
+
+class TimedConnectionMixin(object):
+    """ Counts bytes sent and notes when a request starts and finishes being sent.
+    """
+    def send(self, data):
+        if self.sock is None:
+            self.connect()
+
+        timing = get_current()
+        if timing.send_start is None:
+            timing.send_start = time()
+
+        super(TimedConnectionMixin, self).send(data)
+
+        timing.bytes_sent += len(data)
+        timing.sent = time()
+
+class TimedHTTPConnection(TimedConnectionMixin, connection.HTTPConnection):
+    def _new_conn(self):
+        return _connect(self)
+
+class TimedHTTPSConnection(TimedConnectionMixin, connection.VerifiedHTTPSConnection):
+    def connect(self):
+        """ The same as urllib3's own VerifiedHTTPSConnection.connect, with TLS handshake timed separately.
+        """
+        sock = _connect(self)
+
+        hostname = self.host
+        if getattr(self, '_tunnel_host', None):
+            self.sock = sock
+            self._tunnel()
+            hostname = self._tunnel_host
+
+        start = time()
+        cert_reqs = connection.resolve_cert_reqs(self.cert_reqs)
+
+        self.sock = connection.ssl_wrap_socket(sock, self.key_file, self.cert_file, cert_reqs=cert_reqs,
+            ca_certs=self.ca_certs, server_hostname=hostname, ssl_version=connection.resolve_ssl_version(self.ssl_version))
+
+        if cert_reqs != connection.ssl.CERT_NONE:
+            if self.assert_fingerprint:
+                connection.assert_fingerprint(self.sock.getpeercert(binary_form=True), self.assert_fingerprint)
+            elif self.assert_hostname is not False:
+                connection.match_hostname(self.sock.getpeercert(), self.assert_hostname or hostname)
+
+        get_current().tls = time() - start
+
+class TimedHTTPConnectionPool(connectionpool.HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(connectionpool.HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+class TimedPoolManager(poolmanager.PoolManager):
+    pool_classes = {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+
+    def _new_pool(self, scheme, host, port):
+        kwargs = self.connection_pool_kw
+        if scheme == 'http':
+            kwargs = dict((key, value) for key, value in kwargs.items() if key not in poolmanager.SSL_KEYWORDS)
+
+        return self.pool_classes[scheme](host, port, **kwargs)
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """ An HTTP adapter whose connections record how long each phase of a request takes.
+    """
+    def init_poolmanager(self, connections, maxsize, block=False):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+
+        self.poolmanager = TimedPoolManager(num_pools=connections, maxsize=maxsize, block=block)
+
+    def send(self, request, **kwargs):
+        response = super(TimedHTTPAdapter, self).send(request, **kwargs)
+        get_current().headers = time()
+
+        return response
+
+# ################################################################################################################################
+
+def get_bytes_received(response):
+    """ Returns the size of response headers and body as they were received, less any chunked encoding framing.
+    Responses from adapters which do not use sockets, e.g. in tests, are reported as the size of their body,
+    unless it was streamed elsewhere already.
+    """
+    original = getattr(response.raw, '_original_response', None)
+    if not isinstance(original, http_client.HTTPResponse):
+        return 0 if response._content is False and response._content_consumed else len(response.content)
+
+    status_line = 'HTTP/{}.{} {} {}\r\n'.format(original.version // 10, original.version % 10, original.status,
+        original.reason)
+
+    return len(status_line) + sum(len(line) for line in original.msg.headers) + 2 + response.raw.tell()
+
+def get_bytes_sent(request):
+    """ Estimates the size of a request sent through an adapter which does not use sockets.
+    """
+    url = urlparse(request.url)
+    size = len('{} {} HTTP/1.1\r\n'.format(request.method, url.path + ('?' + url.query if url.query else '')))
+    size += sum(len('{}: {}\r\n'.format(key, value)) for key, value in request.headers.items()) + 2
+
+    return size + len(request.body or b'')
+
+def timed(func, *args, **kwargs):
+    """ Calls func, e.g. a session's request method, collecting phase timings of the request it sends.
+    Returns func's response and the timing.
+    """
+    timing = _current.timing = RequestTiming()
+    try:
+        response = func(*args, **kwargs)
+    finally:
+        _current.timing = None
+        timing.end = time()
+
+    timing.bytes_received = get_bytes_received(response)
+    if not timing.bytes_sent:
+        timing.bytes_sent = get_bytes_sent(response.request)
+
+    return response, timing
+
+# ################################################################################################################################
+
+def get_endpoint(method, url):
+    url = urlparse(url)
+    return '{} {}://{}{}'.format(method, url.scheme, url.netloc, url.path)
+
+class PhaseStats(object):
+    """ Totals of phase durations and byte counts per endpoint, i.e. method and URL without the query string.
+    """
+    def __init__(self):
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, timing):
+        phases = timing.get_phases()
+
+        with self.lock:
+            totals = self.endpoints.setdefault(endpoint, dict.fromkeys(PHASES + ('total', 'requests', 'new_connections',
+                'bytes_sent', 'bytes_received'), 0))
+
+            for phase, duration in phases.items():
+                totals[phase] += duration
+
+            totals['requests'] += 1
+            totals['new_connections'] += 1 if timing.new_connection else 0
+            totals['bytes_sent'] += timing.bytes_sent
+            totals['bytes_received'] += timing.bytes_received
+
+    def to_dict(self):
+        with self.lock:
+            return dict((endpoint, dict(totals)) for endpoint, totals in self.endpoints.items())
+
+def merge_stats(stats, other):
+    """ Adds totals from one dictionary returned by PhaseStats.to_dict to another one.
+    """
+    for endpoint, totals in other.items():
+        merged = stats.setdefault(endpoint, dict.fromkeys(totals, 0))
+        for key, value in totals.items():
+            merged[key] = merged.get(key, 0) + value
+
+    return stats
+
+def report(stats, stream=None, limit=REPORT_ENDPOINTS):
+    """ Prints mean durations of each phase for endpoints which took the most time overall, slowest first.
+    """
+    if not stats:
+        return
+
+    stream = stream or sys.stdout
+    stream.write('HTTP phases, mean ms per request:\n')
+    stream.write('  {:>8}  {:>8}  {:>8}  {:>8}  {:>8}  {:>8}  {:>8}  {:>8}  {:>10}  {:>10}  {}\n'.format(
+        'Requests', 'DNS', 'Connect', 'TLS', 'Send', 'TTFB', 'Body', 'Total', 'Sent B', 'Received B', 'Endpoint'))
+
+    endpoints = sorted(stats.items(), key=lambda item: item[1]['total'], reverse=True)
+
+    for endpoint, totals in endpoints[:limit]:
+        requests = totals['requests']
+        stream.write('  {:>8}  {}  {:>10}  {:>10}  {}\n'.format(requests,
+            '  '.join('{:>8.2f}'.format(totals[phase] / requests * 1000) for phase in PHASES + ('total',)),
+            totals['bytes_sent'] // requests, totals['bytes_received'] // requests, endpoint))
+
+    if len(endpoints) > limit:
+        stream.write('  ({} more endpoints)\n'.format(len(endpoints) - limit))
+
+# ################################################################################################################################
+
+# Shared by the whole process, worker processes each have their own.
+stats = PhaseStats()
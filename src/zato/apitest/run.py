@@ -12,17 +12,39 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # stdlib
-import os
+import json, os, sys
+from hashlib import md5
+from itertools import chain
+from multiprocessing import Pool
+from time import time
 
 # Behave
 from behave.configuration import Configuration
+from behave.formatter.base import StreamOpener
+from behave.parser import parse_file
+from behave.reporter.summary import SummaryReporter
 from behave.runner import Runner
+from behave.runner_util import collect_feature_locations
 
-# ConfigObj
-from configobj import ConfigObj
+# Bunch
+from bunch import Bunch
 
-def handle(path, args=None):
-    file_conf = ConfigObj(os.path.join(path, 'features', 'config.ini'))
+# six
+from six.moves import cStringIO as StringIO
+
+# Zato
+from zato.apitest import phases, util
+from zato.apitest.sessions import get_connections_summary, registry
+from zato.apitest.timings import schedule, TimingHistory
+
+# ################################################################################################################################
+
+summary_attrs = ('feature_summary', 'scenario_summary', 'step_summary')
+
+# ################################################################################################################################
+
+def get_behave_options(path, args=None):
+    file_conf = util.get_config(os.path.join(path, 'features'))
     try:
         behave_options = file_conf['behave']['options']
     except KeyError:
@@ -31,7 +53,348 @@ def handle(path, args=None):
     if args:
         behave_options += ' ' + ' '.join(args)
 
+    return behave_options
+
+def get_feature_paths(conf, features_dir):
+    """ Returns paths to all feature files behave would run, in the order it would run them.
+    """
+    return [location.filename for location in collect_feature_locations([features_dir])
+        if not conf.exclude(location.filename)]
+
+# ################################################################################################################################
+
+def parse_shard(value):
+    """ Turns a 'index/total' string, such as '3/8', into a tuple of integers, with index counted from 1.
+    """
+    try:
+        index, total = [int(elem) for elem in value.split('/')]
+    except ValueError:
+        raise ValueError('Shard must be in the form of index/total, e.g. 3/8, instead of `{}`'.format(value))
+
+    if not 1 <= index <= total:
+        raise ValueError('Shard index must be between 1 and {}, not {}'.format(total, index))
+
+    return index, total
+
+def get_feature_key(features_dir, feature_path):
+    """ Returns a key identifying a feature, independent of the location of the features directory on disk.
+    """
+    return os.path.relpath(os.path.abspath(feature_path), features_dir).replace(os.sep, '/')
+
+def get_shard_key(features_dir, feature_path, scenario_name):
+    """ Returns a key identifying a scenario, independent of the location of the features directory on disk.
+    """
+    return '{}:{}'.format(get_feature_key(features_dir, feature_path), scenario_name)
+
+def in_shard(key, shard):
+    """ Returns True if a scenario, as identified by its key, belongs to the shard given on input.
+    """
+    index, total = shard
+    return int(md5(key.encode('utf-8')).hexdigest(), 16) % total == index - 1
+
+# ################################################################################################################################
+
+def get_units(conf, features_dir, shard=None):
+    """ Returns units of work - each points to a single feature file. With sharding, a unit also lists keys of each
+    scenario which belongs to the shard and features with none of them are left out. Scenario outlines are sharded
+    as a whole, see ShardRunner.
+    """
+    units = []
+
+    for feature_path in get_feature_paths(conf, features_dir):
+        unit = {'feature': get_feature_key(features_dir, feature_path), 'paths': [feature_path], 'keys': []}
+
+        if shard:
+            feature = parse_file(feature_path, language=conf.lang)
+            if not feature:
+                continue
+
+            for scenario in feature.scenarios:
+                key = get_shard_key(features_dir, feature_path, scenario.name)
+                if in_shard(key, shard):
+                    unit['keys'].append(key)
+
+            if not unit['keys']:
+                continue
+
+        units.append(unit)
+
+    return units
+
+# ################################################################################################################################
+
+class ShardRunner(Runner):
+    """ Runs whole feature files but only scenarios of a shard, the rest are marked as skipped, like behave does
+    with scenarios not selected by file:line locations. Locations cannot select scenario outlines - behave gives all
+    of their rows the outline's line and would run only the first one - so outlines are sharded as a whole instead,
+    with all of their rows run in one shard.
+    """
+    def __init__(self, config, features_dir, shard):
+        super(ShardRunner, self).__init__(config)
+        self.features_dir = features_dir
+        self.shard = shard
+
+    def run_model(self, features=None):
+        for feature in (self.features if features is None else features):
+            for scenario in feature.scenarios:
+                if not in_shard(get_shard_key(self.features_dir, feature.filename, scenario.name), self.shard):
+                    scenario.mark_skipped()
+
+        return super(ShardRunner, self).run_model(features)
+
+# ################################################################################################################################
+
+def get_result(runner, failed, features_dir, shard=None):
+    """ Returns a JSON-serializable result of a behave run. With sharding, scenarios from other shards,
+    which behave marks as skipped, are left out.
+    """
+    summary = SummaryReporter(runner.config)
+    scenarios = []
+
+    for feature in runner.features:
+        summary.feature_summary[feature.status or 'skipped'] += 1
+
+        for scenario in feature.walk_scenarios():
+            key = get_shard_key(features_dir, feature.filename, scenario.name)
+            if shard and not in_shard(key, shard):
+                continue
+
+            summary.process_scenario(scenario)
+            summary.duration += scenario.duration
+
+            scenarios.append({
+                'key': key,
+                'feature': get_feature_key(features_dir, feature.filename),
+                'location': '{}'.format(scenario.location),
+                'name': scenario.name,
+                'status': scenario.status or 'skipped',
+                'duration': scenario.duration,
+            })
+
+    return {
+        'shard': shard,
+        'failed': failed,
+        'duration': summary.duration,
+        'failed_scenarios': [('{}'.format(scenario.location), scenario.name) for scenario in summary.failed_scenarios],
+        'feature_summary': summary.feature_summary,
+        'scenario_summary': summary.scenario_summary,
+        'step_summary': summary.step_summary,
+        'scenarios': scenarios,
+        'connections': registry.get_stats(),
+        'http': phases.stats.to_dict(),
+    }
+
+def run_units(behave_options, units, features_dir, shard=None, output=None):
+    """ Runs units of work in a single behave runner, with behave's own summary turned off.
+    """
+    conf = Configuration(behave_options)
+    conf.paths = list(chain.from_iterable(unit['paths'] for unit in units))
+    conf.reporters = [reporter for reporter in conf.reporters if not isinstance(reporter, SummaryReporter)]
+
+    if output is not None:
+        conf.outputs = [StreamOpener(stream=output)]
+
+    runner = ShardRunner(conf, features_dir, shard) if shard else Runner(conf)
+    failed = runner.run()
+
+    return get_result(runner, failed, features_dir, shard)
+
+def run_worker(task):
+    """ Runs a group of units in a worker process. Each worker has its own behave runner, step registry and
+    util.context, and its output is buffered so it can be printed in one piece once the worker is done.
+    """
+    util.context.clear()
+
+    output = StringIO()
+    result = run_units(*task, output=output)
+    result['output'] = output.getvalue()
+
+    return result
+
+# ################################################################################################################################
+
+def merge_results(results):
+    """ Merges results of several runs, e.g. from worker processes or CI shards, into one.
+    """
+    merged = {
+        'shard': None,
+        'failed': False,
+        'duration': 0.0,
+        'failed_scenarios': [],
+        'scenarios': [],
+        'connections': {'opened': 0, 'reused': 0},
+        'http': {},
+    }
+
+    for attr in summary_attrs:
+        merged[attr] = {}
+
+    for result in results:
+        for attr in summary_attrs:
+            for status, count in result[attr].items():
+                merged[attr][status] = merged[attr].get(status, 0) + count
+
+        merged['failed'] = merged['failed'] or result['failed']
+        merged['duration'] += result['duration']
+        merged['failed_scenarios'].extend(result['failed_scenarios'])
+        merged['scenarios'].extend(result['scenarios'])
+
+        for key, count in result.get('connections', {}).items():
+            merged['connections'][key] += count
+
+        phases.merge_stats(merged['http'], result.get('http', {}))
+
+    # The same feature may have been run by several shards, count it once.
+    if any(result.get('shard') for result in results):
+        merged['feature_summary'] = get_feature_summary(merged['scenarios'])
+
+    return merged
+
+def get_feature_summary(scenarios):
+    """ Returns feature-level summary computed out of statuses of individual scenarios.
+    """
+    features = {}
+    for scenario in scenarios:
+        features.setdefault(scenario['feature'], set()).add(scenario['status'])
+
+    summary = {'passed': 0, 'failed': 0, 'skipped': 0, 'untested': 0}
+    for statuses in features.values():
+        for status in ('failed', 'passed', 'untested'):
+            if status in statuses:
+                break
+        else:
+            status = 'skipped'
+        summary[status] += 1
+
+    return summary
+
+def print_summary(result):
+    """ Prints a summary of a result in the same format behave uses.
+    """
+    summary = SummaryReporter(None)
+
+    for attr in summary_attrs:
+        getattr(summary, attr).update(result[attr])
+
+    summary.duration = result['duration']
+    summary.failed_scenarios.extend(Bunch(location=location, name=name) for location, name in result['failed_scenarios'])
+    summary.end()
+
+    connections = result.get('connections')
+    if connections and any(connections.values()):
+        sys.stdout.write(get_connections_summary(connections) + '\n')
+
+    phases.report(result.get('http'))
+
+    return summary
+
+def write_result(result, result_file):
+    with open(result_file, 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+
+# ################################################################################################################################
+
+def handle_parallel(behave_options, groups, features_dir, shard):
+    tasks = [(behave_options, group, features_dir, shard) for group in groups]
+    results = []
+
+    # One task per process - behave's step registry is global so a process cannot run more than one runner.
+    pool = Pool(len(tasks), maxtasksperchild=1)
+
+    try:
+        for result in pool.imap_unordered(run_worker, tasks):
+            sys.stdout.write(result.pop('output'))
+            sys.stdout.flush()
+            results.append(result)
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
+
+def handle(path, args=None, workers=1, shard=None, result_file=None):
+    """ Runs features from path/features, optionally spreading them across a pool of worker processes
+    and selecting only a shard of their scenarios. Unless it is a plain run, with one worker, no shard and no result file,
+    durations of features and scenarios are kept in features/timings.sqlite so that subsequent runs can schedule them
+    longest-first. Returns True if any of the features failed.
+    """
+    behave_options = get_behave_options(path, args)
+    features_dir = os.path.join(path, 'features')
+
     conf = Configuration(behave_options)
-    conf.paths = [os.path.join(path, 'features')]
-    runner = Runner(conf)
-    runner.run()
+
+    # Plain run, behave does everything itself and no timings are kept.
+    if workers == 1 and not shard and not result_file:
+        conf.paths = [features_dir]
+        runner = Runner(conf)
+        failed = runner.run()
+        result = get_result(runner, failed, features_dir)
+
+        if any(result['connections'].values()):
+            sys.stdout.write(get_connections_summary(result['connections']) + '\n')
+        phases.report(result['http'])
+
+        return failed
+
+    start = time()
+    history = TimingHistory(features_dir).load()
+    groups = schedule(get_units(conf, features_dir, shard), workers, history.estimate)
+
+    if workers > 1:
+        results = handle_parallel(behave_options, groups, features_dir, shard) if groups else []
+    else:
+        results = [run_units(behave_options, groups[0], features_dir, shard)] if groups else []
+
+    result = merge_results(results)
+    result['shard'] = shard
+    history.update(result['scenarios'], not shard)
+
+    print_summary(result)
+    if workers > 1:
+        sys.stdout.write('Ran in {} workers, wall-clock {:.3f}s\n'.format(len(results), time() - start))
+
+    if result_file:
+        write_result(result, result_file)
+
+    return result['failed']
+
+# ################################################################################################################################
+
+def handle_merge_results(result_files, output=None):
+    """ Merges result files of individual shards into one report and returns True if the merged run failed,
+    including the case of shards missing from input.
+    """
+    results = []
+    for result_file in result_files:
+        with open(result_file) as f:
+            results.append(json.load(f))
+
+    result = merge_results(results)
+    print_summary(result)
+
+    shards = [tuple(elem['shard']) for elem in results if elem.get('shard')]
+    if shards:
+        totals = set(total for _, total in shards)
+        if len(totals) > 1:
+            sys.stdout.write('Shards come from runs of different sizes: {}\n'.format(', '.join(sorted(
+                '{}/{}'.format(*shard) for shard in shards))))
+            result['failed'] = True
+        else:
+            total = totals.pop()
+            missing = sorted(set(range(1, total + 1)) - set(index for index, _ in shards))
+            duplicate = sorted(set(index for index, _ in shards if shards.count((index, total)) > 1))
+
+            if missing:
+                sys.stdout.write('Missing shards: {}\n'.format(', '.join('{}/{}'.format(idx, total) for idx in missing)))
+                result['failed'] = True
+
+            if duplicate:
+                sys.stdout.write('Duplicate shards: {}\n'.format(', '.join('{}/{}'.format(idx, total) for idx in duplicate)))
+                result['failed'] = True
+
+    sys.stdout.write('Verdict: {}\n'.format('FAILED' if result['failed'] else 'OK'))
+
+    if output:
+        write_result(result, output)
+
+    return result['failed']
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from threading import Lock
+
+# Bunch
+from bunch import Bunch
+
+# Request
+from requests import api as req_api
+from requests.adapters import DEFAULT_POOLSIZE
+from requests.compat import cookielib, urlparse
+
+# Zato
+from zato.apitest.phases import get_endpoint, stats, timed, TimedHTTPAdapter
+from zato.apitest.spool import write
+from zato.apitest.util import get_config
+
+# ################################################################################################################################
+
+# Scenarios with this tag always connect anew and close the connection afterwards.
+NO_REUSE_TAG = 'no_connection_reuse'
+
+# ################################################################################################################################
+
+def get_http_config(environment_dir):
+    """ Returns connection pooling options from the [http] stanza of config.ini, e.g.
+
+    [http]
+    pool_size=20
+    keep_alive=False
+    """
+    config = {}
+    if environment_dir:
+        config = get_config(environment_dir).get('http') or {}
+
+    try:
+        pool_size = int(config.get('pool_size', DEFAULT_POOLSIZE))
+    except ValueError:
+        raise ValueError('Invalid pool_size `{}` in [http] in config.ini'.format(config['pool_size']))
+
+    return Bunch(pool_size=pool_size, keep_alive=config.get('keep_alive', 'True').lower() in ('true', 'yes', 'on', '1'))
+
+class SessionRegistry(object):
+    """ Sessions, along with their pools of connections, shared by all requests of a run. There is one session
+    per address and a set of adapters mounted, so that connections opened by a request are kept alive and reused
+    by the following ones to the same address. Sessions keep no cookies - they are shared by scenarios and load threads
+    which must not see each other's cookies, though responses still have their own ones in response.cookies.
+    """
+    def __init__(self):
+        self.sessions = {}
+        self.config = {}
+        self.pools = set()
+        self.lock = Lock()
+
+        # Counters of pools no longer in use
+        self.opened = 0
+        self.requests = 0
+
+    def get_config(self, environment_dir):
+        with self.lock:
+            if environment_dir not in self.config:
+                self.config[environment_dir] = get_http_config(environment_dir)
+            return self.config[environment_dir]
+
+    def new_session(self, pool_size, adapters):
+        session = req_api.sessions.Session()
+        session.cookies.set_policy(cookielib.DefaultCookiePolicy(allowed_domains=[]))
+        session.mount('http://', TimedHTTPAdapter(pool_size, pool_size))
+        session.mount('https://', TimedHTTPAdapter(pool_size, pool_size))
+
+        for adapter in adapters:
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+        return session
+
+    def get_session(self, url, adapters, pool_size):
+        url = urlparse(url)
+        key = (url.scheme, url.netloc, tuple(adapters))
+
+        with self.lock:
+            session = self.sessions.get(key)
+            if not session:
+                session = self.sessions[key] = self.new_session(pool_size, adapters)
+
+        return session
+
+    def request(self, environment_dir, request, adapters=None, reuse=True, spool=None):
+        """ Sends a request built by steps.common.build_request, either through a shared session or a new one
+        which is closed right after the response is read. If a spool file is given, the response's body is streamed
+        to it rather than read into memory. Returns the response and timing of its phases.
+        """
+        adapters = adapters or []
+        config = self.get_config(environment_dir)
+        reuse = reuse and config.keep_alive
+
+        session = self.get_session(request.url, adapters, config.pool_size) if reuse else \
+            self.new_session(config.pool_size, adapters)
+
+        def send(*args, **kwargs):
+            if spool is None:
+                return session.request(*args, **kwargs)
+
+            response = session.request(*args, stream=True, **kwargs)
+            write(response, spool)
+
+            return response
+
+        try:
+            response, timing = timed(send,
+                request.method, request.url, data=request.data, files=request.files, headers=request.headers,
+                auth=request.auth)
+        finally:
+            if not reuse:
+                session.close()
+
+        # Mounted adapters, e.g. in tests, need not use connection pools at all.
+        pool = getattr(response.raw, '_pool', None)
+        if pool is not None:
+            with self.lock:
+                if reuse:
+                    self.pools.add(pool)
+                else:
+                    self.opened += pool.num_connections
+                    self.requests += pool.num_requests
+
+        stats.record(get_endpoint(request.method, request.url), timing)
+
+        return response, timing
+
+    def get_stats(self):
+        """ Returns how many connections were opened and how many requests reused an already opened one.
+        """
+        with self.lock:
+            opened = self.opened + sum(pool.num_connections for pool in self.pools)
+            requests = self.requests + sum(pool.num_requests for pool in self.pools)
+
+        return {'opened': opened, 'reused': max(0, requests - opened)}
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+
+# ################################################################################################################################
+
+# Shared by the whole process, worker processes each have their own.
+registry = SessionRegistry()
+
+def get_connections_summary(stats):
+    return 'HTTP connections: {} opened, {} reused'.format(stats['opened'], stats['reused'])
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import mmap, os
+from contextlib import contextmanager
+from tempfile import TemporaryFile
+
+# ################################################################################################################################
+
+# How much of a streamed response is kept in memory at a time.
+CHUNK_SIZE = 1024 * 1024
+
+# ################################################################################################################################
+
+def new_spool():
+    """ Returns a new spool file for a streamed response's body, removed as soon as it is closed.
+    """
+    return TemporaryFile(prefix='apitest-spool-')
+
+def close(response):
+    """ Closes spool files of a response, and of all responses of a repeated invocation it stands for, if there are any.
+    Called once the response is replaced by another one or its context is dropped.
+    """
+    for item in response.get('responses') or [response]:
+        spool = item.get('spool')
+        if spool:
+            spool.close()
+
+def write(response, spool, chunk_size=CHUNK_SIZE):
+    """ Writes a body of a response sent with stream=True to a spool, chunk by chunk. Returns the number of bytes written.
+    """
+    size = 0
+    for chunk in response.iter_content(chunk_size):
+        spool.write(chunk)
+        size += len(chunk)
+
+    spool.flush()
+    return size
+
+@contextmanager
+def open_map(spool):
+    """ Maps a spool into memory, read-only, so that it can be sliced and hashed without copying it as a whole.
+    Empty spools, which cannot be mapped, become empty strings.
+    """
+    spool.flush()
+
+    if not os.fstat(spool.fileno()).st_size:
+        yield b''
+        return
+
+    body = mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield body
+    finally:
+        body.close()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from threading import Lock
+
+# ################################################################################################################################
+
+# Each power of two is split into this many buckets, hence values are kept with relative precision better than 1%.
+SUB_BUCKET_BITS = 7
+
+# Percentiles included in reports.
+REPORT_PERCENTILES = (50, 90, 95, 99, 99.9)
+
+# ################################################################################################################################
+
+class Histogram(object):
+    """ A log-linear histogram of latencies, in the spirit of HdrHistogram. Values are recorded in microseconds
+    into buckets whose width grows with their magnitude so memory use does not depend on the number of values.
+    Histograms can be merged and serialized, e.g. to be sent over the network.
+    """
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.lock = Lock()
+
+    def _get_bucket(self, value):
+        shift = max(0, value.bit_length() - SUB_BUCKET_BITS - 1)
+        return (value >> shift) << shift, shift
+
+    def record(self, seconds):
+        """ Records a latency given in seconds.
+        """
+        value = max(0, int(round(seconds * 1000000)))
+        bucket, _ = self._get_bucket(value)
+
+        with self.lock:
+            self.counts[bucket] = self.counts.get(bucket, 0) + 1
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """ Adds all values from another histogram to this one.
+        """
+        with self.lock:
+            for bucket, count in other.counts.items():
+                self.counts[bucket] = self.counts.get(bucket, 0) + count
+
+            self.count += other.count
+            self.total += other.total
+
+            if other.count:
+                self.min = other.min if self.min is None else min(self.min, other.min)
+                self.max = other.max if self.max is None else max(self.max, other.max)
+
+        return self
+
+    def percentile(self, percentile):
+        """ Returns the value, in seconds, below which the given percentage of all values falls.
+        The highest value equivalent to the bucket's ones is returned, as long as it is not greater than the maximum.
+        """
+        if not self.count:
+            return 0.0
+
+        threshold = self.count * percentile / 100.0
+        seen = 0
+
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= threshold:
+                _, shift = self._get_bucket(bucket)
+                return min(bucket + (1 << shift) - 1, self.max) / 1000000.0
+
+        return self.max / 1000000.0
+
+    @property
+    def mean(self):
+        return self.total / self.count / 1000000.0 if self.count else 0.0
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'counts': sorted(self.counts.items()),
+                'count': self.count,
+                'total': self.total,
+                'min': self.min,
+                'max': self.max,
+            }
+
+    @staticmethod
+    def from_dict(data):
+        histogram = Histogram()
+        histogram.counts = dict((bucket, count) for bucket, count in data['counts'])
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+
+        return histogram
+
+    def summary(self):
+        """ Returns a one-line human-readable summary of the histogram, in milliseconds.
+        """
+        if not self.count:
+            return 'no data'
+
+        parts = ['min {:.2f}'.format(self.min / 1000.0), 'mean {:.2f}'.format(self.mean * 1000)]
+        parts.extend('p{} {:.2f}'.format(percentile, self.percentile(percentile) * 1000) for percentile in REPORT_PERCENTILES)
+        parts.append('max {:.2f}'.format(self.max / 1000.0))
+
+        return ', '.join(parts)
@@ -13,6 +13,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 from . import common # noqa
 from . import json # noqa
+from . import ndjson # noqa
 from . import xml # noqa
 from . import sql # noqa
 from . import insert_csv # noqa
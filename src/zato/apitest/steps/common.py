@@ -13,12 +13,17 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import ast
-import json
+import hashlib
+import re
 import time
 import os
+from contextlib import contextmanager
+from threading import Event, Thread
 
 # Behave
 from behave import given, when, then
+from behave.model import Step
+from behave.step_registry import registry
 
 # Bunch
 from bunch import Bunch
@@ -27,24 +32,24 @@ from bunch import Bunch
 from datadiff.tools import assert_equals
 
 # jsonpointer
-from jsonpointer import resolve_pointer as get_pointer
+from jsonpointer import JsonPointerException, resolve_pointer as get_pointer, set_pointer
 
 # lxml
 from lxml import etree
 
 # Request
-from requests import api as req_api
 from requests.auth import HTTPBasicAuth
 
 # Zato
-from .. import util
+from .. import fixtures, jsonbackend, jsonstream, sessions, spool, templates, util, xmlstream
 from .. import AUTH, INVALID, NO_VALUE
+from ..stats import Histogram
 
 # ################################################################################################################################
 
-@when('the URL is invoked')
-def when_the_url_is_invoked(ctx, adapters=None):
-    adapters = adapters or []
+def build_request(ctx):
+    """ Returns everything needed to send the request out - method, URL, body, files, headers and auth.
+    """
     method = ctx.zato.request.get('method', 'GET')
     address = ctx.zato.request.get('address')
     url_path = ctx.zato.request.get('url_path', '/')
@@ -54,9 +59,9 @@ def when_the_url_is_invoked(ctx, adapters=None):
 
     if 'data_impl' in ctx.zato.request:
         if ctx.zato.request.is_xml:
-            data = etree.tostring(ctx.zato.request.data_impl)
+            data = render_request(ctx, etree.tostring)
         elif ctx.zato.request.is_json:
-            data = json.dumps(ctx.zato.request.data_impl, indent=2)
+            data = render_request(ctx, lambda data_impl: jsonbackend.dumps(data_impl, **get_json_options(ctx)))
             ctx.zato.request.headers['Content-Type'] = 'application/json'
         elif ctx.zato.request.is_raw:
             data = ctx.zato.request.data_impl
@@ -75,31 +80,383 @@ def when_the_url_is_invoked(ctx, adapters=None):
         if ctx.zato.auth['type'] == AUTH.BASIC_AUTH:
             auth = HTTPBasicAuth(ctx.zato.auth['username'], ctx.zato.auth['password'])
 
-    ctx.zato.response = Bunch()
-
-    s = req_api.sessions.Session()
-    for adapter in adapters:
-        s.mount('http://', adapter)
-        s.mount('https://', adapter)
-
-    ctx.zato.response.data = s.request(
-        method, '{}{}{}'.format(address, url_path, qs), data=data, files=files, headers=ctx.zato.request.headers, auth=auth)
-
+    return Bunch(method=method, url='{}{}{}'.format(address, url_path, qs), data=data, files=files,
+        headers=ctx.zato.request.headers, auth=auth)
+
+def get_json_options(ctx):
+    """ Returns options JSON requests are serialized with, according to the [json] stanza of config.ini,
+    see zato.apitest.jsonbackend.
+    """
+    environment_dir = ctx.zato.get('environment_dir')
+    return jsonbackend.get_serialization(util.get_config(environment_dir).get('json') if environment_dir else None)
+
+def render_request(ctx, serialize):
+    """ Returns the request serialized, rendered from its template if it has one, see given_request_impl.
+    """
+    template = ctx.zato.request.get('template')
+    return template.render(ctx.zato.request.template_values) if template else serialize(ctx.zato.request.data_impl)
+
+def send_request(ctx, request, adapters=None):
+    """ Sends a request and returns the response along with timing of its phases, see zato.apitest.phases,
+    and a spool file the body was written to if the response is streamed, see zato.apitest.spool.
+    Connections are kept alive and reused across steps and scenarios, unless a scenario is tagged
+    with @no_connection_reuse. With the gevent transport, see zato.apitest.transport, the very same code
+    only blocks the current greenlet rather than the whole process.
+    """
+    scenario = getattr(ctx, 'scenario', None)
+    reuse = not (scenario and sessions.NO_REUSE_TAG in scenario.effective_tags)
+    body = spool.new_spool() if ctx.zato.request.get('is_streamed') else None
+
+    response, timing = sessions.registry.request(ctx.zato.get('environment_dir'), request, adapters, reuse, body)
+
+    return response, timing, body
+
+def get_response_format(ctx):
     # if the reply format is unset, assume it's the same as the request format
     # if the request format hasn't been specified either, assume 'RAW"
-    response_format = ctx.zato.request.get('response_format', ctx.zato.request.get('format', 'RAW'))
+    return ctx.zato.request.get('response_format', ctx.zato.request.get('format', 'RAW'))
+
+# Formats responses can be parsed from.
+RESPONSE_FORMATS = ('XML', 'JSON', 'NDJSON', 'RAW', 'FORM')
+
+def parse_response(response_format, response):
+    """ Returns a response's body parsed according to its format, streamed ones are read from their spool files.
+    """
+    body = response.get('spool')
+    if body:
+        body.seek(0)
 
     if response_format == 'XML':
-        ctx.zato.response.data_impl = etree.fromstring(ctx.zato.response.data.text.encode('utf-8'))
+        return etree.parse(body).getroot() if body else etree.fromstring(response.data.text.encode('utf-8'))
 
     elif response_format == 'JSON':
-        ctx.zato.response.data_impl = json.loads(ctx.zato.response.data.text)
+        return jsonbackend.load(body) if body else jsonbackend.loads(response.data.text)
 
-    elif response_format == 'RAW':
-        ctx.zato.response.data_impl = ctx.zato.response.data.text
+    elif response_format == 'NDJSON':
+        return [record for _, record in jsonstream.iter_records(body or response.data.content.splitlines())]
+
+    elif response_format in ('RAW', 'FORM'):
+        return body.read().decode(response.data.encoding or 'utf-8') if body else response.data.text
+
+# Steps checking JSON Pointers in responses, along with the I store one.
+POINTER_STEPS = (re.compile(r'^JSON Pointer "(/[^"]*|)"(?! in request)'), re.compile(r'^I store "(/[^"]*|)" from response'))
 
-    elif response_format == 'FORM':
-        ctx.zato.response.data_impl = ctx.zato.response.data.text
+# Steps checking XPath expressions in responses, along with the I store one.
+XPATH_STEPS = (re.compile(r'^XPath "(/[^"]*)"(?! in request)'), re.compile(r'^I store "(/[^"]*)" from response'))
+
+# Steps setting values at JSON Pointers in requests, requests have holes at those pointers, see zato.apitest.templates.
+REQUEST_POINTER_STEPS = (re.compile(r'^JSON Pointer "(/[^"]*)" in request is'),)
+
+# Steps setting text of elements at XPath expressions in requests, requests have holes at those expressions too.
+REQUEST_XPATH_STEPS = (re.compile(r'^XPath "(/[^"]*)" in request is'),)
+
+# Tells a missing default value and JSON Pointer apart from any actual value, including None
+_nothing = object()
+
+class Response(Bunch):
+    """ A response along with its timing and sizes, as kept in ctx.zato.response. Its body is parsed into data_impl
+    on first access only, so that steps checking status or headers alone do not pay for parsing large bodies.
+    """
+    def __init__(self, response_format, *args, **kwargs):
+        super(Response, self).__init__(*args, **kwargs)
+        object.__setattr__(self, '_response_format', response_format)
+        object.__setattr__(self, '_parsed', {})
+
+    def __contains__(self, key):
+        # Tells whether data_impl can be had without parsing the body, so that any parsing errors are raised on access.
+        if key == 'data_impl' and self._response_format in RESPONSE_FORMATS:
+            return True
+        return super(Response, self).__contains__(key)
+
+    def __missing__(self, key):
+        if key != 'data_impl' or self._response_format not in RESPONSE_FORMATS:
+            raise KeyError(key)
+
+        if key not in self._parsed:
+            self._parsed[key] = parse_response(self._response_format, self)
+
+        return self._parsed[key]
+
+    def get(self, key, default=None):
+        # dict.get does not fall back to __missing__, data_impl would never be parsed otherwise.
+        return self[key] if key in self else default
+
+    def get_pointer(self, path, default=_nothing, prefetch=()):
+        """ Returns a value at a JSON Pointer. Bodies of streamed responses are not parsed as a whole - values
+        at the pointer and at any other ones from prefetch, e.g. ones the scenario checks later on, are extracted
+        from the spool file in a single pass, see zato.apitest.jsonstream, and cached.
+        """
+        if not (self.get('spool') and self._response_format == 'JSON'):
+            return get_pointer(self.data_impl, path) if default is _nothing else get_pointer(self.data_impl, path, default)
+
+        cache = self._parsed.setdefault('pointers', {})
+
+        if path not in cache:
+            paths = [path] + [pointer for pointer in prefetch if pointer not in cache and pointer != path]
+            self.spool.seek(0)
+            found = jsonstream.extract(self.spool, paths)
+
+            for pointer in paths:
+                cache[pointer] = found.get(pointer, _nothing)
+
+        value = cache[path]
+        if value is _nothing:
+            if default is _nothing:
+                raise JsonPointerException('Pointer `{}` not found in response'.format(path))
+            return default
+
+        return value
+
+    def get_xpath(self, path, namespaces, prefetch=()):
+        """ Returns elements matching an XPath expression. Bodies of streamed responses are not parsed into a tree
+        if the expression is one of those zato.apitest.xmlstream evaluates over a stream of elements - elements matching
+        it and any other such expressions from prefetch are extracted from the spool file in a single pass, and cached.
+        """
+        parsed = xmlstream.parse_path(path, namespaces) if self.get('spool') and self._response_format == 'XML' else None
+        if not parsed:
+            return self.data_impl.xpath(path, namespaces=namespaces)
+
+        cache = self._parsed.setdefault('xpaths', {})
+
+        if path not in cache:
+            paths = {path: parsed}
+            for expr in prefetch:
+                if expr not in cache:
+                    parsed = xmlstream.parse_path(expr, namespaces)
+                    if parsed:
+                        paths[expr] = parsed
+
+            self.spool.seek(0)
+            cache.update(xmlstream.extract(self.spool, paths))
+
+        return cache[path]
+
+    def iter_records(self):
+        """ Yields records of an NDJSON body, along with their line numbers, one by one. Streamed responses are read
+        from their spool files line by line, so a record at a time is kept in memory.
+        """
+        if self.get('spool'):
+            self.spool.seek(0)
+            return jsonstream.iter_records(self.spool)
+
+        return jsonstream.iter_records(self.data.content.splitlines())
+
+    def copy(self):
+        """ Copies share the body once parsed.
+        """
+        out = Response(self._response_format, self)
+        object.__setattr__(out, '_parsed', self._parsed)
+
+        return out
+
+def get_scenario_paths(ctx, patterns):
+    """ Returns JSON Pointers or XPath expressions, depending on patterns, the scenario's steps check in responses,
+    less ones whose values are obtained from config sources only when the steps run.
+    """
+    scenario = getattr(ctx, 'scenario', None)
+    paths = []
+
+    for step in (scenario.all_steps if scenario else []):
+        for pattern in patterns:
+            match = pattern.match(step.name)
+            if match:
+                paths.append(match.group(1))
+
+    return paths
+
+def get_response_pointer(ctx, path, *default):
+    """ Returns a value at a JSON Pointer in the current response.
+    """
+    response = ctx.zato.response
+    if isinstance(response, Response):
+        return response.get_pointer(path, *default, prefetch=get_scenario_paths(ctx, POINTER_STEPS))
+
+    return get_pointer(response.data_impl, path, *default)
+
+def get_response_xpath(ctx, path):
+    """ Returns elements matching an XPath expression in the current response.
+    """
+    response = ctx.zato.response
+    namespaces = ctx.zato.request.ns_map
+
+    if isinstance(response, Response):
+        return response.get_xpath(path, namespaces, prefetch=get_scenario_paths(ctx, XPATH_STEPS))
+
+    return response.data_impl.xpath(path, namespaces=namespaces)
+
+def new_response(ctx, response, timing, body=None):
+    """ Returns a response along with its timing and sizes, its body is parsed when first needed.
+    """
+    out = Response(get_response_format(ctx))
+    out.data = response
+    out.spool = body
+    out.timing = timing.get_phases()
+    out.bytes_sent = timing.bytes_sent
+    out.bytes_received = timing.bytes_received
+
+    return out
+
+def get_times(times):
+    times = int(times)
+    if times < 1:
+        raise ValueError('Number of invocations must be a positive integer, `{}` given'.format(times))
+    return times
+
+def set_response(ctx, response):
+    """ Makes a response the current one, spool files of the one it replaces are closed.
+    """
+    if ctx.zato.get('response'):
+        spool.close(ctx.zato.response)
+
+    ctx.zato.response = response
+
+def set_responses(ctx, responses):
+    """ Keeps all responses of a repeated invocation, with response times in a histogram that percentile steps
+    check against. The last response becomes the current one for any other assertions.
+    """
+    histogram = Histogram()
+    for response in responses:
+        histogram.record(response.timing.total)
+
+    response = responses[-1].copy()
+    response.responses = responses
+    response.histogram = histogram
+
+    set_response(ctx, response)
+
+def get_responses(ctx):
+    """ Returns all responses of the latest invocation, repeated or not.
+    """
+    return ctx.zato.response.get('responses') or [ctx.zato.response]
+
+def set_invocation(ctx, invoke):
+    """ Records how the current response was obtained, so that then_within_seconds can invoke the URL again
+    the very same way, e.g. concurrently or with all requests of a table.
+    """
+    ctx.zato.invocation = invoke
+
+def invoke_url(ctx, adapters=None):
+    """ Sends the current request and returns its response, which does not become the current one.
+    """
+    request = build_request(ctx)
+    return new_response(ctx, *send_request(ctx, request, adapters))
+
+@when('the URL is invoked')
+def when_the_url_is_invoked(ctx, adapters=None):
+    set_response(ctx, invoke_url(ctx, adapters))
+    set_invocation(ctx, lambda: when_the_url_is_invoked(ctx, adapters))
+
+@when('the URL is invoked "{times}" times')
+@util.obtain_values
+def when_the_url_is_invoked_times(ctx, times, adapters=None):
+    """ Invokes the URL a number of times in a row.
+    """
+    responses = [invoke_url(ctx, adapters) for _ in range(get_times(times))]
+    set_responses(ctx, responses)
+    set_invocation(ctx, lambda: when_the_url_is_invoked_times(ctx, times, adapters))
+
+def send_requests(ctx, requests, adapters=None):
+    """ Sends requests at once, each from its own thread, or greenlet with the gevent transport, all of them
+    released together once started. Returns what send_request does for each of them, in the same order.
+    The first error, if any, is re-raised.
+    """
+    results = [None] * len(requests)
+    errors = []
+    start = Event()
+
+    def invoke(idx):
+        start.wait()
+        try:
+            results[idx] = send_request(ctx, requests[idx], adapters)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [Thread(target=invoke, args=(idx,)) for idx in range(len(requests))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    start.set()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+    return results
+
+@when('the URL is invoked "{times}" times concurrently')
+@util.obtain_values
+def when_the_url_is_invoked_times_concurrently(ctx, times, adapters=None):
+    """ Sends the same request a number of times at once.
+    """
+    request = build_request(ctx)
+    results = send_requests(ctx, [request] * get_times(times), adapters)
+
+    set_responses(ctx, [new_response(ctx, *result) for result in results])
+    set_invocation(ctx, lambda: when_the_url_is_invoked_times_concurrently(ctx, times, adapters))
+
+# Columns of tables listing requests to invoke concurrently, path is the only one required.
+TABLE_COLUMNS = ('path', 'method', 'request', 'response')
+
+def get_table_context(ctx, row):
+    """ Returns a context for a single row of a table of requests - a copy of the current one, less its body,
+    with the row's URL path, method and, if given, request from a file.
+    """
+    for column in row.headings:
+        if column not in TABLE_COLUMNS:
+            raise ValueError('Unknown column `{}`, should be one of {}'.format(column, ', '.join(TABLE_COLUMNS)))
+
+    if not row.get('path'):
+        raise ValueError('Column `path` is required in each row')
+
+    row_ctx = Bunch(zato=Bunch(ctx.zato))
+    row_ctx.zato.request = Bunch((key, value) for key, value in ctx.zato.request.items()
+        if key not in ('data', 'data_impl', 'template', 'template_values', 'form', 'files'))
+    row_ctx.zato.request.headers = dict(ctx.zato.request.get('headers') or {})
+    row_ctx.zato.request.url_path = util.obtain_value(ctx, row['path'])
+
+    if row.get('method'):
+        row_ctx.zato.request.method = util.obtain_value(ctx, row['method'])
+
+    if row.get('request'):
+        given_request_impl(row_ctx, util.get_data(row_ctx, 'request', util.obtain_value(ctx, row['request'])))
+
+    return row_ctx
+
+@when('the URLs are invoked concurrently')
+def when_the_urls_are_invoked_concurrently(ctx, adapters=None):
+    """ Invokes requests listed in a table at once, e.g.
+
+    When the URLs are invoked concurrently
+      | path      | method | request       | response |
+      | /customer | POST   | customer.json | customer |
+      | /invoice  | GET    |               | invoice  |
+
+    Each request shares address, format, headers and auth, but not body, with the current one. Responses are parsed and stored
+    under names from the `response` column in user_ctx and can be checked as a set, like ones of a repeated invocation.
+    """
+    if not getattr(ctx, 'table', None):
+        raise ValueError('A table of requests is required')
+
+    invoke_table(ctx, ctx.table, adapters)
+
+def invoke_table(ctx, table, adapters=None):
+    """ Invokes requests listed in a table at once, see when_the_urls_are_invoked_concurrently. The table is kept
+    along with the invocation, steps retried by then_within_seconds have tables of their own, if any.
+    """
+    contexts = [get_table_context(ctx, row) for row in table]
+    results = send_requests(ctx, [build_request(row_ctx) for row_ctx in contexts], adapters)
+
+    responses = []
+    for row, row_ctx, result in zip(table, contexts, results):
+        response = new_response(row_ctx, *result)
+        if row.get('response'):
+            ctx.zato.user_ctx[row['response']] = response.data_impl
+        responses.append(response)
+
+    set_responses(ctx, responses)
+    set_invocation(ctx, lambda: invoke_table(ctx, table, adapters))
 
 # ################################################################################################################################
 
@@ -140,6 +497,10 @@ def given_request_format(ctx, format):
 def given_response_format(ctx, format):
     ctx.zato.request.response_format = format
 
+@given('response is streamed')
+def given_response_is_streamed(ctx):
+    ctx.zato.request.is_streamed = True
+
 @given('user agent is "{value}"')
 @util.obtain_values
 def given_user_agent_is(ctx, value):
@@ -150,16 +511,56 @@ def given_user_agent_is(ctx, value):
 def given_header(ctx, header, value):
     ctx.zato.request.headers[header] = value
 
+def get_request_template(ctx, format):
+    """ Returns a template of the current request, with holes at JSON Pointers or XPath expressions the scenario's steps
+    set values at, or None if there are no such steps or the request cannot have holes at all of the paths.
+    """
+    if format == 'JSON':
+        paths = get_scenario_paths(ctx, REQUEST_POINTER_STEPS)
+        return templates.get_template(format, ctx.zato.request.data, paths, **get_json_options(ctx)) if paths else None
+
+    paths = get_scenario_paths(ctx, REQUEST_XPATH_STEPS)
+    return templates.get_template(format, ctx.zato.request.data, paths, ctx.zato.request.ns_map) if paths else None
+
+def get_request_data_impl(ctx):
+    """ Returns the request parsed. A request rendered from a template is parsed only now, with values set so far,
+    and is no longer rendered from the template.
+    """
+    request = ctx.zato.request
+    template = request.pop('template', None)
+
+    if template:
+        request.data_impl = fixtures.cache.parse(request.data, template.format)
+
+        for path, value in request.pop('template_values').items():
+            if template.format == 'JSON':
+                set_pointer(request.data_impl, path, value)
+            else:
+                request.data_impl.xpath(path, namespaces=template.namespaces)[0].text = value
+
+    return request.data_impl
+
 def given_request_impl(ctx, data):
 
     ctx.zato.request.data = data
+    ctx.zato.request.pop('template', None)
+
+    # The same request, e.g. one from a file used by many scenarios, is parsed once and each of them is given a copy of it.
+    # If the scenario's steps set values in it, it is not even parsed but values are spliced into a template instead,
+    # compiled once too, when the request is sent, unless any other step needs the request parsed after all.
+    if ctx.zato.request.get('is_xml') or ctx.zato.request.get('is_json'):
+        format = 'XML' if ctx.zato.request.get('is_xml') else 'JSON'
+        template = get_request_template(ctx, format)
+
+        if template:
+            ctx.zato.request.template = template
+            ctx.zato.request.template_values = {}
+            ctx.zato.request.data_impl = None
+        else:
+            ctx.zato.request.data_impl = fixtures.cache.parse(ctx.zato.request.data, format)
 
-    if ctx.zato.request.get('is_xml'):
-        ctx.zato.request.data_impl = etree.fromstring(ctx.zato.request.data)
-    elif ctx.zato.request.get('is_json'):
-        ctx.zato.request.data_impl = json.loads(ctx.zato.request.data)
     elif ctx.zato.request.get('is_raw'):
-        ctx.zato.request.data_impl = ctx.zato.request.data
+        ctx.zato.request.data_impl = fixtures.get_view(ctx.zato.request.data)
     else:
         if not ctx.zato.request.format:
             raise ValueError('Format not set, cannot proceed')
@@ -281,6 +682,98 @@ def then_status_is(ctx, expected_status):
         expected_status, ctx.zato.response.data.status_code)
     return True
 
+@then('all statuses are "{expected_status}"')
+@util.obtain_values
+def then_all_statuses_are(ctx, expected_status):
+    expected_status = int(expected_status)
+    statuses = [response.data.status_code for response in get_responses(ctx)]
+    assert all(status == expected_status for status in statuses), 'Statuses expected `{!r}`, received `{!r}`'.format(
+        expected_status, sorted(statuses))
+    return True
+
+@then('exactly "{count}" status is "{expected_status}"')
+@then('exactly "{count}" statuses are "{expected_status}"')
+@util.obtain_values
+def then_exactly_count_statuses_are(ctx, count, expected_status):
+    count, expected_status = int(count), int(expected_status)
+    statuses = [response.data.status_code for response in get_responses(ctx)]
+    actual = statuses.count(expected_status)
+    assert actual == count, 'Expected `{}` responses with status `{!r}`, received `{}` among `{!r}`'.format(
+        count, expected_status, actual, sorted(statuses))
+    return True
+
+@contextmanager
+def get_body(ctx):
+    """ Yields the current response's body as bytes, memory-mapped from its spool file if it was streamed.
+    """
+    if ctx.zato.response.get('spool'):
+        with spool.open_map(ctx.zato.response.spool) as body:
+            yield body
+    else:
+        yield ctx.zato.response.data.content
+
+def assert_bytes_at(ctx, offset, expected):
+    with get_body(ctx) as body:
+        offset = int(offset)
+        if offset < 0:
+            offset += len(body)
+
+        actual = body[offset:offset + len(expected)]
+
+    assert actual == expected, 'Bytes at `{}` expected `{!r}`, received `{!r}`'.format(offset, expected, actual)
+    return True
+
+@then('response size is "{size}"')
+@util.obtain_values
+def then_response_size_is(ctx, size):
+    with get_body(ctx) as body:
+        actual = len(body)
+
+    assert actual == int(size), 'Response size expected `{}`, received `{}`'.format(size, actual)
+    return True
+
+@then('response SHA-256 is "{digest}"')
+@util.obtain_values
+def then_response_sha256_is(ctx, digest):
+    with get_body(ctx) as body:
+        actual = hashlib.sha256(body).hexdigest()
+
+    assert actual == digest.lower(), 'Response SHA-256 expected `{}`, received `{}`'.format(digest, actual)
+    return True
+
+@then('response bytes at "{offset}" are "{value}"')
+@util.obtain_values
+def then_response_bytes_at_are(ctx, offset, value):
+    return assert_bytes_at(ctx, offset, value.encode('utf-8'))
+
+@then('response bytes at "{offset}" are equal to that from "{path}"')
+@util.obtain_values
+def then_response_bytes_at_are_equal_to_that_from(ctx, offset, path):
+    with open(util.get_full_path(ctx.zato.environment_dir, get_response_format(ctx).lower(), 'response', path), 'rb') as f:
+        expected = f.read()
+
+    return assert_bytes_at(ctx, offset, expected)
+
+@then('response time is less than "{max_time}" ms')
+@util.obtain_values
+def then_response_time_is_less_than(ctx, max_time):
+    actual = ctx.zato.response.timing.total * 1000
+    assert actual < float(max_time), 'Response time expected to be less than `{}` ms, was `{:.2f}` ms'.format(
+        max_time, actual)
+    return True
+
+@then('p{percentile} response time is less than "{max_time}" ms')
+@util.obtain_values
+def then_percentile_response_time_is_less_than(ctx, percentile, max_time):
+    histogram = ctx.zato.response.get('histogram')
+    if not histogram:
+        raise ValueError('No response times to compute p{} from, is the URL invoked "N" times first?'.format(percentile))
+
+    actual = histogram.percentile(float(percentile)) * 1000
+    assert actual < float(max_time), 'p{} response time expected to be less than `{}` ms, was `{:.2f}` ms ({})'.format(
+        percentile, max_time, actual, histogram.summary())
+    return True
+
 @then('header "{expected_header}" is "{expected_value}"')
 @util.obtain_values
 def then_header_is(ctx, expected_header, expected_value):
@@ -379,7 +872,7 @@ def then_header_doesnt_end_with(ctx, expected_header, expected_value):
 @util.obtain_values
 def then_store_path_under_name_with_default(ctx, path, name, default):
     if ctx.zato.request.is_xml:
-        value = ctx.zato.response.data_impl.xpath(path)
+        value = get_response_xpath(ctx, path)
         if value:
             if len(value) == 1:
                 value = value[0].text
@@ -391,7 +884,7 @@ def then_store_path_under_name_with_default(ctx, path, name, default):
             else:
                 value = default
     else:
-        value = get_pointer(ctx.zato.response.data_impl, path, default)
+        value = get_response_pointer(ctx, path, default)
         if value == NO_VALUE:
             raise ValueError('No such path `{}`'.format(path))
 
@@ -419,13 +912,13 @@ def json_response_is_equal_to(ctx, expected):
 @needs_json
 @util.obtain_values
 def then_response_is_equal_to_that_from(ctx, path):
-    return json_response_is_equal_to(ctx, json.loads(util.get_data(ctx, 'response', path)))
+    return json_response_is_equal_to(ctx, util.get_parsed_data(ctx, 'response', path, 'JSON'))
 
 @then('response is equal to "{expected}"')
 @needs_json
 @util.obtain_values
 def then_response_is_equal_to(ctx, expected):
-    return json_response_is_equal_to(ctx, json.loads(expected))
+    return json_response_is_equal_to(ctx, jsonbackend.loads(expected))
 
 # ################################################################################################################################
 
@@ -433,6 +926,51 @@ def then_response_is_equal_to(ctx, expected):
 @util.obtain_values
 def then_i_sleep_for(ctx, sleep_time):
     time.sleep(float(sleep_time))
+
+def get_step(ctx, step):
+    """ Returns a function running a step given as text, without its keyword, the same way behave would run it
+    in a Then clause. Raises ValueError right away if there is no such step.
+    """
+    match = registry.find_match(Step('<retried>', 0, 'Then', 'then', step))
+    if not match:
+        raise ValueError('Undefined step `Then {}`'.format(step))
+
+    args = [arg.value for arg in match.arguments if arg.name is None]
+    kwargs = dict((arg.name, arg.value) for arg in match.arguments if arg.name is not None)
+
+    return lambda: match.func(ctx, *args, **kwargs)
+
+def retry_step(ctx, timeout, step, before_retry=None):
+    """ Retries a step until it passes within timeout. How long it took and in how many attempts is kept
+    in ctx.zato.retries, for each step retried in the scenario.
+    """
+    config = util.get_retry_config(ctx.zato.get('environment_dir'))
+    elapsed, attempts = util.eventually(get_step(ctx, step), float(util.obtain_value(ctx, timeout)),
+        config.initial_delay, config.max_delay, config.factor, before_retry)
+
+    ctx.zato.setdefault('retries', []).append(Bunch(step=step, elapsed=elapsed, attempts=attempts))
+
+    return True
+
+@then('within "{timeout}" seconds, {step}')
+def then_within_seconds(ctx, timeout, step):
+    """ Retries a step until it passes, with backoff configured in config.ini's [retry] stanza, invoking the URL
+    again before each retry, if it was invoked in the scenario already, so that the step checks a fresh response.
+    The URL is invoked the same way the current response was obtained, e.g. a number of times concurrently.
+    """
+    def before_retry():
+        invocation = ctx.zato.get('invocation')
+        if invocation:
+            invocation()
+
+    return retry_step(ctx, timeout, step, before_retry)
+
+@then('retrying for "{timeout}" seconds, {step}')
+def then_retrying_for_seconds(ctx, timeout, step):
+    """ Retries a step until it passes, with backoff configured in config.ini's [retry] stanza. Meant for steps
+    that fetch what they check on their own, e.g. from a database, hence the URL is not invoked again.
+    """
+    return retry_step(ctx, timeout, step)
     
 # ################################################################################################################################
 
@@ -21,14 +21,13 @@ from behave import given, then
 from datadiff.tools import assert_equals
 
 # jsonpointer
-from jsonpointer import resolve_pointer as get_pointer, set_pointer as _set_pointer
+from jsonpointer import set_pointer as _set_pointer
 
 # json
-from .common import needs_json
-import json
+from .common import get_request_data_impl, get_response_pointer, needs_json
 
 # Zato
-from .. import util
+from .. import jsonbackend, util
 from .. import INVALID
 
 import uuid
@@ -46,7 +45,12 @@ def set_pointer(ctx, path, value):
     if 'data_impl' not in ctx.zato.request:
         raise ValueError('JSON Pointer called but no request set')
 
-    _set_pointer(ctx.zato.request.data_impl, path, value)
+    template = ctx.zato.request.get('template')
+
+    if template and path in template.paths:
+        ctx.zato.request.template_values[path] = value
+    else:
+        _set_pointer(get_request_data_impl(ctx), path, value)
 
 # ################################################################################################################################
 
@@ -134,7 +138,7 @@ def assert_value(ctx, path, value, wrapper=None):
         raise ValueError('Assertion called but no format set')
 
     value = wrapper(value) if wrapper else value
-    actual = get_pointer(ctx.zato.response.data_impl, path)
+    actual = get_response_pointer(ctx, path)
     assert_equals(value, actual)
     return True
 
@@ -147,13 +151,13 @@ def then_json_pointer_is(ctx, path, value):
 @needs_json
 @util.obtain_values
 def then_json_pointer_is_json(ctx, path, value):
-    return assert_value(ctx, path, json.loads(value))
+    return assert_value(ctx, path, jsonbackend.loads(value))
 
 @then('JSON Pointer "{path}" is JSON equal to that from "{value}"')
 @needs_json
 @util.obtain_values
 def then_json_pointer_is_json_equal_to_that_from(ctx, path, value):
-    return assert_value(ctx, path, json.loads(util.get_data(ctx, 'response', value)))
+    return assert_value(ctx, path, util.get_parsed_data(ctx, 'response', value, 'JSON'))
 
 @then('JSON Pointer "{path}" is an integer "{value}"')
 @util.obtain_values
@@ -163,7 +167,7 @@ def then_json_pointer_is_an_integer(ctx, path, value):
 @then('JSON Pointer "{path}" is any integer')
 @util.obtain_values
 def then_json_pointer_is_any_integer(ctx, path):
-    actual = get_pointer(ctx.zato.response.data_impl, path)
+    actual = get_response_pointer(ctx, path)
     assert isinstance(actual, int_types), \
         'Expected an integer in {}, got a `{}`'.format(path, type(actual))
     return True
@@ -176,7 +180,7 @@ def then_json_pointer_is_a_float(ctx, path, value):
 @then('JSON Pointer "{path}" is any float')
 @util.obtain_values
 def then_json_pointer_is_any_float(ctx, path):
-    actual = get_pointer(ctx.zato.response.data_impl, path)
+    actual = get_response_pointer(ctx, path)
     assert isinstance(actual, float), \
         'Expected a float in {}, got a `{}`'.format(path, type(actual))
     return True
@@ -194,27 +198,27 @@ def then_json_pointer_is_empty(ctx, path):
 @then('JSON Pointer "{path}" isn\'t empty')
 @util.obtain_values
 def then_json_pointer_isnt_empty(ctx, path):
-    actual = get_pointer(ctx.zato.response.data_impl, path, INVALID)
+    actual = get_response_pointer(ctx, path, INVALID)
     assert actual != INVALID, 'Path `{}` Should not be empty'.format(path)
 
 @then('JSON Pointer "{path}" is one of "{value}"')
 @util.obtain_values
 def then_json_pointer_is_one_of(ctx, path, value):
-    actual = get_pointer(ctx.zato.response.data_impl, path)
+    actual = get_response_pointer(ctx, path)
     value = util.parse_list(value)
     assert actual in value, 'Expected for `{}` ({}) to be in `{}`'.format(actual, path, value)
 
 @then('JSON Pointer "{path}" isn\'t one of "{value}"')
 @util.obtain_values
 def then_json_pointer_isnt_one_of(ctx, path, value):
-    actual = get_pointer(ctx.zato.response.data_impl, path)
+    actual = get_response_pointer(ctx, path)
     value = util.parse_list(value)
     assert actual not in value, 'Expected for `{}` ({}) not to be in `{}`'.format(actual, path, value)
 
 @then('JSON Pointer "{path}" is a BASE32 Crockford, checksum "{checksum}"')
 @util.obtain_values
 def then_json_pointer_is_a_base32_crockford(ctx, path, checksum):
-    actual = get_pointer(ctx.zato.response.data_impl, path)
+    actual = get_response_pointer(ctx, path)
     crockford_decode(actual.replace('-', ''), checksum.lower() == 'true')
 
 # ###############################################################################################################################
@@ -242,13 +246,13 @@ def then_json_pointer_is_an_empty_dict(ctx, path):
 @then('JSON Pointer "{path}" isn\'t a string "{value}"')
 @util.obtain_values
 def then_json_pointer_isnt_a_string(ctx, path, value):
-    actual = get_pointer(ctx.zato.response.data_impl, path)
+    actual = get_response_pointer(ctx, path)
     assert actual != value, 'Expected `{}` != `{}`'.format(actual, value)
 
 # ###############################################################################################################################
 
 def _then_json_pointer_contains(ctx, path, expected):
-    actual_list = get_pointer(ctx.zato.response.data_impl, path)
+    actual_list = get_response_pointer(ctx, path)
 
     for item in actual_list:
         try:
@@ -263,11 +267,11 @@ def _then_json_pointer_contains(ctx, path, expected):
 @then('JSON Pointer "{path}" contains "{value}"')
 @util.obtain_values
 def then_json_pointer_contains(ctx, path, value):
-    return _then_json_pointer_contains(ctx, path, json.loads(value))
+    return _then_json_pointer_contains(ctx, path, jsonbackend.loads(value))
 
 @then('JSON Pointer "{path}" contains data from "{value}"')
 @util.obtain_values
 def then_json_pointer_contains_data_from(ctx, path, value):
-    return _then_json_pointer_contains(ctx, path, json.loads(util.get_data(ctx, 'response', value)))
+    return _then_json_pointer_contains(ctx, path, util.get_parsed_data(ctx, 'response', value, 'JSON'))
 
 # ###############################################################################################################################
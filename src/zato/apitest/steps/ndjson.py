@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# Behave
+from behave import then
+
+# jsonpointer
+from jsonpointer import resolve_pointer as get_pointer
+
+# jsonschema
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+# Zato
+from .. import util
+from .common import get_response_format
+
+# ################################################################################################################################
+
+# Tells records without a JSON Pointer apart from ones with None under it
+_missing = object()
+
+def needs_ndjson(func):
+    def inner(ctx, **kwargs):
+        if get_response_format(ctx) != 'NDJSON':
+            raise TypeError('This step works with NDJSON replies only.')
+        return func(ctx, **kwargs)
+    return inner
+
+def iter_records(ctx):
+    """ Yields records of the current response along with their line numbers, failing if there are none at all
+    so that steps checking every record do not pass with an empty response.
+    """
+    is_empty = True
+
+    for number, record in ctx.zato.response.iter_records():
+        is_empty = False
+        yield number, record
+
+    assert not is_empty, 'No records in response'
+
+# ################################################################################################################################
+
+@then('response has "{count}" records')
+@needs_ndjson
+@util.obtain_values
+def then_response_has_records(ctx, count):
+    actual = sum(1 for _ in ctx.zato.response.iter_records())
+    assert actual == int(count), 'Expected for response to have `{}` records instead of `{}`'.format(count, actual)
+    return True
+
+@then('every record has JSON Pointer "{path}"')
+@needs_ndjson
+@util.obtain_values
+def then_every_record_has_json_pointer(ctx, path):
+    for number, record in iter_records(ctx):
+        assert get_pointer(record, path, _missing) is not _missing, 'No JSON Pointer `{}` in record `{}` in line {}'.format(
+            path, record, number)
+    return True
+
+@then('some record is equal to that from "{path}"')
+@needs_ndjson
+@util.obtain_values
+def then_some_record_is_equal_to_that_from(ctx, path):
+    """ Looks for a record equal to the JSON document from a file, reading no further than up to the first such one.
+    """
+    expected = util.get_parsed_data(ctx, 'response', path, 'JSON')
+
+    for _, record in iter_records(ctx):
+        if record == expected:
+            return True
+
+    raise AssertionError('No record equal to `{}` from `{}`'.format(expected, path))
+
+@then('every record is valid against schema "{path}"')
+@needs_ndjson
+@util.obtain_values
+def then_every_record_is_valid_against_schema(ctx, path):
+    """ Validates each record against a JSON Schema from a file, the first error, if any, is reported along with the record's
+    line number. The schema is checked and its validator is created once for all records.
+    """
+    schema = util.get_parsed_data(ctx, 'response', path, 'JSON')
+
+    validator = validator_for(schema)
+    validator.check_schema(schema)
+    validator = validator(schema)
+
+    for number, record in iter_records(ctx):
+        error = best_match(validator.iter_errors(record))
+        assert error is None, 'Record `{}` in line {} is not valid against schema from `{}`: {}'.format(
+            record, number, path, error.message)
+
+    return True
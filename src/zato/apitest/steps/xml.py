@@ -18,7 +18,9 @@ from behave import given, then
 from lxml import etree
 
 # Zato
-from .. import util
+from .. import PathNotFound, util
+from ..templates import TextHole
+from .common import get_request_data_impl, get_response_xpath
 
 # ################################################################################################################################
 
@@ -39,12 +41,22 @@ def handle_xpath(is_request):
         def inner(ctx, **kwargs):
             xpath = kwargs.pop('xpath', kwargs.pop('elem', None))
 
-            data = ctx.zato.request.data if is_request else ctx.zato.response.data.text
-            data_impl = ctx.zato.request.data_impl if is_request else ctx.zato.response.data_impl
+            if is_request:
+                data = ctx.zato.request.data
+                template = ctx.zato.request.get('template')
+
+                # Text set at holes of templates is spliced into requests, see zato.apitest.templates
+                if template and xpath in template.paths and template.namespaces == ctx.zato.request.ns_map:
+                    elem = [TextHole(ctx.zato.request.template_values, xpath)]
+                else:
+                    elem = get_request_data_impl(ctx).xpath(xpath, namespaces=ctx.zato.request.ns_map)
+            else:
+                # Bodies of streamed responses are not read back in full only to be included in error messages
+                data = '(streamed response)' if ctx.zato.response.get('spool') else ctx.zato.response.data.text
+                elem = get_response_xpath(ctx, xpath)
 
-            elem = data_impl.xpath(xpath, namespaces=ctx.zato.request.ns_map)
             if elem is None or (isinstance(elem, list) and not elem):
-                raise ValueError('No `{}` path in `{}` with NS map `{}`'.format(xpath, data, ctx.zato.request.ns_map))
+                raise PathNotFound('No `{}` path in `{}` with NS map `{}`'.format(xpath, data, ctx.zato.request.ns_map))
 
             if len(elem) > 1:
                 raise ValueError(
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import re
+from uuid import uuid4
+from xml.sax.saxutils import escape
+
+# jsonpointer
+from jsonpointer import JsonPointer, JsonPointerException
+
+# lxml
+from lxml import etree
+
+# six
+from six import binary_type
+
+# Zato
+from zato.apitest import fixtures, jsonbackend, xmlstream
+
+# ################################################################################################################################
+
+# How many templates, compiled by get_template, are kept at most, they are all dropped once there are more.
+TEMPLATE_CACHE_SIZE = 1000
+
+# Templates already compiled by get_template
+_templates = {}
+
+# Characters lxml does not accept in text of elements
+_xml_invalid = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# ################################################################################################################################
+
+class Template(object):
+    """ A request serialized once, with holes at paths, i.e. JSON Pointers or XPath expressions, whose values steps set,
+    so that the request can be rendered by splicing serialized values into it rather than by serializing it in whole.
+    Holes of paths with no values set are filled with what the request had at them originally.
+    """
+    def __init__(self, format, fragments, slots, namespaces=None):
+        self.format = format
+        self.fragments = fragments   # Serialized parts of the request between holes, there is one more of them than of holes
+        self.slots = slots           # Path, function serializing a value and the original value serialized, for each hole
+        self.namespaces = namespaces # Prefixes XPath expressions were evaluated with
+
+        self.paths = set(path for path, _, _ in slots)
+
+    def render(self, values):
+        """ Returns the request serialized, with values, keyed by their paths, spliced into it.
+        """
+        out = [self.fragments[0]]
+
+        for (path, serialize, original), fragment in zip(self.slots, self.fragments[1:]):
+            out.append(serialize(values[path]) if path in values else original)
+            out.append(fragment)
+
+        return self.fragments[0][:0].join(out)
+
+# ################################################################################################################################
+
+def _split(data, placeholder, count):
+    """ Splits serialized data around count placeholders, matched by a pattern capturing their numbers, returning
+    the fragments between them and the numbers in order, or None if any placeholder is missing or found more than once.
+    """
+    parts = re.split(placeholder, data)
+    fragments, numbers = parts[::2], [int(number) for number in parts[1::2]]
+
+    if sorted(numbers) != list(range(count)):
+        return None
+
+    return fragments, numbers
+
+# ################################################################################################################################
+
+def _json_serializer(fragment, **dumps_kwargs):
+    """ Returns a function serializing values for a hole right after fragment, indenting them as deep as the hole is.
+    """
+    line = fragment[fragment.rfind('\n') + 1:]
+    indent = '\n' + line[:len(line) - len(line.lstrip(' '))]
+
+    if dumps_kwargs.get('indent') is None:
+        return lambda value: jsonbackend.dumps(value, **dumps_kwargs)
+
+    return lambda value: jsonbackend.dumps(value, **dumps_kwargs).replace('\n', indent)
+
+def compile_json(doc, pointers, **dumps_kwargs):
+    """ Compiles a parsed JSON document into a template with holes at JSON Pointers, serialized with jsonbackend.dumps
+    and dumps_kwargs. The document is modified in place. Returns None unless each of the pointers points to a value
+    the document already has and none of them points into a value at another one.
+    """
+    pointers = sorted(set(pointers))
+    token = uuid4().hex
+    originals = []
+
+    for idx, pointer in enumerate(pointers):
+        if idx and pointer.startswith(pointers[idx - 1] + '/'):
+            return None
+
+        try:
+            parent, part = JsonPointer(pointer).to_last(doc)
+        except (JsonPointerException, TypeError):
+            return None
+
+        if isinstance(parent, dict):
+            if part not in parent:
+                return None
+        elif not (isinstance(parent, list) and isinstance(part, int) and part < len(parent)):
+            return None
+
+        originals.append(parent[part])
+        parent[part] = '{}{}'.format(token, idx)
+
+    split = _split(jsonbackend.dumps(doc, **dumps_kwargs), '"{}([0-9]+)"'.format(token), len(pointers))
+    if not split:
+        return None
+
+    fragments, numbers = split
+    slots = []
+
+    for fragment, idx in zip(fragments, numbers):
+        serialize = _json_serializer(fragment, **dumps_kwargs)
+        slots.append((pointers[idx], serialize, serialize(originals[idx])))
+
+    return Template('JSON', fragments, slots)
+
+# ################################################################################################################################
+
+def serialize_xml_text(value):
+    """ Serializes text of an element the way lxml does, accepting and rejecting the same values, e.g. byte strings
+    other than ASCII are rejected.
+    """
+    if isinstance(value, binary_type):
+        try:
+            value = value.decode('ascii')
+        except UnicodeDecodeError:
+            value = None
+
+    if value is None or _xml_invalid.search(value):
+        raise ValueError('All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters')
+
+    return escape(value, {'\r': '&#13;'}).encode('ascii', 'xmlcharrefreplace')
+
+def compile_xml(doc, paths, namespaces):
+    """ Compiles a parsed XML document into a template with holes at text of elements at XPath expressions, serialized
+    with etree.tostring. The document is modified in place. Returns None unless each of the expressions is one of those
+    zato.apitest.xmlstream understands, i.e. no predicates depend on text of elements, and points to exactly one element
+    no other expression points to.
+    """
+    paths = sorted(set(paths))
+    token = uuid4().hex
+    originals = []
+
+    for idx, path in enumerate(paths):
+        if not xmlstream.parse_path(path, namespaces):
+            return None
+
+        elems = doc.xpath(path, namespaces=namespaces)
+        if len(elems) != 1:
+            return None
+
+        elem, = elems
+        originals.append(elem.text)
+        elem.text = '{}{}-'.format(token, idx)
+
+    split = _split(etree.tostring(doc).decode('ascii'), '{}([0-9]+)-'.format(token), len(paths))
+    if not split:
+        return None
+
+    fragments, numbers = split
+    fragments = [fragment.encode('ascii') for fragment in fragments]
+    slots = [(paths[idx], serialize_xml_text, serialize_xml_text(originals[idx] or '')) for idx in numbers]
+
+    return Template('XML', fragments, slots, dict(namespaces))
+
+class TextHole(object):
+    """ Stands in for an element at an XPath expression a template has a hole at, text set is kept among values to render.
+    """
+    def __init__(self, values, path):
+        self.values = values
+        self.path = path
+
+    def _set_text(self, value):
+        serialize_xml_text(value) # Invalid text is rejected right away, as lxml would do
+        self.values[self.path] = value
+
+    text = property(lambda self: self.values.get(self.path), _set_text)
+
+# ################################################################################################################################
+
+def get_template(format, data, paths, namespaces=None, **dumps_kwargs):
+    """ Returns a template, compiled once for the whole run, of request data in format, either 'XML' or 'JSON',
+    with holes at paths, or None if the request cannot have holes at all of them.
+    """
+    key = (format, fixtures.get_key(data), tuple(sorted(set(paths))), tuple(sorted((namespaces or {}).items())),
+        tuple(sorted(dumps_kwargs.items())))
+
+    try:
+        return _templates[key]
+    except KeyError:
+        if len(_templates) >= TEMPLATE_CACHE_SIZE:
+            _templates.clear()
+
+        doc = fixtures.cache.parse(data, format)
+
+        if format == 'JSON':
+            template = compile_json(doc, paths, **dumps_kwargs)
+        else:
+            template = compile_xml(doc, paths, namespaces or {})
+
+        _templates[key] = template
+        return template
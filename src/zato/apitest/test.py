@@ -13,6 +13,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 from json import dumps
+from threading import Thread
 
 # lxml
 from lxml import etree
@@ -22,6 +23,7 @@ from requests_testadapter import Resp, TestAdapter
 
 # six
 from six import BytesIO
+from six.moves import BaseHTTPServer, socketserver
 
 def xml_c14nize(data):
     """ Returns a canonical value of an XML document.
@@ -57,3 +59,45 @@ class XMLEchoAdapter(EchoAdapter):
 class JSONEchoAdapter(EchoAdapter):
     def serialize(self, data):
         return dumps({'data': data.encode('utf-8')})
+
+class LocalHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = b'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.server.requests += 1
+        self.server.request_headers.append(self.headers)
+        self.send_response(200)
+        for name, value in self.server.headers.items():
+            self.send_header(name, value)
+        self.send_header(b'Content-Length', '{}'.format(len(self.server.body)).encode('utf-8'))
+        self.end_headers()
+        self.wfile.write(self.server.body)
+
+    def log_message(self, *args):
+        pass
+
+class LocalServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ A keep-alive HTTP server on a random local port, responding to each GET with the same body and headers,
+    for tests which need real sockets. Headers of each request received are kept in request_headers.
+    """
+    daemon_threads = True
+
+    def __init__(self, body=b'OK', headers=None):
+        BaseHTTPServer.HTTPServer.__init__(self, (b'127.0.0.1', 0), LocalHandler)
+        self.body = body
+        self.headers = headers or {}
+        self.requests = 0
+        self.request_headers = []
+        self.address = 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def start(self):
+        thread = Thread(target=self.serve_forever, args=(0.05,))
+        thread.daemon = True
+        thread.start()
+
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os, sqlite3
+from contextlib import closing
+from time import time
+
+# ################################################################################################################################
+
+# Kept in features/, next to config.ini
+TIMINGS_FILE = 'timings.sqlite'
+
+# How much weight the latest run has when compared to the history of a feature or scenario.
+SMOOTHING = 0.5
+
+class KIND:
+    FEATURE = 'feature'
+    SCENARIO = 'scenario'
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS timings (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    duration REAL NOT NULL,
+    runs INTEGER NOT NULL,
+    last_run REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+)
+"""
+
+# ################################################################################################################################
+
+class TimingHistory(object):
+    """ Durations of features and scenarios from previous runs, smoothed over time.
+    """
+    def __init__(self, features_dir):
+        self.path = os.path.join(features_dir, TIMINGS_FILE)
+        self.durations = {KIND.FEATURE: {}, KIND.SCENARIO: {}}
+        self.runs = {KIND.FEATURE: {}, KIND.SCENARIO: {}}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute(CREATE_TABLE)
+        return conn
+
+    def load(self):
+        if os.path.exists(self.path):
+            with closing(self._connect()) as conn:
+                for kind, key, duration, runs in conn.execute('SELECT kind, key, duration, runs FROM timings'):
+                    if kind in self.durations:
+                        self.durations[kind][key] = duration
+                        self.runs[kind][key] = runs
+        return self
+
+    def _add(self, kind, key, duration):
+        previous = self.durations[kind].get(key)
+        if previous is not None:
+            duration = SMOOTHING * duration + (1 - SMOOTHING) * previous
+
+        self.durations[kind][key] = duration
+        self.runs[kind][key] = self.runs[kind].get(key, 0) + 1
+
+        return (kind, key, duration, self.runs[kind][key], time())
+
+    def update(self, scenarios, with_features=True):
+        """ Stores durations of scenarios that actually ran, as they are found in a run's result.
+        Features are stored only if with_features is True, i.e. if all of their scenarios were run.
+        All rows of a scenario outline share its key, so their durations are summed up and stored once per run.
+        """
+        rows = []
+        keys = {}
+        features = {}
+
+        for scenario in scenarios:
+            if scenario['status'] not in ('passed', 'failed'):
+                continue
+
+            keys[scenario['key']] = keys.get(scenario['key'], 0.0) + scenario['duration']
+            features[scenario['feature']] = features.get(scenario['feature'], 0.0) + scenario['duration']
+
+        for key, duration in keys.items():
+            rows.append(self._add(KIND.SCENARIO, key, duration))
+
+        if with_features:
+            for feature, duration in features.items():
+                rows.append(self._add(KIND.FEATURE, feature, duration))
+
+        if rows:
+            with closing(self._connect()) as conn:
+                with conn:
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO timings (kind, key, duration, runs, last_run) VALUES (?, ?, ?, ?, ?)', rows)
+
+    def get_default(self, kind):
+        """ Returns the mean of known durations - what a feature or scenario with no history is expected to take.
+        """
+        durations = self.durations[kind]
+        return sum(durations.values()) / len(durations) if durations else 0.0
+
+    def estimate(self, unit):
+        """ Returns expected duration of a unit of work - either a whole feature or selected scenarios of a feature.
+        """
+        if unit['keys']:
+            default = self.get_default(KIND.SCENARIO)
+            return sum(self.durations[KIND.SCENARIO].get(key, default) for key in unit['keys'])
+
+        return self.durations[KIND.FEATURE].get(unit['feature'], self.get_default(KIND.FEATURE))
+
+# ################################################################################################################################
+
+def schedule(units, workers, estimate):
+    """ Splits units of work into at most as many non-empty groups as there are workers, longest-first.
+    Each unit goes to the group with the least total work so far, and units in each group are ordered
+    from the longest one, so that the slowest unit is never started last. With no estimates to go by,
+    this degrades to round-robin in the original order.
+    """
+    groups = [[] for _ in range(workers)]
+    totals = [0.0] * workers
+
+    for unit in sorted(units, key=estimate, reverse=True):
+        idx = min(range(workers), key=lambda idx: (totals[idx], len(groups[idx])))
+        groups[idx].append(unit)
+        totals[idx] += estimate(unit)
+
+    return [group for group in groups if group]
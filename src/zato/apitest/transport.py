@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os, sys
+
+# Zato
+from zato.apitest import util
+
+# ################################################################################################################################
+
+# Read by zato.apitest's __init__, which needs to patch the standard library before anything else imports it.
+TRANSPORT_ENV = 'APITEST_TRANSPORT'
+
+class TRANSPORT:
+    # requests on top of blocking sockets, one OS thread per concurrent iteration in load tests
+    BLOCKING = 'blocking'
+
+    # The same requests on top of gevent's cooperative sockets, a greenlet per concurrent iteration
+    GEVENT = 'gevent'
+
+TRANSPORTS = (TRANSPORT.BLOCKING, TRANSPORT.GEVENT)
+
+# ################################################################################################################################
+
+def validate_transport(transport):
+    if transport not in TRANSPORTS:
+        raise ValueError('Unknown HTTP transport `{}`, should be one of {}'.format(transport, ', '.join(TRANSPORTS)))
+    return transport
+
+def get_transport(path):
+    """ Returns the HTTP transport selected in the [http] stanza of features/config.ini, e.g.
+
+    [http]
+    transport=gevent
+    """
+    config = util.get_config(os.path.join(path, 'features')).get('http') or {}
+    return validate_transport(config.get('transport', TRANSPORT.BLOCKING))
+
+def get_current_transport():
+    return os.environ.get(TRANSPORT_ENV, TRANSPORT.BLOCKING)
+
+def select_transport(transport):
+    """ Makes sure the current process uses a given transport. Since gevent can only patch the standard library
+    reliably before anything else is imported, the process is started anew, with the very same arguments, if need be.
+    """
+    if transport == get_current_transport():
+        return
+
+    if transport == TRANSPORT.GEVENT:
+        try:
+            import gevent # noqa
+        except ImportError:
+            raise ValueError('HTTP transport `{}` requires gevent, e.g. pip install gevent'.format(transport))
+
+    env = dict(os.environ)
+    env[TRANSPORT_ENV] = transport
+
+    sys.stdout.flush()
+    os.execve(sys.executable, [sys.executable, '-m', 'zato.apitest.cli'] + sys.argv[1:], env)
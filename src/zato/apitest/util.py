@@ -13,9 +13,11 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import csv, operator, os, random, uuid, re
+import threading
 from collections import OrderedDict
 from datetime import timedelta
 from itertools import izip_longest
+from time import sleep, time
 
 # Arrow
 from arrow import api as arrow_api
@@ -29,18 +31,35 @@ from configobj import ConfigObj
 # Dateutil
 from dateutil.parser import parse as parse_dt
 
+# jsonpointer
+from jsonpointer import JsonPointerException
+
 # six
+from six import string_types
 from six.moves import cStringIO as StringIO
 
 # Zato
-from zato.apitest import version
+from zato.apitest import fixtures, PathNotFound, spool, version
 
 random.seed()
 
 # Singleton used for storing Zato's own context across features and steps.
-# Not thread/greenlet-safe so this will have to be added if need be.
+# This is the main thread's one, other threads, e.g. in load tests, have their own ones, see get_context.
 context = Bunch()
 
+_thread_context = threading.local()
+
+def get_context():
+    """ Returns the context of the current thread.
+    """
+    if isinstance(threading.current_thread(), threading._MainThread):
+        return context
+
+    if not hasattr(_thread_context, 'value'):
+        _thread_context.value = Bunch()
+
+    return _thread_context.value
+
 # ################################################################################################################################
 
 def get_value_from_environ(ctx, name):
@@ -58,33 +77,108 @@ config_functions = {
     '@': get_value_from_config
 }
 
-config_patterns = {
-    '$': re.compile(r'\$\{(\w+)\}'),
-    '#': re.compile(r'\#\{(\w+)\}'),
-    '@': re.compile(r'\@\{(\w+)\}')
-}
+# A placeholder within a value, e.g. ${HOME}, #{customer_id} or @{api_key}
+config_placeholder = re.compile(r'([$#@])\{(\w+)\}')
+
+# How many values, parsed by compile_value, are kept at most, they are all dropped once there are more.
+TEMPLATE_CACHE_SIZE = 10000
+
+# Values already parsed by compile_value
+_templates = {}
+
+def compile_value(value):
+    """ Parses a value into a function returning it with config sources applied, given ctx. Values prefixed with $, # or @
+    as a whole are names to look up as they are, e.g. $HOME, while any number of placeholders, e.g. ${HOME}, #{customer_id}
+    or @{api_key}, are replaced with their values converted to strings. Returns None if the value is to be used as is.
+    """
+    if value[0] in config_functions and not config_placeholder.match(value):
+        func, name = config_functions[value[0]], value[1:]
+        return lambda ctx: func(ctx, name)
+
+    # Literal parts of the value, with None instead of functions, and placeholders to look up, in order
+    segments = []
+    start = 0
+
+    for match in config_placeholder.finditer(value):
+        if match.start() > start:
+            segments.append((None, value[start:match.start()]))
+        segments.append((config_functions[match.group(1)], match.group(2)))
+        start = match.end()
+
+    if not segments:
+        return None
+
+    if start < len(value):
+        segments.append((None, value[start:]))
+
+    def render(ctx):
+        return ''.join([name if func is None else '{}'.format(func(ctx, name)) for func, name in segments])
+
+    return render
+
+def obtain_value(ctx, value):
+    """ Returns a value as is or obtained from config sources if prefixed with $, # or @, or with placeholders in it replaced.
+    Each value is parsed once only, later on only its placeholders are looked up.
+    """
+    if not value or not isinstance(value, string_types):
+        return value
+
+    try:
+        render = _templates[value]
+    except KeyError:
+        if len(_templates) >= TEMPLATE_CACHE_SIZE:
+            _templates.clear()
+        render = _templates[value] = compile_value(value)
+
+    return render(ctx) if render else value
 
 def obtain_values(func):
     """ Functions decorated with this one will be able to obtain values from config sources prefixed with $, # or @.
     """
     def inner(ctx, *args, **kwargs):
         for kwarg, value in kwargs.items():
-            if value:
-                config_key = value[0]
-                if config_key in config_functions:
-                    config_func = config_functions[config_key]
-                    kwargs[kwarg] = config_func(ctx, value[1:])
-                else:
-                    for config_key,pattern in config_patterns.items():
-                        for match in pattern.findall(value):
-                            config_func = config_functions[config_key]
-                            kwargs[kwarg] = re.sub(r'\%s\{%s\}' % (config_key, match), str(config_func(ctx, match)), value)
+            kwargs[kwarg] = obtain_value(ctx, value)
 
         return func(ctx, *args, **kwargs)
     return inner
 
 # ################################################################################################################################
 
+# Parsed config.ini files, by path, see get_config.
+_configs = {}
+
+def _get_cached_config(environment_dir):
+    path = os.path.join(environment_dir, 'config.ini')
+
+    try:
+        stat = os.stat(path)
+        stamp = (stat.st_mtime, stat.st_size)
+    except OSError:
+        stamp = None
+
+    cached = _configs.get(path)
+    if not cached or cached.stamp != stamp:
+        config = ConfigObj(path)
+        cached = _configs[path] = Bunch(stamp=stamp, config=config, user=bunchify(config['user']) if 'user' in config else None)
+
+    return cached
+
+def get_config(environment_dir):
+    """ Returns config.ini from a features directory, parsed once for the whole run and parsed again only if the file's
+    modification time or size changes. Worker processes forked once it is parsed inherit it rather than parse it themselves.
+    The config returned is shared by all callers and must not be modified.
+    """
+    return _get_cached_config(environment_dir).config
+
+def get_user_config(environment_dir):
+    """ Returns the [user] stanza of config.ini from a features directory, cached the same way get_config caches the file.
+    """
+    user = _get_cached_config(environment_dir).user
+    if user is None:
+        raise KeyError('user')
+
+    return user
+
 def new_context(old_ctx, environment_dir, user_config=None):
     _context = Bunch()
     _context.auth = {}
@@ -94,14 +188,82 @@ def new_context(old_ctx, environment_dir, user_config=None):
     _context.request = Bunch()
     _context.request.headers = {'User-Agent':'zato-apitest/{} (+https://zato.io)'.format(version)}
     _context.request.ns_map = {}
-    _context.user_config = user_config if user_config is not None else bunchify(
-        ConfigObj(os.path.join(_context.environment_dir, 'config.ini')))['user']
+    _context.user_config = user_config if user_config is not None else get_user_config(_context.environment_dir)
     _context.cassandra_ctx = {}
 
-    context.clear()
-    context.update(_context)
+    current = get_context()
+    if current.get('response'):
+        spool.close(current.response)
+    current.clear()
+    current.update(_context)
+
+    return current
+
+# ################################################################################################################################
+
+# Defaults of backoff between attempts of steps retried within a deadline, in seconds.
+RETRY_INITIAL_DELAY = 0.1
+RETRY_MAX_DELAY = 2.0
+RETRY_FACTOR = 2.0
+
+# Errors of steps retried within a deadline that may go away once a response has what is expected - failed assertions
+# and JSON Pointers or XPath expressions that do not point to anything yet. Any other error, e.g. of a value
+# that cannot be parsed, fails a step right away.
+RETRY_ERRORS = (AssertionError, JsonPointerException, PathNotFound)
+
+def get_retry_config(environment_dir):
+    """ Returns backoff options from the [retry] stanza of config.ini, e.g.
 
-    return context
+    [retry]
+    initial_delay=0.1
+    max_delay=2
+    factor=2
+    """
+    config = {}
+    if environment_dir:
+        config = get_config(environment_dir).get('retry') or {}
+
+    out = Bunch()
+    for name, default in (('initial_delay', RETRY_INITIAL_DELAY), ('max_delay', RETRY_MAX_DELAY), ('factor', RETRY_FACTOR)):
+        try:
+            out[name] = float(config.get(name, default))
+        except ValueError:
+            raise ValueError('Invalid {} `{}` in [retry] in config.ini'.format(name, config[name]))
+
+    return out
+
+def eventually(func, timeout, initial_delay=RETRY_INITIAL_DELAY, max_delay=RETRY_MAX_DELAY, factor=RETRY_FACTOR,
+        before_retry=None):
+    """ Calls func until it no longer raises any of RETRY_ERRORS or timeout, in seconds, expires, sleeping between attempts
+    for initial_delay at first and then factor times longer each time, up to max_delay. Calls before_retry, if given,
+    before each attempt but the first one. Returns how long it took for func to pass and in how many attempts.
+    Once timeout expires, the last error is re-raised, with how long it took and how many attempts were made
+    in the message of an AssertionError.
+    """
+    start = time()
+    delay = initial_delay
+    attempts = 0
+
+    while True:
+        attempts += 1
+        try:
+            func()
+        except RETRY_ERRORS as e:
+            elapsed = time() - start
+            remaining = timeout - elapsed
+            if remaining <= 0:
+                if isinstance(e, AssertionError):
+                    raise AssertionError('Condition did not hold within {}s, after {:.2f}s and {} attempt{}, last error: {}'
+                        .format(timeout, elapsed, attempts, '' if attempts == 1 else 's', e))
+                raise
+
+            sleep(min(delay, remaining))
+            delay = min(delay * factor, max_delay)
+
+            if before_retry:
+                before_retry()
+        else:
+            return time() - start, attempts
 
 # ################################################################################################################################
 
@@ -109,22 +271,31 @@ def get_full_path(base_dir, *path_items):
     return os.path.normpath(os.path.join(base_dir, *path_items))
 
 def get_file(path):
-    return open(path).read()
+    """ Returns contents of a file, read once for the whole run, see zato.apitest.fixtures.
+    """
+    return fixtures.cache.get(path)
 
-def get_data(ctx, req_or_resp, data_path):
+def get_data_path(ctx, req_or_resp, data_path):
+    return get_full_path(ctx.zato.environment_dir,
+                         ctx.zato.request.get('response_format', ctx.zato.request.get('format', 'RAW')).lower(),
+                         req_or_resp,
+                         data_path)
 
-    full_path = get_full_path(ctx.zato.environment_dir,
-                              ctx.zato.request.get('response_format', ctx.zato.request.get('format', 'RAW')).lower(),
-                              req_or_resp,
-                              data_path)
+def get_data(ctx, req_or_resp, data_path):
 
-    data = get_file(full_path) if data_path else ''
+    data = get_file(get_data_path(ctx, req_or_resp, data_path)) if data_path else ''
 
-    if ctx.zato.request.format == 'XML' and not data:
+    if ctx.zato.request.get('format') == 'XML' and not data:
         raise ValueError('No {} in `{}`'.format(req_or_resp, data_path))
 
     return data
 
+def get_parsed_data(ctx, req_or_resp, data_path, format):
+    """ Returns a copy of a request or response file parsed according to format, either 'XML' or 'JSON'.
+    Each file is parsed once for the whole run, see zato.apitest.fixtures.
+    """
+    return fixtures.cache.parse(get_data(ctx, req_or_resp, data_path), format)
+
 # ################################################################################################################################
 
 def parse_list(value):
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import re
+from collections import defaultdict
+from copy import deepcopy
+
+# lxml
+from lxml import etree
+
+# ################################################################################################################################
+
+# A single location step - an optionally prefixed name or *, followed by an optional position, e.g. soap:Body or item[2].
+STEP = re.compile(r'^(?:([^\W\d][\w.-]*):)?(\*|[^\W\d][\w.-]*)(?:\[(\d+)\])?$', re.UNICODE)
+
+# ################################################################################################################################
+
+def parse_path(path, namespaces):
+    """ Parses an XPath expression from the subset which can be evaluated over a stream of elements - absolute paths
+    of child steps, each with an optional namespace prefix and position, e.g. /soap:Envelope/soap:Body/item[2]/name,
+    and such paths starting with // which match anywhere in a document. Returns a tuple of whether the path matches
+    anywhere and its steps, or None if the expression is not in the subset.
+    """
+    anywhere = path.startswith('//')
+    if not path.startswith('/'):
+        return None
+
+    steps = []
+    for step in path[2 if anywhere else 1:].split('/'):
+        match = STEP.match(step)
+        if not match:
+            return None
+
+        prefix, name, position = match.groups()
+
+        if prefix:
+            if prefix not in namespaces:
+                return None
+            name = '{%s}%s' % (namespaces[prefix], name)
+
+        steps.append((name, int(position) if position else None))
+
+    return anywhere, steps
+
+def _matches(path, location):
+    anywhere, steps = path
+
+    if len(steps) > len(location) or (not anywhere and len(steps) != len(location)):
+        return False
+
+    for (name, position), (tag, tag_position, any_position) in zip(steps, location[-len(steps):]):
+        if name == '*':
+            if position and position != any_position:
+                return False
+        elif name != tag or (position and position != tag_position):
+            return False
+
+    return True
+
+def extract(fp, paths):
+    """ Returns elements matching each of paths, as parsed by parse_path and keyed by their expressions, in a document
+    read from a file object. Elements are cleared as soon as they are parsed, unless they match any of the paths,
+    so that memory use does not depend on the document's size, and copies of the matching ones are returned.
+    """
+    found = dict((path, []) for path in paths)
+
+    # Only paths whose last steps are of an element's tag, or any tag, can match it
+    by_tag = defaultdict(list)
+    for expr, path in paths.items():
+        by_tag[path[1][-1][0]].append((expr, path))
+
+    any_tag = by_tag.pop('*', [])
+    for candidates in by_tag.values():
+        candidates.extend(any_tag)
+
+    location = []   # Tag of each element open, along with its positions among siblings of the same tag and among all of them
+    counters = []   # Number of children of each element open so far, by tag and in total, under *
+    matched = []    # Expressions matching each element open, along with slots for the elements among ones found
+    keep = 0        # Number of matching elements open, nothing is cleared within them
+
+    for event, elem in etree.iterparse(fp, events=('start', 'end'), huge_tree=True):
+
+        if event == 'start':
+            tag = elem.tag
+
+            if counters:
+                siblings = counters[-1]
+                siblings[tag] += 1
+                siblings['*'] += 1
+                location.append((tag, siblings[tag], siblings['*']))
+            else:
+                location.append((tag, 1, 1))
+
+            counters.append(defaultdict(int))
+            # Matching elements are returned in document order, i.e. in order of their start tags, hence their slots
+            # are taken as soon as they start.
+            slots = []
+            for expr, path in by_tag.get(tag, any_tag):
+                if _matches(path, location):
+                    slots.append((expr, len(found[expr])))
+                    found[expr].append(None)
+
+            matched.append(slots)
+
+            if slots:
+                keep += 1
+
+        else:
+            location.pop()
+            counters.pop()
+            slots = matched.pop()
+
+            if slots:
+                keep -= 1
+                copy = deepcopy(elem)
+                for expr, idx in slots:
+                    found[expr][idx] = copy
+
+            # The root element is the only one without a parent and there is nothing to clear once it is parsed
+            parent = elem.getparent()
+
+            if not keep and parent is not None:
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del parent[0]
+
+    return found
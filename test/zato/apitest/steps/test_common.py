@@ -12,13 +12,24 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # stdlib
+import hashlib
+import os
 from json import loads
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Timer
 from unittest import TestCase
 import urlparse
 
+# Behave
+from behave.model import Table
+
 # Bunch
 from bunch import Bunch
 
+# jsonpointer
+from jsonpointer import JsonPointerException
+
 # lxml
 from lxml import etree
 
@@ -26,9 +37,10 @@ from lxml import etree
 from mock import patch
 
 # Zato
-from zato.apitest import INVALID, util
-from zato.apitest.steps import common
-from zato.apitest.test import JSONEchoAdapter, xml_c14nize, XMLEchoAdapter
+from zato.apitest import INVALID, sessions, util
+from zato.apitest.stats import Histogram
+from zato.apitest.steps import common, json
+from zato.apitest.test import JSONEchoAdapter, LocalServer, xml_c14nize, XMLEchoAdapter
 
 class WhenTestCase(TestCase):
     def test_when_the_url_is_invoked_xml(self):
@@ -95,6 +107,11 @@ class WhenTestCase(TestCase):
         # Confirms the body we sent was received.
         self.assertDictEqual(loads(sent_request['request']['data']), data_impl)
 
+        # Timing and sizes of the request are recorded too.
+        self.assertGreater(ctx.zato.response.timing.total, 0)
+        self.assertGreater(ctx.zato.response.bytes_sent, len(sent_request['request']['data']))
+        self.assertEquals(ctx.zato.response.bytes_received, len(ctx.zato.response.data.content))
+
     def test_when_the_url_is_invoked_form(self):
 
         form = {'key1': ['value1'], 'key2': ['value2']}
@@ -130,6 +147,289 @@ class WhenTestCase(TestCase):
         # Confirms the form data we sent was received.
         self.assertDictEqual(urlparse.parse_qs(sent_request['request']['data']), form)
 
+    def test_when_the_url_is_invoked_times(self):
+
+        ctx = Bunch(zato=Bunch(request=Bunch()))
+
+        ctx.zato.request.is_xml = False
+        ctx.zato.request.is_json = True
+        ctx.zato.request.response_format = 'JSON'
+        ctx.zato.request.data_impl = {'a': 'b'}
+        ctx.zato.request.method = 'POST'
+        ctx.zato.request.address = 'http://{}.example.com'.format(util.rand_string())
+        ctx.zato.request.url_path = '/{}'.format(util.rand_string())
+        ctx.zato.request.qs = ''
+        ctx.zato.request.headers = {}
+
+        common.when_the_url_is_invoked_times(ctx, '5', [JSONEchoAdapter({})])
+
+        # All response times are in the histogram, the last response is kept for other steps.
+        self.assertEquals(ctx.zato.response.histogram.count, 5)
+        self.assertEquals(ctx.zato.response.data.status_code, 200)
+
+        self.assertRaises(ValueError, common.when_the_url_is_invoked_times, ctx, '0', [JSONEchoAdapter({})])
+
+    def test_when_the_url_is_invoked_times_concurrently(self):
+
+        server = LocalServer(b'Hello').start()
+
+        try:
+            ctx = Bunch(zato=Bunch(request=Bunch()))
+            ctx.zato.request.address = server.address
+            ctx.zato.request.url_path = '/{}'.format(util.rand_string())
+            ctx.zato.request.headers = {}
+
+            common.when_the_url_is_invoked_times_concurrently(ctx, '8')
+
+        finally:
+            sessions.registry.close()
+            server.stop()
+
+        # Every response is kept and each of the requests reached the server.
+        self.assertEquals(server.requests, 8)
+        self.assertEquals(len(ctx.zato.response.responses), 8)
+        self.assertEquals(ctx.zato.response.histogram.count, 8)
+        self.assertEquals(set(response.data_impl for response in ctx.zato.response.responses), set(['Hello']))
+        self.assertTrue(common.then_all_statuses_are(ctx, '200'))
+
+    def test_when_the_url_is_invoked_streamed(self):
+
+        body = b''.join(b'{:08}'.format(idx) for idx in range(400000))
+        server = LocalServer(body).start()
+
+        try:
+            ctx = Bunch(zato=util.new_context(None, util.rand_string(), {}))
+            ctx.zato.request.address = server.address
+            ctx.zato.request.url_path = '/{}'.format(util.rand_string())
+
+            common.given_response_is_streamed(ctx)
+            common.when_the_url_is_invoked(ctx)
+
+        finally:
+            sessions.registry.close()
+            server.stop()
+
+        # The body is not read into memory but spooled, all the bytes received are counted nevertheless.
+        self.assertEquals(ctx.zato.response.data._content, False)
+        self.assertGreater(ctx.zato.response.bytes_received, len(body))
+
+        self.assertTrue(common.then_status_is(ctx, '200'))
+        self.assertTrue(common.then_response_size_is(ctx, '{}'.format(len(body))))
+        self.assertTrue(common.then_response_sha256_is(ctx, hashlib.sha256(body).hexdigest()))
+        self.assertTrue(common.then_response_bytes_at_are(ctx, '8000', '00001000'))
+        self.assertTrue(common.then_response_bytes_at_are(ctx, '-8', '00399999'))
+        self.assertRaises(AssertionError, common.then_response_bytes_at_are, ctx, '0', '00000001')
+        self.assertRaises(AssertionError, common.then_response_size_is, ctx, '1')
+        self.assertRaises(AssertionError, common.then_response_sha256_is, ctx, hashlib.sha256(b'').hexdigest())
+
+        # Parsing reads from the spool too.
+        self.assertEquals(len(ctx.zato.response.data_impl), len(body))
+
+    def test_when_the_url_is_invoked_streamed_json(self):
+
+        ctx = Bunch(zato=util.new_context(None, util.rand_string(), {}))
+        ctx.zato.request.address = 'http://{}.example.com'.format(util.rand_string())
+        common.given_format(ctx, format='JSON')
+        common.given_request_is(ctx, data='{"a": "b"}')
+        common.given_response_is_streamed(ctx)
+
+        common.when_the_url_is_invoked(ctx, [JSONEchoAdapter({})])
+
+        sent_request = loads(ctx.zato.response.data_impl['data'])
+        self.assertDictEqual(loads(sent_request['request']['data']), {'a': 'b'})
+
+    def test_streamed_spools_are_closed(self):
+
+        ctx = Bunch(zato=util.new_context(None, util.rand_string(), {}))
+        ctx.zato.request.address = 'http://{}.example.com'.format(util.rand_string())
+        common.given_response_is_streamed(ctx)
+
+        common.when_the_url_is_invoked_times(ctx, '3', [JSONEchoAdapter({})])
+        spools = [response.spool for response in ctx.zato.response.responses]
+        self.assertEquals([item.closed for item in spools], [False] * 3)
+
+        # Spools of a response are closed once it is replaced by another one, and the latter's once the context is dropped.
+        common.when_the_url_is_invoked(ctx, [JSONEchoAdapter({})])
+        body = ctx.zato.response.spool
+        self.assertEquals([item.closed for item in spools], [True] * 3)
+        self.assertFalse(body.closed)
+
+        util.new_context(None, util.rand_string(), {})
+        self.assertTrue(body.closed)
+
+    def test_streamed_json_pointers(self):
+
+        ctx = Bunch(zato=util.new_context(None, util.rand_string(), {}))
+        ctx.zato.request.address = 'http://{}.example.com'.format(util.rand_string())
+        ctx.scenario = Bunch(effective_tags=[], all_steps=[
+            Bunch(name='JSON Pointer "/request/headers/X-A" is "a"'),
+            Bunch(name='JSON Pointer "/request/headers/X-B" in request is "b"'),
+            Bunch(name='JSON Pointer "#{x}" is "c"'),
+            Bunch(name='I store "/request/headers/X-C" from response under "c"'),
+        ])
+        ctx.zato.request.headers.update({'X-A': 'a', 'X-C': 'c'})
+
+        common.given_format(ctx, format='JSON')
+        common.given_response_is_streamed(ctx)
+        common.when_the_url_is_invoked(ctx, [JSONEchoAdapter({})])
+
+        # The echoed request is a string within the response, hence it is checked in its own response.
+        ctx.zato.response.spool.seek(0)
+        data = loads(ctx.zato.response.spool.read())['data'].encode('utf-8')
+        ctx.zato.response.spool.seek(0)
+        ctx.zato.response.spool.truncate()
+        ctx.zato.response.spool.write(data)
+
+        self.assertEquals(common.get_scenario_paths(ctx, common.POINTER_STEPS), ['/request/headers/X-A', '/request/headers/X-C'])
+
+        calls = []
+        extract = common.jsonstream.extract
+
+        def _extract(fp, pointers):
+            calls.append(pointers)
+            return extract(fp, pointers)
+
+        with patch('zato.apitest.jsonstream.extract', _extract):
+            self.assertTrue(json.then_json_pointer_is(ctx, path='/request/headers/X-A', value='a'))
+            common.then_store_path_under_name(ctx, path='/request/headers/X-C', name='c')
+            self.assertRaises(AssertionError, json.then_json_pointer_is, ctx, path='/request/data', value='abc')
+
+        # All the pointers the scenario checks are extracted at once, others are extracted when needed.
+        self.assertEquals(calls, [
+            ['/request/headers/X-A', '/request/headers/X-C'],
+            ['/request/data', ],
+        ])
+        self.assertEquals(ctx.zato.user_ctx['c'], 'c')
+
+        self.assertRaises(JsonPointerException, common.get_response_pointer, ctx, '/request/no-such-key')
+        self.assertEquals(common.get_response_pointer(ctx, '/request/no-such-key', 123), 123)
+
+    def test_then_response_bytes_at_are_equal_to_that_from(self):
+
+        environment_dir = mkdtemp()
+        os.makedirs(os.path.join(environment_dir, 'raw', 'response'))
+
+        with open(os.path.join(environment_dir, 'raw', 'response', 'expected.bin'), 'wb') as f:
+            f.write(b'\x00\x01\x02')
+
+        ctx = Bunch(zato=util.new_context(None, environment_dir, {}))
+        ctx.zato.response = Bunch(data=Bunch(content=b'abc\x00\x01\x02def'))
+
+        try:
+            self.assertTrue(common.then_response_bytes_at_are_equal_to_that_from(ctx, '3', 'expected.bin'))
+            self.assertRaises(AssertionError, common.then_response_bytes_at_are_equal_to_that_from, ctx, '4', 'expected.bin')
+        finally:
+            rmtree(environment_dir)
+
+    def test_when_the_urls_are_invoked_concurrently(self):
+
+        environment_dir = mkdtemp()
+        os.makedirs(os.path.join(environment_dir, 'json', 'request'))
+
+        with open(os.path.join(environment_dir, 'json', 'request', 'customer.json'), 'w') as f:
+            f.write('{"name": "abc"}')
+
+        ctx = Bunch(zato=util.new_context(None, environment_dir, {}))
+        ctx.zato.user_ctx['invoice_id'] = '123'
+        ctx.zato.request.address = 'http://{}.example.com'.format(util.rand_string())
+        ctx.zato.request.headers[b'X-Test'] = b'abc'
+        common.given_format(ctx, format='JSON')
+        common.given_request_is(ctx, data='{"a": "b"}')
+
+        ctx.table = Table(['path', 'method', 'request', 'response'], rows=[
+            ['/customer', 'POST', 'customer.json', 'customer'],
+            ['/invoice/#{invoice_id}', '', '', 'invoice'],
+            ['/ping', '', '', ''],
+        ])
+
+        try:
+            common.when_the_urls_are_invoked_concurrently(ctx, [JSONEchoAdapter({})])
+        finally:
+            rmtree(environment_dir)
+
+        # Each parsed response is stored under its own name, the request each one echoes back is the one from its row.
+        customer = loads(ctx.zato.user_ctx['customer']['data'])
+        self.assertDictEqual(loads(customer['request']['data']), {'name': 'abc'})
+        self.assertEquals(customer['request']['headers']['X-Test'], 'abc')
+
+        invoice = loads(ctx.zato.user_ctx['invoice']['data'])
+        self.assertEquals(invoice['request']['data'], None)
+
+        self.assertNotIn('ping', ctx.zato.user_ctx)
+        self.assertEquals(len(ctx.zato.response.responses), 3)
+
+        # The step's own request is not changed by any of the rows.
+        self.assertNotIn('url_path', ctx.zato.request)
+        self.assertDictEqual(ctx.zato.request.data_impl, {'a': 'b'})
+
+    def test_when_the_urls_are_invoked_concurrently_invalid_table(self):
+
+        ctx = Bunch(zato=util.new_context(None, util.rand_string(), {}))
+
+        self.assertRaises(ValueError, common.when_the_urls_are_invoked_concurrently, ctx)
+
+        ctx.table = Table(['path', 'verb'], rows=[['/customer', 'POST']])
+        self.assertRaises(ValueError, common.when_the_urls_are_invoked_concurrently, ctx)
+
+        ctx.table = Table(['path', 'method'], rows=[['', 'POST']])
+        self.assertRaises(ValueError, common.when_the_urls_are_invoked_concurrently, ctx)
+
+class ResponseTestCase(TestCase):
+
+    def get_response(self, response_format, text):
+        parsed = []
+
+        class Data(object):
+            @property
+            def text(self):
+                parsed.append(True)
+                return text
+
+        return common.Response(response_format, data=Data()), parsed
+
+    def test_parsed_on_first_access_only(self):
+        response, parsed = self.get_response('JSON', '{"a": "b"}')
+
+        # Nothing is parsed up front ..
+        self.assertTrue('data_impl' in response)
+        self.assertEquals(parsed, [])
+
+        # .. and only once when needed, including in copies.
+        self.assertDictEqual(response.data_impl, {'a': 'b'})
+        self.assertDictEqual(response['data_impl'], {'a': 'b'})
+        self.assertDictEqual(response.copy().data_impl, {'a': 'b'})
+        self.assertEquals(parsed, [True])
+
+    def test_get(self):
+        response, parsed = self.get_response('JSON', '{"a": "b"}')
+
+        self.assertDictEqual(response.get('data_impl'), {'a': 'b'})
+        self.assertDictEqual(response.get('data_impl', 'abc'), {'a': 'b'})
+        self.assertIsNone(response.get('abc'))
+        self.assertEquals(response.get('abc', 'def'), 'def')
+        self.assertEquals(parsed, [True])
+
+        response, parsed = self.get_response('ABC', 'abc')
+        self.assertEquals(response.get('data_impl', 'def'), 'def')
+        self.assertEquals(parsed, [])
+
+    def test_xml(self):
+        response, _ = self.get_response('XML', '<a><b>c</b></a>')
+        self.assertEquals(response.data_impl.xpath('/a/b')[0].text, 'c')
+
+    def test_unknown_format(self):
+        response, parsed = self.get_response('ABC', 'abc')
+        self.assertFalse('data_impl' in response)
+        self.assertRaises(AttributeError, getattr, response, 'data_impl')
+        self.assertEquals(parsed, [])
+
+    def test_invalid_body(self):
+        response, _ = self.get_response('JSON', '{"a": ')
+
+        # Parsing errors are not hidden by checks whether there is any data_impl.
+        self.assertTrue('data_impl' in response)
+        self.assertRaises(ValueError, getattr, response, 'data_impl')
+
 class GivenTestCase(TestCase):
 
     def setUp(self):
@@ -323,6 +623,124 @@ class ThenTestCase(TestCase):
         self.ctx.zato.response.data.status_code = actual
         self.assertRaises(AssertionError, common.then_status_is, self.ctx, expected)
 
+    def test_then_all_statuses_are(self):
+        self.ctx.zato.response.data.status_code = 200
+        self.assertTrue(common.then_all_statuses_are(self.ctx, '200'))
+
+        self.ctx.zato.response.responses = [Bunch(data=Bunch(status_code=status)) for status in (200, 200, 409)]
+        self.assertRaises(AssertionError, common.then_all_statuses_are, self.ctx, '200')
+
+    def test_then_exactly_count_statuses_are(self):
+        self.ctx.zato.response.responses = [Bunch(data=Bunch(status_code=status)) for status in (201, 409, 409)]
+
+        self.assertTrue(common.then_exactly_count_statuses_are(self.ctx, '1', '201'))
+        self.assertTrue(common.then_exactly_count_statuses_are(self.ctx, '2', '409'))
+        self.assertTrue(common.then_exactly_count_statuses_are(self.ctx, '0', '200'))
+        self.assertRaises(AssertionError, common.then_exactly_count_statuses_are, self.ctx, '1', '409')
+
+    def test_then_retrying_for_seconds(self):
+        self.ctx.zato.response.data.status_code = 500
+
+        def set_status():
+            self.ctx.zato.response.data.status_code = 200
+
+        timer = Timer(0.2, set_status)
+        timer.start()
+
+        try:
+            self.assertTrue(common.then_retrying_for_seconds(self.ctx, '5', 'status is "200"'))
+        finally:
+            timer.cancel()
+
+    def test_then_retrying_for_seconds_timeout(self):
+        self.ctx.zato.response.data.status_code = 500
+        self.assertRaises(AssertionError, common.then_retrying_for_seconds, self.ctx, '0.2', 'status is "200"')
+
+    def test_then_retrying_for_seconds_undefined_step(self):
+        self.assertRaises(ValueError, common.then_retrying_for_seconds, self.ctx, '5', 'no such step')
+
+    def test_then_within_seconds(self):
+        self.ctx.zato.response.data.status_code = 500
+        invoked = []
+
+        def invoke():
+            invoked.append(True)
+            if len(invoked) == 3:
+                self.ctx.zato.response.data.status_code = 200
+
+        # Each retry checks a response to the URL invoked anew.
+        self.ctx.zato.invocation = invoke
+        self.assertTrue(common.then_within_seconds(self.ctx, '5', 'status is "200"'))
+
+        self.assertEquals(len(invoked), 3)
+
+        # How long it took for the step to pass, and in how many attempts, is kept in the context.
+        retry, = self.ctx.zato.retries
+        self.assertEquals(retry.step, 'status is "200"')
+        self.assertEquals(retry.attempts, 4)
+        self.assertGreater(retry.elapsed, 0)
+        self.assertLess(retry.elapsed, 5)
+
+    def test_then_within_seconds_json_pointer(self):
+        self.ctx.zato.response.data_impl = {}
+
+        def invoke():
+            self.ctx.zato.response.data_impl = {'status': 'done'}
+
+        # Paths not found are retried like failed assertions are.
+        self.ctx.zato.invocation = invoke
+        with patch('zato.apitest.util.sleep'):
+            self.assertTrue(common.then_within_seconds(self.ctx, '10', 'JSON Pointer "/status" is "done"'))
+
+        self.ctx.zato.invocation = lambda: None
+        self.ctx.zato.response.data_impl = {}
+        self.assertRaises(JsonPointerException, common.then_within_seconds, self.ctx, '0.2', 'JSON Pointer "/status" is "done"')
+
+    def test_then_within_seconds_repeats_invocation(self):
+        server = LocalServer().start()
+
+        def sleep(delay):
+            server.headers[b'X-Status'] = b'done'
+
+        try:
+            ctx = Bunch(zato=util.new_context(None, util.rand_string(), {}))
+            ctx.zato.request.address = server.address
+            ctx.zato.request.url_path = '/{}'.format(util.rand_string())
+
+            common.when_the_url_is_invoked_times_concurrently(ctx, '3')
+
+            with patch('zato.apitest.util.sleep', sleep):
+                self.assertTrue(common.then_within_seconds(ctx, '5', 'header "X-Status" exists'))
+
+        finally:
+            sessions.registry.close()
+            server.stop()
+
+        # The retry invoked the URL concurrently again, the same way the response it replaced was obtained.
+        self.assertEquals(server.requests, 6)
+        self.assertEquals(len(ctx.zato.response.responses), 3)
+
+    def test_then_response_time_is_less_than_ok(self):
+        self.ctx.zato.response.timing = Bunch(total=0.15)
+        self.assertTrue(common.then_response_time_is_less_than(self.ctx, '200'))
+
+    def test_then_response_time_is_less_than_not_ok(self):
+        self.ctx.zato.response.timing = Bunch(total=0.25)
+        self.assertRaises(AssertionError, common.then_response_time_is_less_than, self.ctx, '200')
+
+    def test_then_percentile_response_time_is_less_than(self):
+        histogram = Histogram()
+        for value in range(1, 101):
+            histogram.record(value / 1000.0)
+        self.ctx.zato.response.histogram = histogram
+
+        self.assertTrue(common.then_percentile_response_time_is_less_than(self.ctx, '50', '52'))
+        self.assertTrue(common.then_percentile_response_time_is_less_than(self.ctx, '95', '97'))
+        self.assertRaises(AssertionError, common.then_percentile_response_time_is_less_than, self.ctx, '95', '90')
+
+    def test_then_percentile_response_time_needs_repeated_invocation(self):
+        self.assertRaises(ValueError, common.then_percentile_response_time_is_less_than, self.ctx, '95', '100')
+
     def test_then_status_is_needs_an_int(self):
         expected = util.rand_string()
         actual = util.rand_int()
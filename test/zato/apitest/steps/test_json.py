@@ -13,6 +13,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 from datetime import datetime
+from json import dumps
 from dateutil.relativedelta import relativedelta
 from unittest import TestCase
 
@@ -131,6 +132,44 @@ class GivenTestCase(TestCase):
         self.assertLess(datetime.strptime(date_start, '%Y-%m-%d'), rand_date_between)
         self.assertGreater(datetime.strptime(date_end, '%Y-%m-%d'), rand_date_between)
 
+class TemplateTestCase(TestCase):
+    def setUp(self):
+        self.ctx = Bunch()
+        self.ctx.zato = util.new_context(None, util.rand_string(), {})
+        self.ctx.scenario = Bunch(effective_tags=[], all_steps=[
+            Bunch(name='JSON Pointer "/a" in request is "x"'),
+            Bunch(name='JSON Pointer "/b/0" in request is an integer "1"'),
+        ])
+        common.given_format(self.ctx, 'JSON')
+
+    def test_template(self):
+        common.given_request_is(self.ctx, '{"a": "", "b": [0, 2], "c": {"d": []}}')
+        json.given_json_pointer_in_request_is(self.ctx, path='/a', value='x')
+        json.given_json_pointer_in_request_is_an_integer(self.ctx, path='/b/0', value='1')
+
+        # Values are spliced into the template rather than set in the request parsed
+        self.assertIsNone(self.ctx.zato.request.data_impl)
+        self.assertEquals(self.ctx.zato.request.template_values, {'/a': 'x', '/b/0': 1})
+
+        expected = {'a': 'x', 'b': [1, 2], 'c': {'d': []}}
+        self.assertEquals(common.build_request(self.ctx).data, dumps(expected, separators=(',', ':')))
+
+    def test_template_other_pointer(self):
+        common.given_request_is(self.ctx, '{"a": "", "b": [0, 2], "c": {"d": []}}')
+        json.given_json_pointer_in_request_is(self.ctx, path='/a', value='x')
+        json.given_json_pointer_in_request_is(self.ctx, path='/c/d', value='y')
+
+        # The request is parsed, with values set so far, once a value is set at a pointer there is no hole at
+        expected = {'a': 'x', 'b': [0, 2], 'c': {'d': 'y'}}
+        self.assertNotIn('template', self.ctx.zato.request)
+        self.assertEquals(self.ctx.zato.request.data_impl, expected)
+        self.assertEquals(common.build_request(self.ctx).data, dumps(expected, separators=(',', ':')))
+
+    def test_template_missing_pointer(self):
+        common.given_request_is(self.ctx, '{"a": ""}')
+        self.assertNotIn('template', self.ctx.zato.request)
+        self.assertEquals(self.ctx.zato.request.data_impl, {'a': ''})
+
 class ThenTestCase(TestCase):
     def setUp(self):
         self.ctx = Bunch()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import json, os
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# jsonschema
+from jsonschema.exceptions import SchemaError
+
+# Zato
+from zato.apitest import sessions, util
+from zato.apitest.steps import common, ndjson
+from zato.apitest.test import LocalServer
+
+RECORDS = [{'id': idx, 'status': 'ok'} for idx in range(5)] + [{'id': 5, 'status': 'error', 'reason': 'timeout'}]
+
+SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'id': {'type': 'integer'},
+        'status': {'enum': ['ok', 'error']},
+    },
+    'required': ['id', 'status'],
+}
+
+class ThenTestCase(TestCase):
+
+    def setUp(self):
+        self.environment_dir = mkdtemp()
+        os.makedirs(os.path.join(self.environment_dir, 'ndjson', 'response'))
+
+        for name, data in (('record.json', RECORDS[5]), ('schema.json', SCHEMA), ('invalid.json', {'type': 'abc'})):
+            with open(os.path.join(self.environment_dir, 'ndjson', 'response', name), 'w') as f:
+                f.write(json.dumps(data))
+
+    def tearDown(self):
+        rmtree(self.environment_dir)
+
+    def invoke(self, body, is_streamed):
+        server = LocalServer(body).start()
+
+        try:
+            ctx = Bunch(zato=util.new_context(None, self.environment_dir, {}))
+            ctx.zato.request.address = server.address
+            ctx.zato.request.url_path = '/{}'.format(util.rand_string())
+
+            common.given_response_format(ctx, 'NDJSON')
+            if is_streamed:
+                common.given_response_is_streamed(ctx)
+
+            common.when_the_url_is_invoked(ctx)
+
+        finally:
+            sessions.registry.close()
+            server.stop()
+
+        return ctx
+
+    def check_records(self, is_streamed):
+        body = b'\n'.join(json.dumps(record).encode('utf-8') for record in RECORDS) + b'\n\n'
+        ctx = self.invoke(body, is_streamed)
+
+        self.assertTrue(ndjson.then_response_has_records(ctx, count='6'))
+        self.assertRaises(AssertionError, ndjson.then_response_has_records, ctx, count='5')
+
+        self.assertTrue(ndjson.then_every_record_has_json_pointer(ctx, path='/status'))
+        self.assertRaises(AssertionError, ndjson.then_every_record_has_json_pointer, ctx, path='/reason')
+
+        self.assertTrue(ndjson.then_some_record_is_equal_to_that_from(ctx, path='record.json'))
+        self.assertTrue(ndjson.then_every_record_is_valid_against_schema(ctx, path='schema.json'))
+        self.assertRaises(SchemaError, ndjson.then_every_record_is_valid_against_schema, ctx, path='invalid.json')
+
+        self.assertEquals(ctx.zato.response.data_impl, RECORDS)
+
+    def test_records(self):
+        self.check_records(False)
+
+    def test_records_streamed(self):
+        self.check_records(True)
+
+    def test_records_invalid(self):
+        ctx = self.invoke(b'{"id": 1, "status": "ok"}\n{"id": "2", "status": "ok"}\n{"id": 3\n', False)
+
+        try:
+            ndjson.then_every_record_is_valid_against_schema(ctx, path='schema.json')
+        except AssertionError as e:
+            self.assertIn('line 2', e.args[0])
+        else:
+            self.fail('Expected AssertionError')
+
+        try:
+            ndjson.then_response_has_records(ctx, count='3')
+        except ValueError as e:
+            self.assertIn('line 3', e.args[0])
+        else:
+            self.fail('Expected ValueError')
+
+        self.assertRaises(ValueError, ndjson.then_some_record_is_equal_to_that_from, ctx, path='record.json')
+
+    def test_records_empty(self):
+        ctx = self.invoke(b'\n', False)
+
+        self.assertTrue(ndjson.then_response_has_records(ctx, count='0'))
+        self.assertRaises(AssertionError, ndjson.then_every_record_has_json_pointer, ctx, path='/id')
+
+    def test_needs_ndjson(self):
+        ctx = Bunch(zato=util.new_context(None, self.environment_dir, {}))
+        common.given_format(ctx, format='JSON')
+
+        self.assertRaises(TypeError, ndjson.then_response_has_records, ctx, count='1')
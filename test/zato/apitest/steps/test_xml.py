@@ -17,9 +17,13 @@ from unittest import TestCase
 # Bunch
 from bunch import Bunch
 
+# mock
+from mock import patch
+
 # Zato
-from zato.apitest import util
-from zato.apitest.steps import xml
+from zato.apitest import sessions, util, xmlstream
+from zato.apitest.steps import common, xml
+from zato.apitest.test import LocalServer
 
 class GivenTestCase(TestCase):
 
@@ -31,3 +35,74 @@ class GivenTestCase(TestCase):
         value = util.rand_string()
         xml.given_soap_action(self.ctx, value)
         self.assertEquals(self.ctx.zato.request.headers['SOAPAction'], value)
+
+    def test_template(self):
+        self.ctx.scenario = Bunch(effective_tags=[], all_steps=[
+            Bunch(name='XPath "/s:a/b" in request is "x"'),
+            Bunch(name='XPath "//c" in request is a random integer'),
+        ])
+
+        common.given_format(self.ctx, format='XML')
+        xml.given_namespace_prefix(self.ctx, 's', 'urn:s')
+        common.given_request_is(self.ctx, '<s:a xmlns:s="urn:s"><b>1</b><c/><d/></s:a>')
+
+        xml.given_xpath_in_request_is(self.ctx, xpath='/s:a/b', value='<x>')
+        self.assertIsNone(self.ctx.zato.request.data_impl)
+        self.assertEquals(common.build_request(self.ctx).data, b'<s:a xmlns:s="urn:s"><b>&lt;x&gt;</b><c></c><d/></s:a>')
+
+        # Expressions requests have no holes at are evaluated against requests parsed, with text set so far
+        xml.given_xpath_in_request_is(self.ctx, xpath='//d', value='y')
+        self.assertNotIn('template', self.ctx.zato.request)
+        self.assertEquals(common.build_request(self.ctx).data, b'<s:a xmlns:s="urn:s"><b>&lt;x&gt;</b><c/><d>y</d></s:a>')
+
+class ThenTestCase(TestCase):
+
+    def test_streamed_xpath(self):
+
+        items = b''.join(b'<item><id>{}</id></item>'.format(idx) for idx in range(1000))
+        body = b'<s:Envelope xmlns:s="urn:s"><s:Body><r>' + items + b'<total>1000</total></r></s:Body></s:Envelope>'
+        server = LocalServer(body).start()
+
+        try:
+            ctx = Bunch(zato=util.new_context(None, util.rand_string(), {}))
+            ctx.zato.request.address = server.address
+            ctx.zato.request.url_path = '/{}'.format(util.rand_string())
+            ctx.scenario = Bunch(effective_tags=[], all_steps=[
+                Bunch(name='XPath "/s:Envelope/s:Body/r/total" is "1000"'),
+                Bunch(name='XPath "/s:Envelope/s:Body/r/total" in request is "1000"'),
+                Bunch(name='I store "//item[500]/id" from response under "id"'),
+                Bunch(name='XPath "//item[position() = 1]/id" is "0"'),
+            ])
+
+            common.given_format(ctx, format='XML')
+            xml.given_namespace_prefix(ctx, 's', 'urn:s')
+            common.given_response_is_streamed(ctx)
+            common.when_the_url_is_invoked(ctx)
+
+        finally:
+            sessions.registry.close()
+            server.stop()
+
+        calls = []
+        extract = xmlstream.extract
+
+        def _extract(fp, paths):
+            calls.append(sorted(paths))
+            return extract(fp, paths)
+
+        with patch('zato.apitest.xmlstream.extract', _extract):
+            xml.then_xpath_is(ctx, elem='/s:Envelope/s:Body/r/total', value='1000')
+            common.then_store_path_under_name(ctx, path='//item[500]/id', name='id')
+            xml.then_xpath_is_an_integer(ctx, elem='//item[1000]/id', value='999')
+            self.assertRaises(AssertionError, xml.then_xpath_is, ctx, elem='/s:Envelope/s:Body/r/total', value='1')
+            self.assertRaises(ValueError, xml.then_xpath_is, ctx, elem='//item/id', value='1')
+
+        # All the paths the scenario checks are evaluated at once, others are evaluated when needed,
+        # and the body is not parsed into a tree.
+        self.assertEquals(calls, [['//item[500]/id', '/s:Envelope/s:Body/r/total'], ['//item[1000]/id'], ['//item/id']])
+        self.assertEquals(ctx.zato.user_ctx['id'], '499')
+        self.assertNotIn('data_impl', ctx.zato.response._parsed)
+
+        # Expressions which cannot be evaluated over a stream of elements are evaluated against the whole tree.
+        xml.then_xpath_is(ctx, elem='//item[position() = 1]/id', value='0')
+        self.assertIn('data_impl', ctx.zato.response._parsed)
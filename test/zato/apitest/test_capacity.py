@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# six
+from six.moves import cStringIO as StringIO
+
+# Zato
+from zato.apitest import capacity
+from zato.apitest.load import LoadResult
+
+def get_result(rate, latency, errors=0, iterations=100):
+    result = LoadResult()
+    for idx in range(iterations):
+        result.record(latency, ValueError() if idx < errors else None)
+    result.elapsed = iterations / rate
+
+    return result
+
+class SLOTestCase(TestCase):
+
+    def test_check(self):
+        slo = capacity.SLO(250, 99, 0.1)
+        self.assertEquals(str(slo), 'p99 < 250 ms, error rate < 0.1%')
+
+        self.assertListEqual(slo.check(get_result(10, 0.1)), [])
+        self.assertEquals(len(slo.check(get_result(10, 0.3))), 1)
+        self.assertEquals(len(slo.check(get_result(10, 0.1, 1, 1000))), 1)
+
+class CapacitySearchTestCase(TestCase):
+
+    def _search(self, breaking_point, start_rate, max_rate=None):
+        def run_step(rate):
+            return get_result(rate, 0.1 if rate < breaking_point else 0.5)
+
+        search = capacity.CapacitySearch(run_step, capacity.SLO(250), start_rate, max_rate, 0.05, StringIO())
+        return search, search.run()
+
+    def test_search(self):
+        search, rate = self._search(100, 10)
+
+        self.assertTrue(95 <= rate < 100)
+        self.assertListEqual([step[0] for step in search.steps[:5]], [10, 20, 40, 80, 160])
+        self.assertIn('Highest sustainable rate', search.stream.getvalue())
+
+    def test_fails_at_start_rate(self):
+        search, rate = self._search(100, 200)
+        self.assertIsNone(rate)
+        self.assertEquals(len(search.steps), 1)
+
+    def test_max_rate(self):
+        search, rate = self._search(1000, 10, 50)
+        self.assertEquals(rate, 50)
+        self.assertListEqual([step[0] for step in search.steps], [10, 20, 40, 50])
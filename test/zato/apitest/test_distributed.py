@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os, tarfile
+from base64 import b64encode
+from io import BytesIO
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Lock, Thread
+from unittest import TestCase
+
+# six
+from six.moves import cStringIO as StringIO
+
+# Zato
+from zato.apitest import distributed
+
+class FakeReplay(object):
+    """ Stands in for a scenario replay, fails every fifth iteration.
+    """
+    location = 'fake.feature:Fake'
+
+    def __init__(self):
+        self.lock = Lock()
+        self.iterations = []
+
+    def run_once(self, iteration=0):
+        with self.lock:
+            self.iterations.append(iteration)
+        return 0.001, (AssertionError('Iteration {}'.format(iteration)) if iteration % 5 == 4 else None)
+
+    def get_entry(self, iteration):
+        return None, 0.0
+
+class UtilTestCase(TestCase):
+
+    def setUp(self):
+        self.path = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.path)
+
+    def test_parse_address(self):
+        self.assertEquals(distributed.parse_address('localhost:17017'), ('localhost', 17017))
+        self.assertRaises(ValueError, distributed.parse_address, 'localhost')
+        self.assertRaises(ValueError, distributed.parse_address, ':17017')
+
+    def test_get_shares(self):
+        self.assertListEqual(distributed.get_shares(10, 3), [4, 3, 3])
+        self.assertListEqual(distributed.get_shares(2, 3), [1, 1, 0])
+
+    def test_pack_unpack_features(self):
+        os.makedirs(os.path.join(self.path, 'src', 'features', 'steps'))
+        with open(os.path.join(self.path, 'src', 'features', 'steps', 'steps.py'), 'w') as f:
+            f.write('# steps')
+        with open(os.path.join(self.path, 'src', 'features', 'steps', 'steps.pyc'), 'w') as f:
+            f.write('')
+
+        distributed.unpack_features(distributed.pack_features(os.path.join(self.path, 'src')), os.path.join(self.path, 'dst'))
+
+        self.assertTrue(os.path.exists(os.path.join(self.path, 'dst', 'features', 'steps', 'steps.py')))
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'dst', 'features', 'steps', 'steps.pyc')))
+
+    def test_unpack_features_outside_of_path(self):
+        buff = BytesIO()
+        tar = tarfile.open(fileobj=buff, mode='w:gz')
+        info = tarfile.TarInfo('../evil.py')
+        tar.addfile(info, BytesIO(b''))
+        tar.close()
+
+        self.assertRaises(ValueError, distributed.unpack_features, b64encode(buff.getvalue()), self.path)
+        self.assertFalse(os.path.exists(os.path.join(os.path.dirname(self.path), 'evil.py')))
+
+class CoordinatorTestCase(TestCase):
+
+    def setUp(self):
+        self.path = mkdtemp()
+        os.makedirs(os.path.join(self.path, 'features'))
+
+    def tearDown(self):
+        rmtree(self.path)
+
+    def _get_job(self, **kwargs):
+        job = {
+            'path': self.path,
+            'name': 'Fake',
+            'is_mix': False,
+            'is_open': False,
+            'concurrency': None,
+            'rate': None,
+            'duration': None,
+            'iterations': None,
+            'args': [],
+        }
+        job.update(kwargs)
+        return job
+
+    def _run(self, workers, job):
+        coordinator = distributed.Coordinator(('127.0.0.1', 0), workers, job, StringIO(), timeout=10)
+        replays = []
+
+        def get_replay(path, job):
+            replays.append(FakeReplay())
+            return replays[-1]
+
+        threads = [Thread(target=distributed.Worker(coordinator.address, get_replay, timeout=10).run)
+            for _ in range(workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        result = coordinator.run()
+
+        for thread in threads:
+            thread.join(10)
+
+        return coordinator, replays, result
+
+    def test_iterations_are_split(self):
+        coordinator, replays, result = self._run(3, self._get_job(iterations=14, concurrency=3))
+
+        self.assertEquals(result.name, FakeReplay.location)
+        self.assertEquals(result.iterations, 14)
+        self.assertEquals(result.histogram.count, 14)
+        self.assertListEqual(sorted(len(replay.iterations) for replay in replays), [4, 5, 5])
+
+        # Each worker numbers its iterations from zero, so only the two running five of them reach a failing one
+        self.assertEquals(result.error_count, 2)
+        self.assertEquals(coordinator.stream.getvalue().count('connected'), 3)
+
+    def test_concurrency_below_workers(self):
+        with self.assertRaises(ValueError) as ctx:
+            distributed.Coordinator(('127.0.0.1', 0), 3, self._get_job(concurrency=2), StringIO())
+        self.assertEquals(ctx.exception.args[0], 'Concurrency (2) may not be lower than the number of workers (3)')
+
+        # Each worker runs exactly one concurrent iteration
+        coordinator = distributed.Coordinator(('127.0.0.1', 0), 3, self._get_job(concurrency=3), StringIO())
+        self.assertListEqual([job['concurrency'] for job in coordinator.get_jobs()], [1, 1, 1])
+        coordinator.server.close()
+
+    def test_rate_is_split(self):
+        _, _, result = self._run(2, self._get_job(is_open=True, rate=100, duration=0.3))
+
+        # Each worker runs at 50/s for 0.3s
+        self.assertEquals(result.iterations, 30)
+        self.assertEquals(result.lag.count, 30)
+
+    def test_worker_error(self):
+        coordinator = distributed.Coordinator(('127.0.0.1', 0), 1, self._get_job(), StringIO(), timeout=10)
+
+        def get_replay(path, job):
+            raise ValueError('No such scenario')
+
+        thread = Thread(target=distributed.Worker(coordinator.address, get_replay, timeout=10).run)
+        thread.daemon = True
+        thread.start()
+
+        with self.assertRaises(ValueError) as ctx:
+            coordinator.run()
+        self.assertIn('No such scenario', ctx.exception.args[0])
+
+    def test_workers_do_not_connect(self):
+        coordinator = distributed.Coordinator(('127.0.0.1', 0), 1, self._get_job(), StringIO(), timeout=0.1)
+        self.assertRaises(ValueError, coordinator.run)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import mmap, os
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+# lxml
+from lxml import etree
+
+# mock
+from mock import patch
+
+# Zato
+from zato.apitest import fixtures
+
+class FixtureCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.cache = fixtures.FixtureCache(max_size=100, mmap_min_size=50)
+
+    def tearDown(self):
+        self.cache.clear()
+        rmtree(self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_get(self):
+        path = self.write('a.txt', b'abc')
+
+        with patch('zato.apitest.fixtures.open', create=True, wraps=open) as _open:
+            self.assertEquals(self.cache.get(path), b'abc')
+            self.assertEquals(self.cache.get(path), b'abc')
+            self.assertEquals(_open.call_count, 1)
+
+            # Files are read again once they change
+            self.write('a.txt', b'abcd')
+            self.assertEquals(self.cache.get(path), b'abcd')
+            self.assertEquals(_open.call_count, 2)
+
+    def test_get_mmap(self):
+        data = b'a' * 60
+        path = self.write('a.txt', data)
+
+        # The mapping itself is returned, not a copy of it.
+        mapped = self.cache.get(path)
+        self.assertIsInstance(mapped, mmap.mmap)
+        self.assertIs(self.cache.get(path), mapped)
+        self.assertEquals(mapped[:], data)
+
+        # Mapped files count towards the limit of mappings rather than that of bytes.
+        self.assertEquals(self.cache.size, 0)
+        self.assertEquals(self.cache.maps, 1)
+
+        # Files are not unmapped when dropped, whoever uses them still can.
+        self.cache.clear()
+        self.assertEquals(self.cache.maps, 0)
+        self.assertEquals(mapped[:3], b'aaa')
+
+    def test_get_mmap_is_optional(self):
+        path = self.write('a.txt', b'a' * 60)
+
+        self.assertIsNone(fixtures.FixtureCache().mmap_min_size)
+        self.assertEquals(fixtures.FixtureCache(max_size=100).get(path), b'a' * 60)
+
+    def test_mmap_eviction(self):
+        cache = fixtures.FixtureCache(max_size=100, mmap_min_size=50, max_maps=2)
+        paths = [self.write('{}.txt'.format(idx), b'a' * 60) for idx in range(3)]
+        small = self.write('small.txt', b'a' * 10)
+
+        cache.get(paths[0])
+        cache.get(small)
+        cache.get(paths[1])
+        cache.get(paths[0])
+        cache.get(paths[2])
+
+        # The least recently used mapping is dropped first, files read into memory are kept.
+        self.assertEquals(list(cache.entries), [small, paths[0], paths[2]])
+        self.assertEquals(cache.maps, 2)
+
+    def test_parse_mmap(self):
+        cache = fixtures.FixtureCache(max_size=1000, mmap_min_size=50)
+        path = self.write('a.json', b'{"a": "' + b'b' * 60 + b'"}')
+        mapped = cache.get(path)
+
+        # Mappings are parsed once too, keyed by their identity rather than contents.
+        with patch('zato.apitest.fixtures.jsonbackend.loads', wraps=fixtures.jsonbackend.loads) as loads:
+            self.assertEquals(cache.parse(mapped, 'JSON'), {'a': 'b' * 60})
+            self.assertEquals(cache.parse(cache.get(path), 'JSON'), {'a': 'b' * 60})
+            self.assertEquals(loads.call_count, 1)
+
+        self.assertEquals(str(fixtures.get_view(mapped)), mapped[:])
+        self.assertEquals(fixtures.get_view(b'abc'), b'abc')
+
+    def test_eviction(self):
+        paths = [self.write('{}.txt'.format(idx), b'a' * 40) for idx in range(3)]
+
+        self.cache.get(paths[0])
+        self.cache.get(paths[1])
+        self.cache.get(paths[0])
+        self.cache.get(paths[2])
+
+        # The least recently used file is dropped first
+        self.assertEquals(list(self.cache.entries), [paths[0], paths[2]])
+        self.assertEquals(self.cache.size, 80)
+
+    def test_parse_json(self):
+        data = '{"a": [1, {"b": "c"}]}'
+
+        with patch('zato.apitest.fixtures.jsonbackend.loads', wraps=fixtures.jsonbackend.loads) as loads:
+            first = self.cache.parse(data, 'JSON')
+            second = self.cache.parse(data, 'JSON')
+            self.assertEquals(loads.call_count, 1)
+
+        self.assertEquals(first, {'a': [1, {'b': 'c'}]})
+        self.assertEquals(first, second)
+
+        # Each caller is given a copy of its own
+        first['a'][1]['b'] = 'd'
+        self.assertEquals(second, {'a': [1, {'b': 'c'}]})
+        self.assertEquals(self.cache.parse(data, 'JSON'), {'a': [1, {'b': 'c'}]})
+
+    def test_parse_xml(self):
+        data = b'<a><b>c</b></a>'
+
+        first = self.cache.parse(data, 'XML')
+        first.find('b').text = 'd'
+
+        second = self.cache.parse(data, 'XML')
+        self.assertIsNot(first, second)
+        self.assertEquals(etree.tostring(second), data)
+
+    def test_parse_invalid(self):
+        self.assertRaises(ValueError, self.cache.parse, '{"a": ', 'JSON')
+        self.assertRaises(etree.XMLSyntaxError, self.cache.parse, b'<a>', 'XML')
+        self.assertEquals(len(self.cache.entries), 0)
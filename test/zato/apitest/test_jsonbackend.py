@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import json, math, os
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import skipIf, TestCase
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.apitest import jsonbackend, util
+from zato.apitest.steps import common
+
+DOC = {'a': [1, 2.5, 0.30000000000000004, None, True], 'b': {'c': 'ü', 'd': '/'}, 'e': 12345678901234567890123}
+
+class LoadsTestCase(TestCase):
+
+    def test_loads(self):
+        data = json.dumps(DOC)
+
+        self.assertEquals(jsonbackend.loads(data), DOC)
+        self.assertEquals(jsonbackend.loads(data.encode('utf-8')), DOC)
+        self.assertTrue(math.isnan(jsonbackend.loads('[NaN]')[0]))
+        self.assertRaises(ValueError, jsonbackend.loads, '{"a": ')
+
+    @skipIf(not jsonbackend.ujson, 'ujson is not installed')
+    def test_ujson_loads(self):
+        # Floats are parsed precisely and whatever ujson cannot parse is parsed with json
+        self.assertEquals(jsonbackend._ujson_loads(json.dumps(DOC)), DOC)
+        self.assertEquals(jsonbackend._ujson_loads('[1e400]'), [float('inf')])
+
+    def test_dumps(self):
+        self.assertEquals(jsonbackend.dumps([0.30000000000000004, {'b': 1}], **jsonbackend.SERIALIZATION['compact']),
+            '[0.30000000000000004,{"b":1}]')
+
+class SerializationTestCase(TestCase):
+
+    def setUp(self):
+        self.environment_dir = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.environment_dir)
+
+    def test_get_serialization(self):
+        self.assertEquals(jsonbackend.get_serialization(None), jsonbackend.SERIALIZATION['compact'])
+        self.assertEquals(jsonbackend.get_serialization({'serialization': 'sorted'}), jsonbackend.SERIALIZATION['sorted'])
+        self.assertRaises(ValueError, jsonbackend.get_serialization, {'serialization': 'abc'})
+
+    def test_build_request(self):
+        ctx = Bunch(zato=util.new_context(None, self.environment_dir, {}))
+        common.given_format(ctx, 'JSON')
+        common.given_request_is(ctx, '{"b": [1, 2], "a": "c"}')
+
+        self.assertEquals(common.build_request(ctx).data, json.dumps({'b': [1, 2], 'a': 'c'}, separators=(',', ':')))
+
+        with open(os.path.join(self.environment_dir, 'config.ini'), 'w') as f:
+            f.write('[json]\nserialization=pretty\n')
+
+        self.assertEquals(common.build_request(ctx).data, '{\n  "a": "c",\n  "b": [\n    1,\n    2\n  ]\n}')
+
+class BenchmarkTestCase(TestCase):
+
+    def test_benchmark(self):
+        row, = jsonbackend.benchmark([2048], 1)
+
+        self.assertEquals(row['size'], 2048)
+        self.assertLess(row['compact bytes'], row['indent=2 bytes'])
+        self.assertEquals(row['compact bytes'], row['sorted bytes'])
+        self.assertIn('{}.loads'.format(jsonbackend.BACKEND), row)
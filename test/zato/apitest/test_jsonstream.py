@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from io import BytesIO
+from json import dumps
+from unittest import TestCase
+
+# jsonpointer
+from jsonpointer import JsonPointerException
+
+# Zato
+from zato.apitest import jsonstream
+
+DOC = {
+    'a': {'b': [1, 2.5, {'c': None, 'd/e': True}], 'f~g': 'h'},
+    'i': [[], {}],
+    'j': 'k',
+}
+
+class ExtractTestCase(TestCase):
+
+    def extract(self, *pointers):
+        return jsonstream.extract(BytesIO(dumps(DOC).encode('utf-8')), pointers)
+
+    def test_extract(self):
+        found = self.extract('/a/b/1', '/a/b/2', '/a/b/2/d~1e', '/a/f~0g', '/i', '/j', '/a/b/3', '/x', '/j/0')
+
+        self.assertEquals(found, {
+            '/a/b/1': 2.5,
+            '/a/b/2': {'c': None, 'd/e': True},
+            '/a/b/2/d~1e': True,
+            '/a/f~0g': 'h',
+            '/i': [[], {}],
+            '/j': 'k',
+        })
+
+        # The same types as ones from json.loads
+        self.assertIsInstance(found['/a/b/1'], float)
+
+    def test_extract_root(self):
+        self.assertEquals(self.extract(''), {'': DOC})
+
+    def test_extract_stops_once_all_found(self):
+        data = dumps([{'a': 1}] + [{'b': 2}] * 10000).encode('utf-8')
+        fp = BytesIO(data)
+
+        self.assertEquals(jsonstream.extract(fp, ['/0/a']), {'/0/a': 1})
+        self.assertLess(fp.tell(), len(data))
+
+    def test_invalid_pointer(self):
+        self.assertRaises(JsonPointerException, self.extract, 'a')
+
+class IterRecordsTestCase(TestCase):
+
+    def test_iter_records(self):
+        lines = BytesIO(b'{"a": 1}\n\n  \n[1, "\xc5\xbc"]\r\nnull\n"b"')
+        self.assertEquals(list(jsonstream.iter_records(lines)), [(1, {'a': 1}), (4, [1, 'ż']), (5, None), (6, 'b')])
+
+    def test_iter_records_invalid(self):
+        records = jsonstream.iter_records([b'{"a": 1}', b'{"a":'])
+        self.assertEquals(next(records), (1, {'a': 1}))
+        self.assertRaises(ValueError, next, records)
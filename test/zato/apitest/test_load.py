@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Lock
+from time import sleep
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# six
+from six.moves import cStringIO as StringIO
+
+# Zato
+from zato.apitest import load
+
+class FakeReplay(object):
+    """ Stands in for a scenario replay, fails every fifth iteration.
+    """
+    location = 'fake.feature:Fake'
+
+    def __init__(self):
+        self.lock = Lock()
+        self.iterations = []
+
+    def run_once(self, iteration=0):
+        with self.lock:
+            self.iterations.append(iteration)
+        return 0.001, (AssertionError('Iteration {}'.format(iteration)) if iteration % 5 == 4 else None)
+
+    def get_entry(self, iteration):
+        return None, 0.0
+
+class LoadResultTestCase(TestCase):
+
+    def test_record(self):
+        result = load.LoadResult('abc')
+        result.record(0.01)
+        result.record(0.02, ValueError('Line 1\nLine 2'))
+        result.record(0.03, ValueError('Line 1\nLine 3'))
+        result.elapsed = 2.0
+
+        self.assertEquals(result.iterations, 3)
+        self.assertEquals(result.error_count, 2)
+        self.assertDictEqual(result.errors, {'ValueError: Line 1': 2})
+        self.assertAlmostEqual(result.error_rate, 2 / 3.0)
+        self.assertEquals(result.throughput, 1.5)
+        self.assertEquals(result.histogram.count, 3)
+
+        out = StringIO()
+        result.report(out)
+        self.assertIn('Iterations: 3, errors: 2 (66.67%)', out.getvalue())
+        self.assertIn('2 x ValueError: Line 1', out.getvalue())
+
+    def test_error_messages_are_bounded(self):
+        result = load.LoadResult()
+        for idx in range(load.MAX_ERROR_MESSAGES + 5):
+            result.record(0.0, ValueError(idx))
+
+        self.assertEquals(len(result.errors), load.MAX_ERROR_MESSAGES + 1)
+        self.assertEquals(result.errors[load.OTHER_ERRORS], 5)
+
+    def test_merge_and_serialize(self):
+        result1 = load.LoadResult('abc')
+        result1.record(0.01, label='x')
+        result1.record(0.02, ValueError('Error 1'), label='y')
+        result1.elapsed = 2.0
+
+        result2 = load.LoadResult('abc')
+        result2.record(0.03, ValueError('Error 1'), lag=0.02, label='x')
+        result2.elapsed = 3.0
+
+        result = load.LoadResult.from_dict(result1.to_dict()).merge(load.LoadResult.from_dict(result2.to_dict()))
+
+        self.assertEquals(result.name, 'abc')
+        self.assertEquals(result.iterations, 3)
+        self.assertEquals(result.late, 1)
+        self.assertEquals(result.elapsed, 3.0)
+        self.assertDictEqual(result.errors, {'ValueError: Error 1': 2})
+        self.assertEquals(result.histogram.count, 3)
+        self.assertEquals(result.lag.count, 1)
+        self.assertListEqual(list(result.children), ['x', 'y'])
+        self.assertEquals(result.children['x'].iterations, 2)
+
+class ClosedLoadTestCase(TestCase):
+
+    def test_iterations(self):
+        replay = FakeReplay()
+        result = load.ClosedLoad(replay, concurrency=4, iterations=50).run()
+
+        self.assertEquals(result.name, replay.location)
+        self.assertEquals(result.iterations, 50)
+        self.assertEquals(result.error_count, 10)
+        self.assertListEqual(sorted(replay.iterations), list(range(50)))
+
+    def test_rate(self):
+        replay = FakeReplay()
+        result = load.ClosedLoad(replay, concurrency=2, rate=100, iterations=20).run()
+
+        # 20 iterations at 100/s cannot take less than the time the last one is scheduled at.
+        self.assertEquals(result.iterations, 20)
+        self.assertGreaterEqual(result.elapsed, 0.19)
+
+    def test_duration(self):
+        replay = FakeReplay()
+        result = load.ClosedLoad(replay, concurrency=1, rate=100, duration=0.1).run()
+
+        self.assertTrue(8 <= result.iterations <= 11, result.iterations)
+
+class SlowReplay(FakeReplay):
+    """ Takes longer than the interval between arrivals.
+    """
+    def run_once(self, iteration=0):
+        sleep(0.02)
+        return 0.02, None
+
+class OpenLoadTestCase(TestCase):
+
+    def test_iterations(self):
+        replay = FakeReplay()
+        result = load.OpenLoad(replay, rate=200, concurrency=4, iterations=40).run()
+
+        self.assertEquals(result.iterations, 40)
+        self.assertEquals(result.error_count, 8)
+        self.assertEquals(result.lag.count, 40)
+        self.assertEquals(result.service.count, 40)
+        self.assertListEqual(sorted(replay.iterations), list(range(40)))
+        self.assertGreaterEqual(result.elapsed, 0.19)
+
+    def test_latency_includes_start_lag(self):
+
+        # A single worker cannot keep up with 200/s if each iteration takes 20 ms.
+        result = load.OpenLoad(SlowReplay(), rate=200, concurrency=1, iterations=10).run()
+
+        self.assertEquals(result.iterations, 10)
+        self.assertGreater(result.late, 0)
+        self.assertGreater(result.histogram.max, result.service.max)
+        self.assertGreater(result.lag.max / 1000000.0, load.LATE_THRESHOLD)
+
+        out = StringIO()
+        result.report(out)
+        self.assertIn('could not keep up', out.getvalue())
+
+    def test_get_load_rate(self):
+        replay = FakeReplay()
+
+        for rate in (0, 0.0, -1, -0.5):
+            self.assertRaises(ValueError, load.get_load, replay, rate=rate, iterations=1, is_open=True)
+            self.assertRaises(ValueError, load.get_load, replay, rate=rate, iterations=1)
+
+        self.assertRaises(ValueError, load.get_load, replay, iterations=1, is_open=True)
+        self.assertIsInstance(load.get_load(replay, rate=0.5, iterations=1, is_open=True)[0], load.OpenLoad)
+        self.assertIsInstance(load.get_load(replay, iterations=1)[0], load.ClosedLoad)
+
+class WorkloadMixTestCase(TestCase):
+
+    def test_get_interleaving(self):
+        sequence = load.get_interleaving([70, 25, 5])
+
+        # Reduced by the greatest common divisor
+        self.assertEquals(len(sequence), 20)
+        self.assertEquals(sequence.count(0), 14)
+        self.assertEquals(sequence.count(1), 5)
+        self.assertEquals(sequence.count(2), 1)
+
+        # Spread out rather than run in batches
+        self.assertListEqual(load.get_interleaving([1, 1]), [0, 1])
+        self.assertListEqual(load.get_interleaving([2, 1]), [0, 1, 0])
+
+    def test_run_once(self):
+        first, second = FakeReplay(), FakeReplay()
+        mix = load.WorkloadMix([
+            Bunch(name='first', replay=first, weight=2, think_time=0.5),
+            Bunch(name='second', replay=second, weight=1, think_time=0.0),
+        ])
+
+        for iteration in range(9):
+            mix.run_once(iteration)
+
+        # Each replay sees its own consecutive iterations.
+        self.assertListEqual(first.iterations, list(range(6)))
+        self.assertListEqual(second.iterations, list(range(3)))
+
+        self.assertEquals(mix.get_entry(0), ('first', 0.5))
+        self.assertEquals(mix.get_entry(1), ('second', 0.0))
+
+    def test_results_per_entry(self):
+        mix = load.WorkloadMix([
+            Bunch(name='first', replay=FakeReplay(), weight=3, think_time=0.0),
+            Bunch(name='second', replay=FakeReplay(), weight=1, think_time=0.0),
+        ])
+
+        result = load.ClosedLoad(mix, concurrency=2, iterations=40).run()
+
+        self.assertEquals(result.iterations, 40)
+        self.assertEquals(result.children['first'].iterations, 30)
+        self.assertEquals(result.children['second'].iterations, 10)
+
+    def test_get_workload_mix_errors(self):
+        path = mkdtemp()
+        os.mkdir(os.path.join(path, 'features'))
+
+        def write_config(data):
+            with open(os.path.join(path, 'features', 'config.ini'), 'w') as f:
+                f.write(data)
+
+        try:
+            write_config('[user]\n')
+            self.assertRaises(ValueError, load.get_workload_mix, path)
+
+            write_config('[load]\n[[a]]\nweight=1\n')
+            self.assertRaises(ValueError, load.get_workload_mix, path)
+
+            write_config('[load]\n[[a]]\ntag=a\nweight=0\n')
+            self.assertRaises(ValueError, load.get_workload_mix, path)
+
+            write_config('[load]\n[[a]]\ntag=a\nweight=abc\n')
+            self.assertRaises(ValueError, load.get_workload_mix, path)
+
+        finally:
+            rmtree(path)
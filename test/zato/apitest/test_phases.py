@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# Request
+from requests import Session
+
+# six
+from six.moves import cStringIO as StringIO
+
+# Zato
+from zato.apitest import phases
+from zato.apitest.test import LocalServer
+
+class TimedHTTPAdapterTestCase(TestCase):
+
+    def setUp(self):
+        self.server = LocalServer(b'Hello').start()
+        self.session = Session()
+        self.session.mount('http://', phases.TimedHTTPAdapter())
+
+    def tearDown(self):
+        self.session.close()
+        self.server.stop()
+
+    def test_phases(self):
+        response, timing = phases.timed(self.session.get, self.server.address + '/abc?x=1')
+        self.assertEquals(response.text, 'Hello')
+        self.assertTrue(timing.new_connection)
+
+        timings = timing.get_phases()
+        self.assertGreater(timings.connect, 0)
+        self.assertGreater(timings.ttfb, 0)
+        self.assertAlmostEqual(sum(timings[phase] for phase in phases.PHASES), timings.total, delta=0.01)
+
+        self.assertGreater(timing.bytes_sent, len('GET /abc?x=1 HTTP/1.1\r\n'))
+
+        headers = response.raw._original_response.msg.headers
+        self.assertEquals(timing.bytes_received, len('HTTP/1.1 200 OK\r\n') + sum(len(line) for line in headers) + 2 + 5)
+
+        # The connection is kept alive
+        _, timing = phases.timed(self.session.get, self.server.address + '/abc')
+        self.assertFalse(timing.new_connection)
+        self.assertEquals(timing.get_phases().connect, 0)
+
+class PhaseStatsTestCase(TestCase):
+
+    def _get_timing(self, total, new_connection=False):
+        timing = phases.RequestTiming()
+        timing.start, timing.send_start, timing.sent, timing.headers, timing.end = 0, 0, 0, total / 2, total
+        timing.new_connection = new_connection
+        timing.bytes_sent, timing.bytes_received = 100, 200
+
+        return timing
+
+    def test_record_merge_report(self):
+        stats1 = phases.PhaseStats()
+        stats1.record('GET http://localhost/a', self._get_timing(0.2, True))
+        stats1.record('GET http://localhost/b', self._get_timing(0.1))
+
+        stats2 = phases.PhaseStats()
+        stats2.record('GET http://localhost/a', self._get_timing(0.4))
+
+        stats = phases.merge_stats(stats1.to_dict(), stats2.to_dict())
+        self.assertEquals(stats['GET http://localhost/a']['requests'], 2)
+        self.assertEquals(stats['GET http://localhost/a']['new_connections'], 1)
+        self.assertAlmostEqual(stats['GET http://localhost/a']['ttfb'], 0.3)
+        self.assertEquals(stats['GET http://localhost/a']['bytes_received'], 400)
+
+        out = StringIO()
+        phases.report(stats, out, limit=1)
+        lines = out.getvalue().splitlines()
+
+        self.assertIn('GET http://localhost/a', lines[2])
+        self.assertIn('300.00', lines[2])
+        self.assertEquals(lines[3], '  (1 more endpoints)')
+
+    def test_get_endpoint(self):
+        self.assertEquals(phases.get_endpoint('GET', 'http://localhost:17010/a/b?c=d'), 'GET http://localhost:17010/a/b')
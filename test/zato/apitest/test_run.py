@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# six
+from six.moves import cStringIO as StringIO
+
+# Zato
+from zato.apitest import run
+
+FEATURE = """Feature: A
+
+Scenario: B
+    Given row "b" is run
+
+Scenario Outline: C
+    Given row "<row>" is run
+
+  Examples:
+    | row |
+    | c1  |
+    | c2  |
+    | c3  |
+"""
+
+# Steps of FEATURE, each row run is written to rows.txt next to the feature.
+STEPS = """
+import os
+from behave import given
+
+@given('row "{row}" is run')
+def given_row_is_run(ctx, row):
+    with open(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'rows.txt'), 'a') as f:
+        f.write(row + '\\n')
+"""
+
+class MergeResultsTestCase(TestCase):
+
+    def _get_result(self, passed, failed, duration, failed_scenarios, shard=None, scenarios=None):
+        return {
+            'shard': shard,
+            'failed': bool(failed),
+            'duration': duration,
+            'failed_scenarios': failed_scenarios,
+            'scenarios': scenarios or [],
+            'feature_summary': {'passed': passed, 'failed': failed, 'skipped': 0, 'untested': 0},
+            'scenario_summary': {'passed': passed * 2, 'failed': failed, 'skipped': 0, 'untested': 0},
+            'step_summary': {'passed': passed * 10, 'failed': failed, 'skipped': 1, 'undefined': 0, 'untested': 0},
+        }
+
+    def test_merge_results(self):
+        results = [
+            self._get_result(3, 0, 1.5, []),
+            self._get_result(2, 1, 2.0, [('f3.feature:10', 'S3 b')]),
+        ]
+
+        result = run.merge_results(results)
+
+        self.assertTrue(result['failed'])
+        self.assertEquals(result['feature_summary']['passed'], 5)
+        self.assertEquals(result['feature_summary']['failed'], 1)
+        self.assertEquals(result['scenario_summary']['passed'], 10)
+        self.assertEquals(result['step_summary']['passed'], 50)
+        self.assertEquals(result['step_summary']['skipped'], 2)
+        self.assertEquals(result['duration'], 3.5)
+        self.assertListEqual(result['failed_scenarios'], [('f3.feature:10', 'S3 b')])
+
+    def test_merge_shards_counts_features_once(self):
+        results = [
+            self._get_result(1, 0, 1.0, [], (1, 2), [{'feature': 'a.feature', 'status': 'passed'}]),
+            self._get_result(1, 1, 1.0, [], (2, 2), [
+                {'feature': 'a.feature', 'status': 'failed'}, {'feature': 'b.feature', 'status': 'passed'}]),
+        ]
+
+        result = run.merge_results(results)
+
+        self.assertEquals(result['feature_summary']['passed'], 1)
+        self.assertEquals(result['feature_summary']['failed'], 1)
+        self.assertEquals(len(result['scenarios']), 3)
+
+class ShardTestCase(TestCase):
+
+    def test_parse_shard(self):
+        self.assertEquals(run.parse_shard('3/8'), (3, 8))
+        self.assertRaises(ValueError, run.parse_shard, '0/8')
+        self.assertRaises(ValueError, run.parse_shard, '9/8')
+        self.assertRaises(ValueError, run.parse_shard, 'abc')
+
+    def test_get_shard_key(self):
+        self.assertEquals(run.get_shard_key('/tmp/features', '/tmp/features/a/b.feature', 'My scenario'),
+            'a/b.feature:My scenario')
+
+    def test_in_shard_each_key_in_exactly_one_shard(self):
+        total = 8
+        for idx in range(100):
+            key = 'a/b.feature:Scenario {}'.format(idx)
+            shards = [index for index in range(1, total + 1) if run.in_shard(key, (index, total))]
+            self.assertEquals(len(shards), 1)
+
+            # Stable across calls
+            self.assertTrue(run.in_shard(key, (shards[0], total)))
+
+class GetUnitsTestCase(TestCase):
+
+    def setUp(self):
+        self.features_dir = mkdtemp()
+        self.feature_path = os.path.join(self.features_dir, 'a.feature')
+
+        with open(self.feature_path, 'w') as f:
+            f.write(FEATURE)
+
+    def tearDown(self):
+        rmtree(self.features_dir)
+
+    def test_get_units_outline(self):
+        conf = Bunch(lang=None, exclude=lambda filename: False)
+        unit, = run.get_units(conf, self.features_dir, (1, 1))
+
+        # The feature file is given to behave as a whole, an outline is a single scenario of the shard
+        self.assertListEqual(unit['paths'], [self.feature_path])
+        self.assertListEqual(unit['keys'], ['a.feature:B', 'a.feature:C'])
+
+    def test_run_units_outline_in_shard(self):
+        os.mkdir(os.path.join(self.features_dir, 'steps'))
+        with open(os.path.join(self.features_dir, 'steps', 'steps.py'), 'w') as f:
+            f.write(STEPS)
+
+        # Outline C is in shard 3/3 and scenario B is not
+        shard = (3, 3)
+        units = run.get_units(Bunch(lang=None, exclude=lambda filename: False), self.features_dir, shard)
+
+        result = run.run_units('--format plain', units, self.features_dir, shard, StringIO())
+
+        # Every row of the outline ran in its shard, and nothing else did
+        with open(os.path.join(self.features_dir, 'rows.txt')) as f:
+            self.assertListEqual(f.read().split(), ['c1', 'c2', 'c3'])
+
+        self.assertListEqual([(scenario['key'], scenario['status']) for scenario in result['scenarios']],
+            [('a.feature:C', 'passed')] * 3)
+        self.assertFalse(result['failed'])
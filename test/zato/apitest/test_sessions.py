@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.apitest import sessions
+from zato.apitest.test import LocalServer
+
+class SessionRegistryTestCase(TestCase):
+
+    def setUp(self):
+        self.server = LocalServer().start()
+
+        self.environment_dir = mkdtemp()
+        self.registry = sessions.SessionRegistry()
+
+    def tearDown(self):
+        self.registry.close()
+        self.server.stop()
+        rmtree(self.environment_dir)
+
+    def _request(self, url_path='/', reuse=True):
+        request = Bunch(method='GET', url=self.server.address + url_path, data='', files=None, headers={}, auth=None)
+        response, timing = self.registry.request(self.environment_dir, request, reuse=reuse)
+        self.assertEquals(response.text, 'OK')
+
+        return timing
+
+    def test_connections_are_reused(self):
+        for url_path in ('/a', '/b', '/c'):
+            self._request(url_path)
+
+        self.assertDictEqual(self.registry.get_stats(), {'opened': 1, 'reused': 2})
+        self.assertEquals(len(self.registry.sessions), 1)
+
+    def test_no_reuse(self):
+        self._request()
+        self._request(reuse=False)
+        self._request(reuse=False)
+        self._request()
+
+        self.assertDictEqual(self.registry.get_stats(), {'opened': 3, 'reused': 1})
+
+    def test_keep_alive_off_in_config(self):
+        with open(os.path.join(self.environment_dir, 'config.ini'), 'w') as f:
+            f.write('[http]\nkeep_alive=False\npool_size=2\n')
+
+        self._request()
+        self._request()
+
+        self.assertDictEqual(self.registry.get_stats(), {'opened': 2, 'reused': 0})
+        self.assertEquals(self.registry.get_config(self.environment_dir).pool_size, 2)
+
+    def test_cookies_are_not_kept(self):
+        self.server.headers[b'Set-Cookie'] = b'session=abc; Path=/'
+
+        self._request()
+        self._request()
+        self._request(reuse=False)
+
+        # Each response has its own cookies but none of them is ever sent back.
+        self.assertEquals([headers.get('Cookie') for headers in self.server.request_headers], [None, None, None])
+        self.assertEquals(len(self.registry.sessions), 1)
+        self.assertEquals(len(list(self.registry.sessions.values())[0].cookies), 0)
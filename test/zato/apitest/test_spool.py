@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.apitest.spool import close, new_spool, open_map, write
+
+class SpoolTestCase(TestCase):
+
+    def test_write(self):
+        chunks = []
+
+        def iter_content(chunk_size):
+            chunks.append(chunk_size)
+            return iter([b'abc', b'def', b'g'])
+
+        spool = new_spool()
+        self.assertEquals(write(Bunch(iter_content=iter_content), spool, 3), 7)
+        self.assertEquals(chunks, [3])
+
+        spool.seek(0)
+        self.assertEquals(spool.read(), b'abcdefg')
+
+    def test_close(self):
+        spools = [new_spool() for _ in range(3)]
+
+        close(Bunch(spool=None))
+        close(Bunch(spool=spools[0]))
+        self.assertTrue(spools[0].closed)
+
+        # Responses of a repeated invocation are closed along with the one standing for all of them.
+        close(Bunch(spool=spools[2], responses=[Bunch(spool=spools[1]), Bunch(spool=spools[2])]))
+        self.assertTrue(spools[1].closed)
+        self.assertTrue(spools[2].closed)
+
+    def test_open_map(self):
+        spool = new_spool()
+        spool.write(b'abcdefg')
+
+        with open_map(spool) as body:
+            self.assertEquals(len(body), 7)
+            self.assertEquals(body[2:4], b'cd')
+            self.assertEquals(body[-1:], b'g')
+
+    def test_open_map_empty(self):
+        with open_map(new_spool()) as body:
+            self.assertEquals(body, b'')
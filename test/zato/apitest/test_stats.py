@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# Zato
+from zato.apitest.stats import Histogram
+
+class HistogramTestCase(TestCase):
+
+    def _get_histogram(self, values):
+        histogram = Histogram()
+        for value in values:
+            histogram.record(value)
+        return histogram
+
+    def test_empty(self):
+        histogram = Histogram()
+        self.assertEquals(histogram.count, 0)
+        self.assertEquals(histogram.percentile(99), 0.0)
+        self.assertEquals(histogram.mean, 0.0)
+        self.assertEquals(histogram.summary(), 'no data')
+
+    def test_percentiles(self):
+        # 1 ms to 1000 ms
+        histogram = self._get_histogram(idx / 1000.0 for idx in range(1, 1001))
+
+        self.assertEquals(histogram.count, 1000)
+        self.assertEquals(histogram.min, 1000)
+        self.assertEquals(histogram.max, 1000000)
+
+        for percentile, expected in ((50, 0.5), (90, 0.9), (99, 0.99), (100, 1.0)):
+            self.assertAlmostEqual(histogram.percentile(percentile), expected, delta=expected / 100)
+
+        self.assertAlmostEqual(histogram.mean, 0.5005, places=6)
+
+    def test_small_values_are_exact(self):
+        histogram = self._get_histogram([0.000001, 0.000002, 0.000100])
+        self.assertEquals(histogram.percentile(50), 0.000002)
+        self.assertEquals(histogram.percentile(100), 0.0001)
+
+    def test_merge(self):
+        first = self._get_histogram([0.001, 0.002])
+        second = self._get_histogram([0.5, 0.003])
+
+        merged = Histogram().merge(first).merge(second)
+
+        self.assertEquals(merged.count, 4)
+        self.assertEquals(merged.min, 1000)
+        self.assertEquals(merged.max, 500000)
+        self.assertEquals(merged.percentile(100), 0.5)
+
+    def test_to_dict_from_dict(self):
+        histogram = self._get_histogram([0.001, 0.2, 0.35])
+        restored = Histogram.from_dict(histogram.to_dict())
+
+        self.assertDictEqual(restored.counts, histogram.counts)
+        self.assertEquals(restored.count, histogram.count)
+        self.assertEquals(restored.total, histogram.total)
+        self.assertEquals(restored.min, histogram.min)
+        self.assertEquals(restored.max, histogram.max)
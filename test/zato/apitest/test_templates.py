@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import json
+from copy import deepcopy
+from unittest import TestCase
+
+# jsonpointer
+from jsonpointer import set_pointer
+
+# lxml
+from lxml import etree
+
+# mock
+from mock import patch
+
+# Zato
+from zato.apitest import templates
+
+DOC = {
+    'a': {'b': 'c', 'd': [1, 2, {'e': 'f'}]},
+    'g~h/i': None,
+    'j': [],
+}
+
+NS = {'soap': 'urn:soap'}
+
+XML = b'<soap:Envelope xmlns:soap="urn:soap"><soap:Body><r><a>1</a><b/><c>2<d/>3</c><a>4</a></r></soap:Body></soap:Envelope>'
+
+class CompileJSONTestCase(TestCase):
+
+    def check(self, pointers, values, **dumps_kwargs):
+        template = templates.compile_json(deepcopy(DOC), pointers, **dumps_kwargs)
+
+        # Values spliced in are serialized exactly as if the whole document was
+        expected = deepcopy(DOC)
+        for pointer, value in values.items():
+            set_pointer(expected, pointer, value)
+
+        self.assertEquals(template.render(values), json.dumps(expected, **dumps_kwargs))
+        self.assertEquals(template.paths, set(pointers))
+
+    def test_compile_json(self):
+        pointers = ['/a/b', '/a/d/1', '/a/d/2/e', '/g~0h~1i', '/j']
+
+        for dumps_kwargs in ({'indent': 2}, {}, {'indent': 4, 'sort_keys': True}):
+            self.check(pointers, {}, **dumps_kwargs)
+            self.check(pointers, {'/a/b': 'x"y', '/g~0h~1i': 12.5}, **dumps_kwargs)
+            self.check(pointers, {
+                '/a/b': {'k': [1, {'l': 'm'}], 'n': {}},
+                '/a/d/1': [True, False],
+                '/a/d/2/e': None,
+                '/g~0h~1i': 'ü',
+                '/j': [[1], {'o': []}]},
+                **dumps_kwargs)
+
+    def test_compile_json_unsupported(self):
+        for pointers in (['/a', '/a/b'], ['/x'], ['/a/x'], ['/a/d/3'], ['/a/d/-'], ['/a/b/c'], ['/a/d/x']):
+            self.assertIsNone(templates.compile_json(deepcopy(DOC), pointers), pointers)
+
+class CompileXMLTestCase(TestCase):
+
+    def test_compile_xml(self):
+        paths = ['/soap:Envelope/soap:Body/r/a[2]', '//b', '/soap:Envelope/soap:Body/r/c']
+        template = templates.compile_xml(etree.fromstring(XML), paths, NS)
+
+        self.assertEquals(template.render({}),
+            b'<soap:Envelope xmlns:soap="urn:soap"><soap:Body><r><a>1</a><b></b><c>2<d/>3</c><a>4</a></r></soap:Body>'
+            b'</soap:Envelope>')
+
+        values = {'/soap:Envelope/soap:Body/r/a[2]': '<&>\r"', '//b': 'ü', '/soap:Envelope/soap:Body/r/c': 'x'}
+        expected = etree.fromstring(XML)
+
+        for path, value in values.items():
+            expected.xpath(path, namespaces=NS)[0].text = value
+
+        # Text spliced in is serialized exactly as if the whole document was
+        self.assertEquals(template.render(values), etree.tostring(expected))
+        self.assertEquals(template.namespaces, NS)
+
+    def test_compile_xml_unsupported(self):
+        for paths in (['//a'], ['//x'], ['//d/text()'], ['//a[. = "1"]'], ['//b', '/soap:Envelope/soap:Body/r/b'], ['/x:r']):
+            self.assertIsNone(templates.compile_xml(etree.fromstring(XML), paths, NS), paths)
+
+    def test_text_hole(self):
+        values = {}
+        hole = templates.TextHole(values, '//b')
+        hole.text = 'abc'
+
+        self.assertEquals(values, {'//b': 'abc'})
+        self.assertEquals(hole.text, 'abc')
+
+        with self.assertRaises(ValueError):
+            hole.text = 'a\x00b'
+
+    def test_text_hole_as_lxml(self):
+        elem = etree.Element('b')
+        hole = templates.TextHole({}, '//b')
+
+        # Templates accept and reject the same values lxml does
+        for value in ('ż', b'abc', 'żółć'.encode('utf-8'), b'\xff', 'a\x00b', b'a\x01b'):
+            try:
+                elem.text = value
+            except ValueError:
+                self.assertRaises(ValueError, setattr, hole, 'text', value)
+                self.assertRaises(ValueError, templates.serialize_xml_text, value)
+            else:
+                hole.text = value
+                self.assertEquals(templates.serialize_xml_text(value), etree.tostring(elem)[3:-4])
+
+class GetTemplateTestCase(TestCase):
+
+    def test_get_template(self):
+        data = json.dumps(DOC)
+
+        with patch('zato.apitest.templates.compile_json', wraps=templates.compile_json) as compile_json:
+            template = templates.get_template('JSON', data, ['/a/b', '/j'], indent=2)
+            self.assertIs(templates.get_template('JSON', data, ['/j', '/a/b', '/j'], indent=2), template)
+            self.assertEquals(compile_json.call_count, 1)
+
+            # Not the same template when serialized differently
+            self.assertIsNot(templates.get_template('JSON', data, ['/a/b', '/j']), template)
+
+        self.assertIsNone(templates.get_template('JSON', data, ['/x']))
+        self.assertIsNotNone(templates.get_template('XML', XML, ['//b'], NS))
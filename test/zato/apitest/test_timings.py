@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+# Zato
+from zato.apitest.timings import KIND, schedule, TimingHistory
+
+class ScheduleTestCase(TestCase):
+
+    def test_schedule_no_estimates_is_round_robin(self):
+        units = ['a', 'b', 'c', 'd', 'e']
+        self.assertListEqual(schedule(units, 2, lambda unit: 0.0), [['a', 'c', 'e'], ['b', 'd']])
+
+    def test_schedule_more_workers_than_units(self):
+        self.assertListEqual(schedule(['a', 'b'], 4, lambda unit: 0.0), [['a'], ['b']])
+
+    def test_schedule_longest_first(self):
+        estimates = {'a': 1.0, 'b': 10.0, 'c': 2.0, 'd': 3.0, 'e': 4.0}
+        groups = schedule(sorted(estimates), 2, estimates.get)
+
+        # The slowest unit is started first and everything else is balanced against it.
+        self.assertListEqual(groups, [['b'], ['e', 'd', 'c', 'a']])
+
+class TimingHistoryTestCase(TestCase):
+
+    def setUp(self):
+        self.features_dir = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.features_dir)
+
+    def _scenario(self, feature, name, duration, status='passed'):
+        return {'feature': feature, 'key': '{}:{}'.format(feature, name), 'duration': duration, 'status': status}
+
+    def test_update_and_load(self):
+        history = TimingHistory(self.features_dir).load()
+        history.update([
+            self._scenario('a.feature', 'S1', 1.0),
+            self._scenario('a.feature', 'S2', 2.0),
+            self._scenario('b.feature', 'S1', 0.0, 'skipped'),
+        ])
+
+        history = TimingHistory(self.features_dir).load()
+        self.assertDictEqual(history.durations[KIND.SCENARIO], {'a.feature:S1': 1.0, 'a.feature:S2': 2.0})
+        self.assertDictEqual(history.durations[KIND.FEATURE], {'a.feature': 3.0})
+
+        # Durations are smoothed across runs.
+        history.update([self._scenario('a.feature', 'S1', 3.0)], False)
+        history = TimingHistory(self.features_dir).load()
+        self.assertEquals(history.durations[KIND.SCENARIO]['a.feature:S1'], 2.0)
+        self.assertEquals(history.runs[KIND.SCENARIO]['a.feature:S1'], 2)
+        self.assertDictEqual(history.durations[KIND.FEATURE], {'a.feature': 3.0})
+
+    def test_update_outline_rows(self):
+        history = TimingHistory(self.features_dir).load()
+        history.update([self._scenario('a.feature', 'S1', 4.0)], False)
+
+        # Rows of an outline share its key, they are summed up and smoothed once.
+        history.update([self._scenario('a.feature', 'S1', 1.0), self._scenario('a.feature', 'S1', 1.0)], False)
+        history = TimingHistory(self.features_dir).load()
+        self.assertEquals(history.durations[KIND.SCENARIO]['a.feature:S1'], 3.0)
+        self.assertEquals(history.runs[KIND.SCENARIO]['a.feature:S1'], 2)
+
+    def test_estimate(self):
+        history = TimingHistory(self.features_dir)
+        history.durations[KIND.FEATURE] = {'a.feature': 4.0, 'b.feature': 2.0}
+        history.durations[KIND.SCENARIO] = {'a.feature:S1': 1.0, 'a.feature:S2': 3.0}
+
+        self.assertEquals(history.estimate({'feature': 'a.feature', 'keys': []}), 4.0)
+        self.assertEquals(history.estimate({'feature': 'c.feature', 'keys': []}), 3.0)
+        self.assertEquals(history.estimate({'feature': 'a.feature', 'keys': ['a.feature:S2', 'a.feature:S3']}), 5.0)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os, subprocess, sys
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import SkipTest, TestCase
+
+# Zato
+from zato.apitest import transport
+
+class TransportTestCase(TestCase):
+
+    def setUp(self):
+        self.path = mkdtemp()
+        os.makedirs(os.path.join(self.path, 'features'))
+
+    def tearDown(self):
+        rmtree(self.path)
+
+    def _write_config(self, data):
+        with open(os.path.join(self.path, 'features', 'config.ini'), 'w') as f:
+            f.write(data)
+
+    def test_get_transport(self):
+        self._write_config('[user]\nsample=Hello\n')
+        self.assertEquals(transport.get_transport(self.path), transport.TRANSPORT.BLOCKING)
+
+        self._write_config('[http]\ntransport=gevent\n')
+        self.assertEquals(transport.get_transport(self.path), transport.TRANSPORT.GEVENT)
+
+        self._write_config('[http]\ntransport=abc\n')
+        self.assertRaises(ValueError, transport.get_transport, self.path)
+
+    def test_select_current_transport(self):
+
+        # Nothing to do, the process is not started anew
+        transport.select_transport(transport.get_current_transport())
+
+    def test_gevent_patches_before_imports(self):
+        try:
+            import gevent # noqa
+        except ImportError:
+            raise SkipTest('gevent not installed')
+
+        env = dict(os.environ)
+        env[transport.TRANSPORT_ENV] = transport.TRANSPORT.GEVENT
+
+        out = subprocess.check_output([sys.executable, '-c',
+            'from zato.apitest import load; from gevent import monkey; print(monkey.is_module_patched("socket"))'], env=env)
+
+        self.assertEquals(out.strip(), b'True')
+
+    def _run(self, env=None):
+        return subprocess.Popen([sys.executable, '-m', 'zato.apitest.cli', 'run', self.path],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+
+    def test_run_unknown_transport(self):
+        self._write_config('[user]\nsample=Hello\n[http]\ntransport=abc\n')
+
+        process = self._run()
+        out = process.communicate()[0]
+
+        self.assertEquals(process.returncode, 1)
+        self.assertIn(b'Error: Unknown HTTP transport `abc`', out)
+
+    def test_run_selects_transport(self):
+        try:
+            import gevent # noqa
+        except ImportError:
+            raise SkipTest('gevent not installed')
+
+        features_dir = os.path.join(self.path, 'features')
+        os.makedirs(os.path.join(features_dir, 'steps'))
+
+        self._write_config('[behave]\noptions=--format plain\n[user]\nsample=Hello\n[http]\ntransport=gevent\n')
+
+        with open(os.path.join(features_dir, 'a.feature'), 'w') as f:
+            f.write('Feature: A\n\nScenario: B\n    Given transport is stored\n')
+
+        with open(os.path.join(features_dir, 'steps', 'steps.py'), 'w') as f:
+            f.write(
+                'import os\n'
+                'from behave import given\n'
+                '@given("transport is stored")\n'
+                'def step_impl(ctx):\n'
+                '    from gevent import monkey\n'
+                '    with open(os.path.join({!r}, "transport.txt"), "w") as f:\n'
+                '        f.write("{{}} {{}}".format(os.environ["APITEST_TRANSPORT"], monkey.is_module_patched("socket")))\n'
+                .format(self.path))
+
+        env = dict(os.environ)
+        env.pop(transport.TRANSPORT_ENV, None)
+
+        process = self._run(env)
+        out = process.communicate()[0]
+        self.assertEquals(process.returncode, 0, out)
+
+        with open(os.path.join(self.path, 'transport.txt')) as f:
+            self.assertEquals(f.read(), 'gevent True')
@@ -12,14 +12,26 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # stdlib
+import os
+from multiprocessing import Pool
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Thread
 from unittest import TestCase
 
 # Bunch
 from bunch import Bunch
 
+# jsonpointer
+from jsonpointer import JsonPointerException
+
+# mock
+from mock import patch
+
 # Zato
-from zato.apitest import version
-from zato.apitest.util import context, new_context, rand_string
+from zato.apitest import PathNotFound, util, version
+from zato.apitest.util import context, eventually, get_config, get_context, get_retry_config, get_user_config, new_context, \
+    obtain_value, obtain_values, rand_string, RETRY_INITIAL_DELAY
 
 class UtilTest(TestCase):
 
@@ -49,3 +61,200 @@ class UtilTest(TestCase):
             environment_dir = rand_string()
             ctx = new_context(None, environment_dir, {})
             self._test_new_context(ctx, environment_dir)
+
+    def test_new_context_in_thread(self):
+        main_ctx = new_context(None, rand_string(), {})
+        thread_ctxs = []
+
+        def run():
+            thread_ctxs.append((new_context(None, rand_string(), {}), get_context()))
+
+        thread = Thread(target=run)
+        thread.start()
+        thread.join()
+
+        thread_ctx, thread_current = thread_ctxs[0]
+
+        # Each thread has its own context, the main thread's one is left intact.
+        self.assertIs(thread_ctx, thread_current)
+        self.assertIsNot(thread_ctx, context)
+        self.assertIs(main_ctx, context)
+        self.assertNotEquals(thread_ctx.environment_dir, context.environment_dir)
+
+def get_user_config_unparsed(environment_dir):
+    """ Runs in a worker process, which is not allowed to parse config.ini itself.
+    """
+    with patch('zato.apitest.util.ConfigObj', side_effect=AssertionError('config.ini parsed in worker')):
+        return dict(get_user_config(environment_dir))
+
+class ConfigTest(TestCase):
+
+    def setUp(self):
+        self.environment_dir = mkdtemp()
+        self.write('[user]\nname=abc\n')
+
+    def tearDown(self):
+        rmtree(self.environment_dir)
+
+    def write(self, data):
+        with open(os.path.join(self.environment_dir, 'config.ini'), 'w') as f:
+            f.write(data)
+
+    def test_get_config_cached(self):
+        with patch('zato.apitest.util.ConfigObj', wraps=util.ConfigObj) as config_obj:
+            self.assertEquals(get_user_config(self.environment_dir), {'name': 'abc'})
+            self.assertIs(get_user_config(self.environment_dir), get_user_config(self.environment_dir))
+            self.assertIs(new_context(None, self.environment_dir).user_config, get_user_config(self.environment_dir))
+            self.assertEquals(get_config(self.environment_dir)['user']['name'], 'abc')
+
+            self.assertEquals(config_obj.call_count, 1)
+
+            # Parsed again once the file changes
+            self.write('[user]\nname=abcd\n')
+
+            self.assertEquals(get_user_config(self.environment_dir).name, 'abcd')
+            self.assertEquals(config_obj.call_count, 2)
+
+    def test_get_config_no_file(self):
+        environment_dir = os.path.join(self.environment_dir, rand_string())
+
+        self.assertEquals(get_config(environment_dir), {})
+        self.assertRaises(KeyError, get_user_config, environment_dir)
+
+    def test_get_config_inherited_by_workers(self):
+        get_config(self.environment_dir)
+
+        pool = Pool(1)
+        try:
+            self.assertEquals(pool.apply(get_user_config_unparsed, (self.environment_dir,)), {'name': 'abc'})
+        finally:
+            pool.close()
+            pool.join()
+
+class ObtainValuesTest(TestCase):
+
+    def setUp(self):
+        self.ctx = Bunch(zato=new_context(None, rand_string(), {'token': 'abc'}))
+        self.ctx.zato.user_ctx['customer_id'] = 123
+        self.ctx.zato.user_ctx['ids'] = [1, 2]
+
+    def test_obtain_value(self):
+        values = (
+            ('/customers', '/customers'),
+            ('', ''),
+            (None, None),
+            ('#customer_id', 123),
+            ('#ids', [1, 2]),
+            ('#{customer_id}', '123'),
+            ('$APITEST_HOST', 'example.com'),
+            ('/customers/#{customer_id}', '/customers/123'),
+            ('https://${APITEST_HOST}/customers/#{customer_id}?t=@{token}&u=@{token}',
+                'https://example.com/customers/123?t=abc&u=abc'),
+            ('#{customer_id}-\\1-#{ids}', '123-\\1-[1, 2]'),
+            ('a#b@{c', 'a#b@{c'),
+        )
+
+        with patch.dict(os.environ, {'APITEST_HOST': 'example.com'}):
+            for value, expected in values:
+                self.assertEquals(obtain_value(self.ctx, value), expected, value)
+
+        self.assertRaises(KeyError, obtain_value, self.ctx, '/customers/#{no_such_key}')
+
+    def test_obtain_value_compiled_once(self):
+        value = '/customers/{}/#{{customer_id}}'.format(rand_string())
+
+        with patch('zato.apitest.util.compile_value', wraps=util.compile_value) as compile_value:
+            self.assertEquals(obtain_value(self.ctx, value), value.replace('#{customer_id}', '123'))
+
+            self.ctx.zato.user_ctx['customer_id'] = 456
+            self.assertEquals(obtain_value(self.ctx, value), value.replace('#{customer_id}', '456'))
+
+        self.assertEquals(compile_value.call_count, 1)
+
+    def test_obtain_values(self):
+
+        @obtain_values
+        def step(ctx, **kwargs):
+            return kwargs
+
+        self.assertEquals(step(self.ctx, a='#customer_id', b='@{token}/#{customer_id}'), {'a': 123, 'b': 'abc/123'})
+
+class RetryTest(TestCase):
+
+    def test_get_retry_config(self):
+        self.assertEquals(get_retry_config(None).initial_delay, RETRY_INITIAL_DELAY)
+
+        environment_dir = mkdtemp()
+        try:
+            with open(os.path.join(environment_dir, 'config.ini'), 'w') as f:
+                f.write('[retry]\ninitial_delay=0.5\nfactor=3\n')
+
+            config = get_retry_config(environment_dir)
+            self.assertEquals(config.initial_delay, 0.5)
+            self.assertEquals(config.factor, 3.0)
+
+            with open(os.path.join(environment_dir, 'config.ini'), 'w') as f:
+                f.write('[retry]\nmax_delay=abc\n')
+
+            self.assertRaises(ValueError, get_retry_config, environment_dir)
+
+        finally:
+            rmtree(environment_dir)
+
+    def test_eventually_backoff(self):
+        delays = []
+        results = [False] * 5 + [True]
+        retries = []
+
+        def func():
+            assert results.pop(0), 'Not yet'
+
+        with patch('zato.apitest.util.sleep', delays.append):
+            elapsed, attempts = eventually(func, 60, 0.1, 0.3, 2, lambda: retries.append(True))
+
+        # Delays grow exponentially up to the maximum one and there is a retry after each of them.
+        self.assertEquals(attempts, 6)
+        self.assertEquals([round(delay, 2) for delay in delays], [0.1, 0.2, 0.3, 0.3, 0.3])
+        self.assertEquals(len(retries), 5)
+        self.assertLess(elapsed, 1)
+
+    def test_eventually_timeout(self):
+
+        def func():
+            assert False, 'Never'
+
+        with self.assertRaises(AssertionError) as cm:
+            eventually(func, 0.2, 0.05, 0.05)
+
+        self.assertIn('did not hold within 0.2s, after 0.2', cm.exception.args[0])
+        self.assertIn(' attempts, last error: Never', cm.exception.args[0])
+
+    def test_eventually_missing_paths(self):
+        errors = [JsonPointerException('a'), PathNotFound('b')]
+
+        def func():
+            if errors:
+                raise errors.pop(0)
+
+        with patch('zato.apitest.util.sleep'):
+            self.assertEquals(eventually(func, 60)[1], 3)
+
+        def func():
+            raise PathNotFound('No `/a` path')
+
+        # The last error is re-raised once the timeout expires.
+        with self.assertRaises(PathNotFound) as cm:
+            eventually(func, 0.2, 0.05, 0.05)
+
+        self.assertEquals(cm.exception.args[0], 'No `/a` path')
+
+    def test_eventually_other_errors(self):
+
+        # Errors other than failed assertions and paths not found, e.g. of config or values that cannot be parsed,
+        # are not retried.
+        for error in (KeyError('abc'), ValueError('abc'), TypeError('abc')):
+
+            def func():
+                raise error
+
+            self.assertRaises(type(error), eventually, func, 60)
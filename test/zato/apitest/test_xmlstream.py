@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2014 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Originally part of Zato - open-source ESB, SOA, REST, APIs and cloud integrations in Python
+# https://zato.io
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from io import BytesIO
+from unittest import TestCase
+
+# lxml
+from lxml import etree
+
+# mock
+from mock import patch
+
+# Zato
+from zato.apitest import xmlstream
+
+NS = {'soap': 'urn:soap', 'x': 'urn:x'}
+
+DOC = b"""<?xml version="1.0"?>
+<!-- Comments and processing instructions are skipped over -->
+<soap:Envelope xmlns:soap="urn:soap" xmlns:x="urn:x">
+  <soap:Body>
+    <x:r>
+      <item><name>a</name><v>1</v></item>
+      <!-- 1 -->
+      <other/>
+      <item><name>b</name><v>2</v><item><name>c</name></item></item>
+      <x:item>d</x:item>
+    </x:r>
+  </soap:Body>
+</soap:Envelope>
+<?pi 2?>
+"""
+
+class ParsePathTestCase(TestCase):
+
+    def test_parse_path(self):
+        self.assertEquals(xmlstream.parse_path('/soap:Envelope/*/item[2]', NS),
+            (False, [('{urn:soap}Envelope', None), ('*', None), ('item', 2)]))
+        self.assertEquals(xmlstream.parse_path('//x:item', NS), (True, [('{urn:x}item', None)]))
+
+    def test_parse_path_unsupported(self):
+        for path in ('', '/', '//', 'a/b', '/a//b', '/a/../b', '/a[@b]', '/a[last()]', '/a/text()', '/a/@b', '/y:a', '/a | /b'):
+            self.assertIsNone(xmlstream.parse_path(path, NS), path)
+
+class ExtractTestCase(TestCase):
+
+    def test_extract(self):
+        paths = [
+            '/soap:Envelope',
+            '/soap:Envelope/soap:Body/x:r/item',
+            '/soap:Envelope/soap:Body/x:r/item[2]/name',
+            '/soap:Envelope/soap:Body/x:r/item[3]',
+            '/*/*/*/*',
+            '/*/*/*/*[2]',
+            '//item/name',
+            '//item[1]',
+            '//*[3]',
+            '//x:item',
+            '/a',
+        ]
+
+        found = xmlstream.extract(BytesIO(DOC), dict((path, xmlstream.parse_path(path, NS)) for path in paths))
+        tree = etree.parse(BytesIO(DOC))
+
+        # The same elements, in the same order, as XPath finds in the whole document
+        for path in paths:
+            expected = tree.xpath(path, namespaces=NS)
+            self.assertEquals([elem.tag for elem in found[path]], [elem.tag for elem in expected], path)
+            self.assertEquals([elem.xpath('string()') for elem in found[path]],
+                [elem.xpath('string()') for elem in expected], path)
+
+    def test_extract_clears_elements(self):
+        roots = []
+        _iterparse = etree.iterparse
+
+        def iterparse(*args, **kwargs):
+            for event, elem in _iterparse(*args, **kwargs):
+                if not roots:
+                    roots.append(elem)
+                yield event, elem
+
+        paths = ['//item[2]/name', '//x:item']
+
+        with patch('zato.apitest.xmlstream.etree.iterparse', iterparse):
+            found = xmlstream.extract(BytesIO(DOC), dict((path, xmlstream.parse_path(path, NS)) for path in paths))
+
+        # Copies of matching elements are kept, whole, while all the parsed elements are cleared and removed.
+        name, = found['//item[2]/name']
+        self.assertEquals(etree.tostring(name), b'<name>b</name>')
+
+        item, = found['//x:item']
+        self.assertEquals(item.text, 'd')
+
+        root, = roots
+        self.assertEquals([elem.tag for elem in root.iter()], ['{urn:soap}Envelope', '{urn:soap}Body'])